@@ -11,19 +11,54 @@ from sklearn.linear_model import LinearRegression
 
 from dotenv import load_dotenv
 import os
+import sys
 import mlflow
-from datetime import timedelta
+from datetime import timedelta, datetime
 import pvlib 
 
 import func_feat_eng as ffe
 
 #--------------COLLECT DATA FUNCTIONS---------------------------------------
 #---Prod
-def data_collection_prod(url='https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/prod/eCO2mix_RTE_Auvergne-Rhone-Alpes_cleaned.csv'):
+PROD_DATASET_URL = "s3://renergies99-lead-bucket/public/prod/eCO2mix_RTE_Auvergne-Rhone-Alpes"
 
-    # read csv
-    df_prod = pd.read_csv(url)
-    data_prod = df_prod.copy()
+# rte_dataset (reader of the partitioned dataset) is shared with the API
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "09_API")
+
+def rte_dataset():
+    if API_DIR not in sys.path:
+        sys.path.append(API_DIR)
+    import rte_dataset
+    return rte_dataset
+
+def prod_dataset_exists(url=PROD_DATASET_URL):
+    return rte_dataset().dataset_exists(url)
+
+def read_prod_dataset(url=PROD_DATASET_URL, columns=None, last_years=None):
+    """
+    Read the year/month partitioned Parquet dataset written by the API,
+    opening only the partitions of the last_years and the requested columns.
+    Same column names as the cleaned csv: "TCH Solaire (%)" -> "tch_solaire_(%)"
+    """
+    dataset = rte_dataset()
+    df = dataset.read_dataset(url, columns=columns, last_years=last_years)
+    df.columns = [dataset.normalize_column(c) for c in df.columns]
+    return df
+
+def data_collection_prod(url='https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/prod/eCO2mix_RTE_Auvergne-Rhone-Alpes_cleaned.csv',
+                         columns=None, last_years=None):
+    """
+    Production data, from the cleaned csv or from the partitioned Parquet dataset (PROD_DATASET_URL).
+    With the dataset, only the columns (besides date and heures) and the last_years requested are read.
+    """
+    if url.endswith(".csv"):
+        # read csv
+        df_prod = pd.read_csv(url)
+        data_prod = df_prod.copy()
+    else:
+        if columns is not None:
+            columns = ["date", "heures"] + list(columns)
+        data_prod = read_prod_dataset(url, columns=columns, last_years=last_years)
 
     # formatting the date for future data merge operations
     data_prod['Time'] = pd.to_datetime(data_prod['date']+" "+data_prod['heures'])
@@ -357,3 +392,23 @@ def log_json_artifact(data, filename):
     with open(filename, "w") as f:
         json.dump(data, f)
     mlflow.log_artifact(filename)
+
+def error_table_arrays(table):
+    """
+    Compact form of the error_stat table: sorted bin edges and the std of each bin.
+    edges has one more value than std: bin i is ]edges[i], edges[i+1]]
+    (looked up by get_std_vector in 09_API/app_func.py)
+    """
+    table = table.sort_values('min')
+    edges = [float(table['min'].iloc[0])] + table['max'].astype(float).tolist()
+    std = table['std'].fillna(0).astype(float).tolist()
+    return {"edges": edges, "std": std}
+
+def log_error_table(x_test, y_test, pipeline, filename="error_table.json"):
+    """
+    Compute the error_stat table on the validation set and log it as an MLflow
+    artifact of the current run, loaded by the API together with the model.
+    """
+    table = error_stat(x_test, y_test, pipeline)
+    log_json_artifact(error_table_arrays(table), filename)
+    return table
@@ -13,7 +13,8 @@ def create_full_dataset(weather_data_path: str,
                         prod_data_path: str,
                         cities_list: list,
                         col_solar: list,
-                        target: str) -> pd.DataFrame:
+                        target: str,
+                        prod_last_years: int = None) -> pd.DataFrame:
     """
     Collects weather, solar, landsat, and production data, merges them into a single dataset
     with features and target.
@@ -25,6 +26,7 @@ def create_full_dataset(weather_data_path: str,
         cities_list: List of cities to keep from the weather data.
         col_solar: List of columns to keep from the solar data (must include 'Time').
         target : Name of the target column in production data.
+        prod_last_years: With the partitioned production dataset, number of years to read (all by default).
     Returns:
         Merged dataframe with features and target (1 row per day).
     """
@@ -43,7 +45,7 @@ def create_full_dataset(weather_data_path: str,
     features_dataset = mf.merge_weather_solar_landsat_data(weather_data, solar_data, landsat_data)
 
     #add target
-    prod_data = mf.data_collection_prod(prod_data_path)
+    prod_data = mf.data_collection_prod(prod_data_path, columns=[target], last_years=prod_last_years)
     full_dataset = mf.add_target(features_dataset, prod_data, target_columns_to_use=['Time', target])
 
     return full_dataset
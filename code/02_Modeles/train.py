@@ -14,6 +14,7 @@ from dotenv import load_dotenv
 import os
 
 import func_cleaning as fc
+import Model_func as mf
 
 load_dotenv()
 
@@ -21,7 +22,9 @@ load_dotenv()
 weather_data_path = 'https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/openweathermap/merge_openweathermap_cleaned.csv'
 solar_data_path = 'https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/solar/raw_solar_data.csv'
 landsat_data_path = 'https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/LandSat/result_EarthExplorer_region_ARA.csv'
-prod_data_path = 'https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/prod/eCO2mix_RTE_Auvergne-Rhone-Alpes_cleaned.csv'
+# year/month partitioned Parquet dataset written by the API, only the target column is read
+prod_data_path = mf.PROD_DATASET_URL
+prod_last_years = None # all the years
 
 target = 'tch_solaire_(%)'
 col_solar = ['Time', 'Ap', '10cm', 'K index Planetary'] # ALWAYS include a 'Time' column (used to merge datasets)
@@ -36,8 +39,12 @@ registered_model_name = "SolarProdModel"
 alias = "challenger"
 
 #---- Data Collection ----
+if not prod_data_path.endswith(".csv") and not mf.prod_dataset_exists(prod_data_path):
+    raise SystemExit(f"No partitioned RTE dataset at {prod_data_path} yet: run /load_rte_data on the API "
+                     "to write it, or set prod_data_path to the cleaned csv")
+
 full_dataset = fc.create_full_dataset(weather_data_path, solar_data_path, landsat_data_path, prod_data_path, 
-                                   cities_list, col_solar, target)
+                                   cities_list, col_solar, target, prod_last_years)
 
 print("Data collected")
 
@@ -137,6 +144,9 @@ with mlflow.start_run(experiment_id=experiment.experiment_id, description=run_de
     mlflow.log_param("model", "LinearRegression")
     mlflow.log_param("test_size", test_size)
 
+    # Log the error table (bin edges / std) used by the API for the error bars
+    mf.log_error_table(x_test, y_test, pipeline)
+
 
     # Log model
     mlflow.sklearn.log_model(
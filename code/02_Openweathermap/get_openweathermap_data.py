@@ -1,7 +1,9 @@
 from datetime import datetime, timedelta
 import json
+import time
 import requests
 import os
+import sys
 import logging
 from dotenv import load_dotenv
 
@@ -13,9 +15,33 @@ headers = {
 }
 
 
+# Format of cities.json, cache keys, migration of the version 1 blob and age of the
+# entries: shared with the API (09_API/geocoding.py), which keeps the same cache in S3
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "09_API"))
+from geocoding import CACHE_VERSION, normalize_city, migrate, is_stale
+
+# Nominatim usage policy: at most 1 request per second
+NOMINATIM_INTERVAL = 1.0
+
+
+def read_city_cache(filename):
+    """
+    Entries of the cache file, and whether it has to be rewritten in the current version
+    """
+    if not os.path.exists(filename):
+        return {}, False
+
+    with open(filename, "r", encoding="utf-8") as f:
+        content = json.load(f)
+
+    return migrate(content), content.get("version") != CACHE_VERSION
+
+
 def get_city_data(cities, filename="./cities.json"):
     """
-    Get the GPS coordinates of a list of cities
+    Get the GPS coordinates of a list of cities.
+    The coordinates are cached per city in filename, only the missing or
+    stale cities are requested from Nominatim.
 
     Parameters
     ----------
@@ -28,46 +54,58 @@ def get_city_data(cities, filename="./cities.json"):
     nominatim_base_url = "https://nominatim.openstreetmap.org/"
     search_city_url2 = "search"
 
-    nominatim_cities_data = []
-    
-    if os.path.exists(filename):
-        logging.info(f"Use of {filename}")
-        with open(filename, "r", encoding="utf-8") as f:
-            data = json.load(f)
+    entries, migrated = read_city_cache(filename)
+    todo = [city for city in cities
+            if normalize_city(city) not in entries or is_stale(entries[normalize_city(city)])]
 
-        return data
+    found = {}
+    session = requests.Session()
+    for i, city in enumerate(todo):
 
-    for city in cities:
-        
         params = {
             "format": "json",
             "limit": 1,
             "q": f"{city},france"
         }
 
+        if i > 0:
+            time.sleep(NOMINATIM_INTERVAL)
+
         try:
             logging.info(f"get data for : {city}")
-            nominatim_cities_data.append(requests.get(f"{nominatim_base_url}{search_city_url2}", params=params, headers=headers).json())
+            response = session.get(f"{nominatim_base_url}{search_city_url2}", params=params, headers=headers, timeout=10)
+            response.raise_for_status()
+            hits = response.json()
+
+            if hits:
+                found[normalize_city(city)] = {"name": hits[0]["name"], "lat": hits[0]["lat"], "lon": hits[0]["lon"],
+                                               "updated_at": datetime.now().strftime("%Y-%m-%d")}
+            else:
+                logging.error(f"No coordinates found for {city}")
 
         except requests.exceptions.RequestException as e:
             logging.error(f"Error fetching data for {city}: {e}")
         except ValueError:
             logging.error(f"Error decoding JSON for {city}")
 
-    res = { city[0]["name"]: {"lat": city[0]["lat"], "lon": city[0]["lon"]} for city in nominatim_cities_data }
+    if found or migrated:
+        # merged with the file as it is now
+        entries = {**read_city_cache(filename)[0], **found}
 
-    try:
-        if len(res) == 0:
-            logging.info(f"No data to write to : {filename}")
-            return {}
+        try:
+            logging.info(f"write data to : {filename}")
 
-        logging.info(f"write data to : {filename}")
+            with open(filename, "w", encoding="utf-8") as f:
+                json.dump({"version": CACHE_VERSION, "cities": dict(sorted(entries.items()))}, f, ensure_ascii=False, indent=4)
 
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(res, f, ensure_ascii=False, indent=4)
+        except IOError as e:
+            logging.error(f"Error writing to target file {filename}: {e}")
 
-    except IOError as e:
-        logging.error(f"Error writing to target file {filename}: {e}")
+    res = {}
+    for city in cities:
+        entry = entries.get(normalize_city(city))
+        if entry is not None:
+            res[entry["name"]] = {"lat": entry["lat"], "lon": entry["lon"]}
 
     return res
 
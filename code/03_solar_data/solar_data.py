@@ -1,7 +1,8 @@
 import pandas as pd
-from utils import daterange, save_tocsv
-from solar_data_func import extract_date, to_boto, session_boto
-from datetime import date, timedelta, datetime
+import json
+import requests
+from solar_data_func import Backfill, to_boto, session_boto
+from datetime import date, datetime
 from dotenv import load_dotenv
 import os
 
@@ -18,37 +19,65 @@ variable = {
         }
 ###Base variables
 base_url = variable[objective]['base_url']
-# dest_url = 
+dest_key = variable[objective]['dest_key']
+# days without file on NOAA, not requested again
+missing_key = dest_key.replace('.csv', '_missing.json')
 start_date = date(2020, 1, 1)
 end_date = datetime.today().date()
 
+# days fetched at the same time, days fetched between two uploads
+workers = int(os.getenv('SOLAR_BACKFILL_WORKERS', '8'))
+checkpoint_days = int(os.getenv('SOLAR_BACKFILL_CHECKPOINT_DAYS', '60'))
+# parse again all the days from the local raw cache (SOLAR_RAW_CACHE_DIR) after a parser change,
+# only the days missing from the cache are downloaded
+reparse = os.getenv('SOLAR_REPARSE', '0') == '1'
+# a reparse starts from no data: its checkpoints go to another key, so that the
+# stored history is only replaced once it is complete
+reparse_key = dest_key.replace('.csv', '_reparse.csv')
+checkpoint_key = reparse_key if reparse else dest_key
 
-stored_data = pd.DataFrame()
-### Update date
-try:
-    stored_data = pd.read_csv(f"{s3}{folder}{variable[objective]['dest_key']}", index_col=0)
-except:
-    pass
 
-if stored_data.shape[0] > 0:
-    start_date = (pd.to_datetime(max(stored_data.index))+timedelta(days=1)).date()
+def save(solar_data, missing):
+    """
+    Upload the data fetched so far and the days without file
+    """
+    bucket = session_boto()
+    to_boto(bucket, folder, checkpoint_key, solar_data.to_csv())
+    to_boto(bucket, folder, missing_key, json.dumps(missing).encode('utf-8'))
 
-### Retrieval loop between start_date and end_date
-solar_data = pd.DataFrame()
-for single_date in daterange(start_date, end_date):
-    print(single_date.strftime("%Y-%m-%d"))
-    df_temp = extract_date(base_url, single_date, objective=objective)
-    solar_data = pd.concat([solar_data, df_temp])
 
-if stored_data.shape[0] > 0:
-    solar_data = pd.concat([stored_data, solar_data])
+def publish_reparse(solar_data):
+    """
+    Replace the stored history by the complete reparse and remove its checkpoint
+    """
+    bucket = session_boto()
+    to_boto(bucket, folder, dest_key, solar_data.to_csv())
+    bucket.Object(folder + reparse_key).delete()
 
-# url = "https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/solar/raw_solar_data.csv"
-#to_s3(solar_data)
-#storage of the data in a csv
-print(solar_data.head())
-bucket = session_boto()
-to_boto(bucket, folder, variable[objective]['dest_key'], solar_data.to_csv())
 
-# save_tocsv(solar_data, 'data/solar/raw_solar_data.csv')
-# solar_data.to_csv('data/solar/raw_solar_data.csv')
\ No newline at end of file
+if __name__ == "__main__":
+    load_dotenv()
+
+    ### Last checkpoint
+    stored_data = pd.DataFrame()
+    try:
+        if not reparse:
+            stored_data = pd.read_csv(f"{s3}{folder}{dest_key}", index_col=0)
+    except:
+        pass
+
+    missing = []
+    response = requests.get(f"{s3}{folder}{missing_key}", timeout=30)
+    if response.status_code == 200:
+        missing = response.json()
+
+    ### Retrieval of the days not stored yet between start_date and end_date
+    backfill = Backfill(base_url, objective, save, workers=workers, checkpoint_days=checkpoint_days)
+    solar_data = backfill.run(start_date, end_date, stored_data, missing)
+    if reparse:
+        publish_reparse(solar_data)
+
+    print(solar_data.tail())
+
+    # save_tocsv(solar_data, 'data/solar/raw_solar_data.csv')
+    # solar_data.to_csv('data/solar/raw_solar_data.csv')
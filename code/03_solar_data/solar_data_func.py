@@ -1,12 +1,22 @@
 ### Importation of the libraries
+import gzip
+import re
+import threading
 import requests
+import numpy as np
 import pandas as pd
 from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from utils import mean, daterange
 import boto3
 import os
+import sys
 from dotenv import load_dotenv
 
+# token bucket and retries of the API (09_API/ratelimit.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '09_API'))
+import ratelimit
+
 ### General functions
 
 # ##calculate mean from a list
@@ -23,7 +33,35 @@ from dotenv import load_dotenv
 
 # 
 
-def req_solar(base_url, date, objective='predi'):
+# Local cache of the downloaded texts: a published day never changes, so the
+# full history can be parsed again without downloading anything
+RAW_CACHE_DIR = os.getenv('SOLAR_RAW_CACHE_DIR', os.path.join('data', 'solar', 'raw'))
+
+# Requests per second to NOAA, shared by the threads of a backfill, and retries of
+# the 429 / 5xx responses and connection errors
+NOAA_REQUESTS_PER_S = float(os.getenv('SOLAR_NOAA_REQUESTS_PER_S', '5'))
+NOAA_RETRIES = int(os.getenv('SOLAR_NOAA_RETRIES', '3'))
+NOAA_BACKOFF = float(os.getenv('SOLAR_NOAA_BACKOFF', '1'))
+
+def raw_cache_path(file, date, cache_dir=None):
+    return os.path.join(cache_dir or RAW_CACHE_DIR, f'{date.year}', f'{file}.gz')
+
+def read_raw_cache(file, date, cache_dir=None):
+    path = raw_cache_path(file, date, cache_dir)
+    if os.path.exists(path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return f.read()
+
+def write_raw_cache(file, date, text, cache_dir=None):
+    path = raw_cache_path(file, date, cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # written under another name then renamed: a crash never leaves a truncated file
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def req_solar(base_url, date, objective='predi', session=None, timeout=30, cache_dir=None):
 
     objective_dic = {'predi' : "daypre.txt",
                 'historic' : "SGAS.txt"}
@@ -31,49 +69,48 @@ def req_solar(base_url, date, objective='predi'):
     file= f'{date.year}'+f'{date.month:02}'+f'{date.day:02}'+objective_dic[objective]
     url = f"{base_url}/{date.year}/{f'{date.month:02}'}/{file}"
     daily = {"date" : date}
+
+    text = read_raw_cache(file, date, cache_dir)
+    if text is not None:
+        return text, daily
+
     print(url)
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.text, daily
-    else:
-        #Return an empty list to avoid breaking the data collection process if missing file.
-        return [], daily
-    
+    limiter = ratelimit.host_limiter(url, NOAA_REQUESTS_PER_S)
+    try:
+        response = ratelimit.get_with_retry(session or requests, url, limiter,
+                                            retries=NOAA_RETRIES, backoff=NOAA_BACKOFF, timeout=timeout)
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            #Return an empty list to avoid breaking the data collection process if missing file.
+            return [], daily
+        # other errors are raised: the day is fetched again later, not taken as missing
+        raise
+
+    write_raw_cache(file, date, response.text, cache_dir)
+    return response.text, daily
+
 
 ### Splitting the response text in different paragraphs
+#The space after "C." prevents confusion with "UTC."
+SECTIONS = re.compile(r"\nA\.(.*?)\nB\.(.*?)\nC\. (.*?)\nD\.(.*?)\nE\.(.*?)\nF\.(.*)", re.S)
+
 def split_response(text):
-    # print(text)
-    text_split_temp = text.split("\nA.")[1]
-    text_A, text_split_temp = text_split_temp.split("\nB.")
-    text_B, text_split_temp = text_split_temp.split("\nC. ") #Added the space to prevent confusion with "UTC."
-    text_C, text_split_temp = text_split_temp.split("\nD.")
-    text_D, text_split_temp = text_split_temp.split("\nE.")
-    text_E, text_F = text_split_temp.split("\nF.")
-    return text_A, text_B, text_C, text_D, text_E, text_F
+    sections = SECTIONS.search(text)
+    if sections is None:
+        raise ValueError("Sections A to F not found in the SGAS text")
+    return sections.groups()
 
 def split_predi(text):
     return
 
 ### data collection for the different paragraphs
 #Treatment of section A : event occurences
-# At the moment, only the number of events is saved, 
-# but the pipeline is ready for more complex treatment
+# Only the number of events is saved: the event columns (Begin, Max, End, ...)
+# are deliberately not parsed
 def coll_data_A(text_A, daily):
-    #hard codding the data limits for later separation.
-    indices = [1, 6, 11, 17, 22, 29, 35, 38, 45, 49, 68]
-    data = []
-    test_A = text_A.splitlines()[1:]
-    for line in range(len(test_A)):
-        if line == 0:
-            #colnames are stored in the first line kept
-            col = test_A[line].split()
-        else:
-            #retrieval of the data based on the previously stored indices
-            data.append([test_A[line][indices[i]:indices[i+1]].strip() for i in range(len(indices)-1)])
-
-    events_df = pd.DataFrame(data, columns=col)
-
-    daily.update({'nb_event' : len(events_df)})
+    #title of the section, column names (Begin, Max, End, ...), then one event per non-blank line
+    events = [line for line in text_A.splitlines()[2:] if line.strip()]
+    daily.update({'nb_event' : len(events)})
     return daily
 
 #Traitement des sections B, C, F
@@ -93,39 +130,46 @@ def coll_data_text(text_ini, daily):
     return daily
 
 #Traitement de la section E
+DAILY_INDICES = re.compile(r"10 cm\s+(?P<flux>\S+)\s+SSN\s+(?P<ssn>\S+)\s+Afr/Ap\s+(?P<afr>[^/\s]+)/(?P<ap>\S+)"
+                           r"\s+X-ray Background\s+(?P<xray>\S+)")
+PROTON_FLUENCE = re.compile(r"GT 1 MeV\s+(?P<gt1>\S+)\s+GT 10 MeV\s+(?P<gt10>\S+)")
+ELECTRON_FLUENCE = re.compile(r"GT 2 MeV\s+(?P<gt2>\S+)")
+K_INDICES = re.compile(r"Boulder(?P<boulder>[^\n]*?)Planetary(?P<planetary>[^\n]*)")
+
+def k_mean(values):
+    # '?' are missing values, counted as 0
+    values = values.split()
+    return mean([float(x) if x != '?' else 0 for x in values])
+
 def coll_data_E(text_E, daily):
-    test_E = text_E.splitlines()
-    dailies_E = test_E[1].split() #Line with the base data
-    proton_E = test_E[3].split() #Line with the proton data
-    K_index_Boulder, K_index_Planetary = test_E[9].split('Planetary')
-    K_index_Boulder = K_index_Boulder.split() #.remove('Boulder')
-    K_index_Boulder.pop(0)
-    K_index_Boulder = [float(x) if x != '?' else 0 for x in K_index_Boulder]
-    K_index_Planetary = [float(x) if x != '?' else 0 for x in K_index_Planetary.split()]
-    # print(K_index_Boulder)
+    indices = DAILY_INDICES.search(text_E)
+    proton = PROTON_FLUENCE.search(text_E)
+    k_index = K_INDICES.search(text_E)
+    electron = ELECTRON_FLUENCE.search(text_E)
+    if indices is None or proton is None or electron is None or k_index is None:
+        raise ValueError("Daily indices not found in section E")
+
     try:
-     float(dailies_E[2])
-    except:
-     d_10cm = 0
-    else:
-        d_10cm = float(dailies_E[2])
+        d_10cm = float(indices["flux"])
+    except ValueError:
+        d_10cm = 0
     daily.update({
         "10cm" : d_10cm,
-        "SSN" : dailies_E[4],
-        "Afr" : dailies_E[6].split('/')[0],
-        "Ap" : dailies_E[6].split('/')[1],
-        "Xray Bg" : dailies_E[9].lstrip('B'),
-        "Proton Fluence (GT1MeV)" : proton_E[3],
-        "Proton Fluence (GT10MeV)" : proton_E[7],
-        "Electron Fluence (GT2MeV)" : test_E[6].split()[3], #reaching directly for the line containing the electron data
-        "K index Boulder" : mean(K_index_Boulder),
-        "K index Planetary" : mean(K_index_Planetary)
+        "SSN" : indices["ssn"],
+        "Afr" : indices["afr"],
+        "Ap" : indices["ap"],
+        "Xray Bg" : indices["xray"].lstrip('B'),
+        "Proton Fluence (GT1MeV)" : proton["gt1"],
+        "Proton Fluence (GT10MeV)" : proton["gt10"],
+        "Electron Fluence (GT2MeV)" : electron["gt2"],
+        "K index Boulder" : k_mean(k_index["boulder"]),
+        "K index Planetary" : k_mean(k_index["planetary"])
     })
     return daily
 
-### The complete workflow for a single file, returning a one-line dataframe.
-def extract_date(base_url, single_date, objective):
-    data, daily = req_solar(base_url, single_date, objective=objective)
+### The complete workflow for a single file, returning the values of the day (None if no file).
+def extract_daily(base_url, single_date, objective, session=None):
+    data, daily = req_solar(base_url, single_date, objective=objective, session=session)
     if len(data) >1:
         text_A, text_B, text_C, _, text_E, text_F = split_response(data) #The section D of the text is not used because obsolete
         daily = coll_data_A(text_A, daily)
@@ -133,11 +177,92 @@ def extract_date(base_url, single_date, objective):
         daily = coll_data_text(text_C, daily)
         daily = coll_data_E(text_E, daily)
         daily = coll_data_text(text_F, daily)
+        return daily
 
+### The complete workflow for a single file, returning a one-line dataframe.
+def extract_date(base_url, single_date, objective):
+    daily = extract_daily(base_url, single_date, objective)
+    if daily is not None:
         date_df = pd.DataFrame(daily, index=[single_date])
         return date_df
 
 
+### Backfill of a date range
+class Backfill:
+    """
+    Fetch the days of a date range with a bounded pool of threads and
+    checkpoint the result every checkpoint_days days, so that a new run
+    resumes where the previous one stopped.
+
+    The rows are kept in a list and turned into a dataframe only when a
+    checkpoint is written. save(df, missing) stores the checkpoint: the data
+    of all the days fetched so far and the days without a NOAA file (404).
+    The days in error are not recorded: the next run fetches them again.
+    """
+
+    def __init__(self, base_url, objective, save, workers=8, checkpoint_days=60, missing_after_days=7):
+        self.base_url = base_url
+        self.objective = objective
+        self.save = save
+        self.workers = workers
+        self.checkpoint_days = checkpoint_days
+        # a recent day without file may still be published, it is not recorded as missing
+        self.missing_after_days = missing_after_days
+
+    def todo(self, start_date, end_date, stored, missing):
+        done = set(stored.index.astype(str)) | set(missing)
+        return [day for day in daterange(start_date, end_date) if day.strftime("%Y-%m-%d") not in done]
+
+    def checkpoint(self, stored, rows, dates, missing):
+        if rows:
+            new = pd.DataFrame(rows, index=dates)
+            stored = new if stored.shape[0] == 0 else pd.concat([stored, new])
+            stored = stored.sort_index()
+        self.save(stored, sorted(missing))
+        print(f"checkpoint: {stored.shape[0]} days stored, {len(missing)} days without file")
+        return stored
+
+    def run(self, start_date, end_date, stored=None, missing=()):
+        stored = pd.DataFrame() if stored is None else stored
+        missing = set(missing)
+        todo = self.todo(start_date, end_date, stored, missing)
+        print(f"{len(todo)} days to fetch between {start_date} and {end_date}")
+
+        session = requests.Session()
+        session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=self.workers))
+        too_recent = date.today() - timedelta(days=self.missing_after_days)
+
+        rows, dates, failed = [], [], []
+        since_checkpoint = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(extract_daily, self.base_url, day, self.objective, session): day for day in todo}
+            for future in as_completed(futures):
+                day = futures[future]
+                try:
+                    daily = future.result()
+                except Exception as e:
+                    # not recorded: fetched again by the next run
+                    print(f"{day}: {e}")
+                    failed.append(day)
+                    continue
+
+                if daily is not None:
+                    rows.append(daily)
+                    dates.append(day.strftime("%Y-%m-%d"))
+                elif day < too_recent:
+                    missing.add(day.strftime("%Y-%m-%d"))
+
+                since_checkpoint += 1
+                if since_checkpoint >= self.checkpoint_days:
+                    stored = self.checkpoint(stored, rows, dates, missing)
+                    rows, dates, since_checkpoint = [], [], 0
+
+        stored = self.checkpoint(stored, rows, dates, missing)
+        if failed:
+            print(f"{len(failed)} days failed, run again to fetch them")
+        return stored
+
+
 #--- saving to s3
 def session_boto():
     # """
@@ -177,56 +302,70 @@ def to_boto(bucket, folder, key, file):
 
 #----Extractiont Prediction data------
 
-def get_date(info):
-    day = info[2].split()
-    ind = [f'{day[x]}-{day[x+1]}-{day[x+2]}' for x in range(0,len(day), 3)]
-    ind = pd.to_datetime(ind)
-    return ind
-
-def get_data(info):
+# Sections of daypre.txt left out of the predictions
+SKIPPED_SECTIONS = {"Product", "Issued", "Polar_cap", "Reg_Prob"}
 
-    data = []
-    info_joined = ' '.join(info)
-    info_split = info_joined.splitlines()[2:]
-    for line in info_split:
-        if 'Solar' in info_joined:
-            data.append([float(x) for x in line.split()])
-        else:
-            data.append([float(x) for x in line.split()[1:]])
-        df_temp = pd.DataFrame(data)
-    return df_temp.mean().tolist()
+# Section kept from a single row instead of the mean of its rows
+SECTION_ROW = {"Geomagnetic_A_indices": "A_Planetary"}
 
+PREDI_COLUMNS = {
+    'Geomagnetic_A_indices' : 'Ap',
+    'Pred_Mid_k' : 'K index Planetary',
+    '10cm_flux' : '10cm'
+}
 
 def solar_predi_parse(text):
-    col_name = {
-        'Geomagnetic_A_indices' : 'Ap',
-        'Pred_Mid_k' : 'K index Planetary',
-        '10cm_flux' : '10cm'
-    }
-    # col = []
-    test_split = text.split('#')[6:]
-    for i in range(0, len(test_split), 2):
-        if len(test_split[i]) > 3:
-            info = test_split[i].split(':')
-            if i == 0:
-                ind = get_date(info)
-                print(ind)
-                # col.append(info[3])
-                data = get_data(info[4:])
-                df = pd.DataFrame(data, columns=[info[3]], index=ind)
-                df['date'] = ind
-                print(df)
-                # df.index.set_names()
-            else:
-                print(info)
-                if info[1] not in ['Polar_cap', 'Reg_Prob']:
-                    
-                    data = get_data(info)
-                    print(data)
-                    df[info[1]] = data
-
-    df = df.rename(columns=col_name)
-    return df
+    """
+    Parse a daypre.txt text in a single pass: one row per predicted day
+    with the mean of the rows of every section
+    """
+    if not text:
+        raise ValueError("Empty daypre.txt text")
+
+    dates = None
+    names, starts, tokens = [], [], []
+    name = None
+    n_rows = 0
+
+    for line in text.splitlines():
+        if line.startswith("#") or not line.strip():
+            continue
+
+        if line.startswith(":"):
+            _, name, rest = line.split(":", 2)
+            if name == "Prediction_dates":
+                day = rest.split()
+                dates = pd.to_datetime([" ".join(day[x:x + 3]) for x in range(0, len(day), 3)], format="%Y %b %d")
+                name = None
+            elif name in SKIPPED_SECTIONS:
+                name = None
+            continue
+
+        if name is None or dates is None:
+            continue
+        values = line.split()
+        if name in SECTION_ROW and values[0] != SECTION_ROW[name]:
+            continue
+        if not names or names[-1] != name:
+            names.append(name)
+            starts.append(n_rows)
+
+        # the values of the days are the last columns, after the row label
+        tokens.extend(values[-len(dates):])
+        n_rows += 1
+
+    if dates is None or not names:
+        raise ValueError("No prediction found in the daypre.txt text")
+
+    # '?' (missing values) become NaN and are left out of the means
+    values = pd.to_numeric(pd.Series(tokens, dtype=object), errors="coerce").to_numpy(dtype=float).reshape(n_rows, len(dates))
+    known = ~np.isnan(values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.add.reduceat(np.where(known, values, 0.0), starts, axis=0) / np.add.reduceat(known, starts, axis=0)
+
+    df = pd.DataFrame(means.T, columns=names, index=dates)
+    df.insert(1, "date", dates)
+    return df.rename(columns=PREDI_COLUMNS)
 
 def fetch_predi(base_url, day, objective):
     data, _ = req_solar(base_url, day, objective)
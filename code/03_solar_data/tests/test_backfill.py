@@ -0,0 +1,117 @@
+import os
+import sys
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import solar_data_func as sdf
+
+BASE_URL = "https://noaa.example/sgas"
+
+
+def response(status, text=""):
+    res = MagicMock(status_code=status, text=text, headers={})
+    if status >= 400:
+        res.raise_for_status.side_effect = requests.exceptions.HTTPError(f"HTTP {status}", response=res)
+    return res
+
+
+class FakeSession:
+    """Answers every url with its list of responses, in order"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+
+    def get(self, url, timeout=None, **kwargs):
+        self.calls.append(url)
+        return self.responses[url].pop(0)
+
+
+def sgas_url(day):
+    return f"{BASE_URL}/{day.year}/{day.month:02}/{day:%Y%m%d}SGAS.txt"
+
+
+@pytest.fixture(autouse=True)
+def no_wait(tmp_path):
+    with patch.object(sdf, "NOAA_BACKOFF", 0), patch.object(sdf, "RAW_CACHE_DIR", str(tmp_path / "raw")), \
+            patch.dict(sdf.ratelimit._limiters, clear=True):
+        yield
+
+
+def test_req_solar_only_404_is_missing(tmp_path):
+    missing_day, broken_day, flaky_day = date(2020, 1, 1), date(2020, 1, 2), date(2020, 1, 3)
+    session = FakeSession({
+        sgas_url(missing_day): [response(404)],
+        sgas_url(broken_day): [response(500)] * 4,
+        sgas_url(flaky_day): [response(503), response(200, "SGAS text")],
+    })
+
+    assert sdf.req_solar(BASE_URL, missing_day, "historic", session=session) == ([], {"date": missing_day})
+    with pytest.raises(requests.exceptions.HTTPError):
+        sdf.req_solar(BASE_URL, broken_day, "historic", session=session)
+    assert sdf.req_solar(BASE_URL, flaky_day, "historic", session=session)[0] == "SGAS text"
+
+    # retried with backoff, then cached
+    assert len(session.calls) == 1 + 4 + 2
+    assert sdf.read_raw_cache(f"{flaky_day:%Y%m%d}SGAS.txt", flaky_day) == "SGAS text"
+
+
+def test_todo_skips_stored_and_missing_days():
+    backfill = sdf.Backfill(BASE_URL, "historic", save=None)
+    stored = pd.DataFrame({"nb_event": [1]}, index=["2020-01-02"])
+
+    todo = backfill.todo(date(2020, 1, 1), date(2020, 1, 6), stored, ["2020-01-04"])
+
+    assert todo == [date(2020, 1, 1), date(2020, 1, 3), date(2020, 1, 5)]
+
+
+def test_run_checkpoints_and_leaves_failed_days_out():
+    saves = []
+    backfill = sdf.Backfill(BASE_URL, "historic", save=lambda df, missing: saves.append((df.copy(), missing)),
+                            workers=3, checkpoint_days=2)
+
+    def extract_daily(base_url, day, objective, session=None):
+        if day == date(2020, 1, 3):
+            return None  # no file on NOAA
+        if day == date(2020, 1, 4):
+            raise requests.exceptions.HTTPError("HTTP 500")
+        return {"date": day, "nb_event": day.day}
+
+    with patch.object(sdf, "extract_daily", side_effect=extract_daily):
+        stored = backfill.run(date(2020, 1, 1), date(2020, 1, 7))
+
+    # 6 days: a checkpoint after every 2 days done, the failed day does not count, and the last one
+    assert len(saves) == 3
+    assert [len(df) for df, _ in saves][-1] == 4
+    assert stored.index.tolist() == ["2020-01-01", "2020-01-02", "2020-01-05", "2020-01-06"]
+    assert stored["nb_event"].tolist() == [1, 2, 5, 6]
+    # the failed day is neither stored nor missing: the next run fetches it again
+    assert saves[-1][1] == ["2020-01-03"]
+    assert backfill.todo(date(2020, 1, 1), date(2020, 1, 7), stored, saves[-1][1]) == [date(2020, 1, 4)]
+
+
+def test_reparse_checkpoints_do_not_overwrite_the_history(monkeypatch):
+    import importlib
+
+    monkeypatch.setenv("SOLAR_REPARSE", "1")
+    import solar_data
+    solar_data = importlib.reload(solar_data)
+
+    bucket = MagicMock()
+    with patch.object(solar_data, "session_boto", return_value=bucket), \
+         patch.object(solar_data, "to_boto") as mock_to_boto:
+        solar_data.save(pd.DataFrame({"nb_event": [1]}), [])
+        assert [c.args[2] for c in mock_to_boto.call_args_list] == ["raw_solar_data_reparse.csv", "raw_solar_data_missing.json"]
+
+        solar_data.publish_reparse(pd.DataFrame({"nb_event": [1]}))
+        assert mock_to_boto.call_args.args[2] == "raw_solar_data.csv"
+        bucket.Object.assert_called_once_with("public/solar/raw_solar_data_reparse.csv")
+
+    monkeypatch.delenv("SOLAR_REPARSE")
+    importlib.reload(solar_data)
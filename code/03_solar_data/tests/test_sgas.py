@@ -0,0 +1,92 @@
+import os
+import sys
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import solar_data_func as sdf
+
+# SGAS.txt samples in the NOAA layout, written by hand
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def sample(name):
+    with open(os.path.join(DATA_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_split_response():
+    text_A, text_B, text_C, text_D, text_E, text_F = sdf.split_response(sample("sgas_events.txt"))
+
+    assert text_A.splitlines()[0].strip() == "Energetic Events"
+    assert text_B.strip() == "Proton Events:  None"
+    # "UTC." of the header is not taken as section C
+    assert text_C.strip().startswith("Geomagnetic Activity Summary")
+    assert text_E.splitlines()[1].startswith("10 cm 072")
+    assert text_F.strip() == "Comments:  None"
+
+    with pytest.raises(ValueError):
+        sdf.split_response("no sections")
+
+
+@pytest.mark.parametrize("name, nb_event", [
+    ("sgas_events.txt", 3),
+    ("sgas_no_event.txt", 0),
+    ("sgas_events_header_only.txt", 0),
+    ("sgas_missing_values.txt", 1),
+])
+def test_coll_data_A(name, nb_event):
+    text_A = sdf.split_response(sample(name))[0]
+    assert sdf.coll_data_A(text_A, {}) == {"nb_event": nb_event}
+    # blank lines are not events
+    assert sdf.coll_data_A(text_A + "\n   \n", {}) == {"nb_event": nb_event}
+
+
+def test_coll_data_E():
+    daily = sdf.coll_data_E(sdf.split_response(sample("sgas_events.txt"))[4], {})
+
+    assert daily == {
+        "10cm": 72.0,
+        "SSN": "012",
+        "Afr": "002",
+        "Ap": "003",
+        "Xray Bg": "1.2",
+        "Proton Fluence (GT1MeV)": "9.9e+05",
+        "Proton Fluence (GT10MeV)": "1.4e+04",
+        "Electron Fluence (GT2MeV)": "1.92e+07",
+        "K index Boulder": 0.625,
+        "K index Planetary": 0.25,
+    }
+
+
+def test_coll_data_E_missing_values():
+    daily = sdf.coll_data_E(sdf.split_response(sample("sgas_missing_values.txt"))[4], {})
+
+    # '???' flux and '?' K indices are counted as 0
+    assert daily["10cm"] == 0
+    assert daily["K index Boulder"] == 0 and daily["K index Planetary"] == 0
+    with pytest.raises(ValueError):
+        sdf.coll_data_E("10 cm 072", {})
+
+
+def test_extract_daily_from_raw_cache(tmp_path):
+    day = date(2020, 1, 2)
+    text = sample("sgas_events.txt")
+
+    sdf.write_raw_cache(f"{day:%Y%m%d}SGAS.txt", day, text, str(tmp_path))
+    assert sdf.read_raw_cache(f"{day:%Y%m%d}SGAS.txt", day, str(tmp_path)) == text
+    assert sdf.read_raw_cache("20200103SGAS.txt", date(2020, 1, 3), str(tmp_path)) is None
+    assert os.listdir(tmp_path / "2020") == ["20200102SGAS.txt.gz"]
+
+    # a cached day is parsed again without any request
+    with patch.object(sdf, "RAW_CACHE_DIR", str(tmp_path)), \
+            patch.object(sdf.ratelimit, "get_with_retry", side_effect=AssertionError("no request")):
+        daily = sdf.extract_daily("https://noaa.example/sgas", day, "historic")
+
+    assert daily["date"] == day
+    assert daily["nb_event"] == 3
+    assert daily["Proton Events"] == "None"
+    assert daily["Ap"] == "003"
@@ -15,11 +15,14 @@ st.set_page_config(
 # Fonctions
 # Préparation des dataframes
 def prepare_df(df, zone):
-    # datetime
-    df["datetime"] = pd.to_datetime(
-        df["Date"] + " " + df["Heures"],
-        errors="coerce"
-    )
+    # datetime (typed "Datetime" column of the parquet export)
+    if "Datetime" in df.columns:
+        df["datetime"] = df["Datetime"]
+    else:
+        df["datetime"] = pd.to_datetime(
+            df["Date"].astype(str) + " " + df["Heures"].astype(str),
+            errors="coerce"
+        )
     df = df.sort_values("datetime")
 
     df["year"] = df["datetime"].dt.year
@@ -65,10 +68,22 @@ def get_daily_tch_solaire_regional(df_reg: pd.DataFrame) -> pd.DataFrame:
     df_daily["type"] = "Historique"
     return df_daily
 
+# Colonnes utilisées par les graphiques, moyennées par heure par l'API
+# (les profils horaires et par jour de semaine n'ont pas besoin de la demi-heure)
+RTE_COLUMNS = ["Consommation", "Nucleaire", "Gaz", "Charbon", "Fioul", "Hydraulique",
+               "Eolien", "Solaire", "Bioenergies", "Ech__physiques", "Taux_de_Co2"]
+
+def rte_data_url(deb, type, columns):
+    return (
+        "https://renergies99lead-api-renergy-lead.hf.space/rte_data"
+        f"?deb={deb}&fin={datetime.now().strftime('%Y')}&type={type}&format=parquet"
+        f"&columns={requests.utils.quote(','.join(columns))}&granularity=hour&agg=avg"
+    )
+
 def load_data():
     # Datasets
     #df_nat = pd.read_csv("https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/prod/eCO2mix_RTE_Annuel-Definitif.csv")
-    df_nat = pd.read_csv(f"https://renergies99lead-api-renergy-lead.hf.space/rte_data?deb=2020&fin={datetime.now().strftime('%Y')}&type=rte_national")
+    df_nat = pd.read_parquet(rte_data_url(2020, "rte_national", RTE_COLUMNS))
     print("load_data load_data load_data", type(df_nat), df_nat.shape)
     df_nat_prep = prepare_df(df_nat, zone="France")
 
@@ -77,11 +92,37 @@ def load_data():
 def load_regional_data():
     # Datasets
     #df_reg = pd.read_csv("https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/prod/eCO2mix_RTE_Auvergne-Rhone-Alpes.csv")
-    df_reg = pd.read_csv(f"https://renergies99lead-api-renergy-lead.hf.space/rte_data?deb=2021&fin={datetime.now().strftime('%Y')}&type=rte_regional")
+    df_reg = pd.read_parquet(rte_data_url(2021, "rte_regional", RTE_COLUMNS + [COL_TCH]))
+    # nom de la colonne dans la base : "TCH Solaire (%)" -> "TCH_Solaire____"
+    df_reg = df_reg.rename(columns={"TCH_Solaire____": COL_TCH})
     df_reg_prep = prepare_df(df_reg, zone="Auvergne-Rhône-Alpes")
 
     return df_reg_prep
 
+# Same helper in 10_Airflow/dags/update_data.py: both are deployed on their own, the copies are kept
+# identical on purpose (checked by 09_API/tests/test_job_clients.py)
+def wait_for_job(url, job, timeout=1800, interval=5):
+    """
+    Poll the status of a job returned by a /load_* endpoint until it is done
+    """
+    status_url = requests.compat.urljoin(url, job["status_url"])
+    deadline = time.monotonic() + timeout
+
+    while job["status"] not in ("succeeded", "failed"):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Job {job['job_id']} not done after {timeout} seconds")
+        time.sleep(interval)
+
+        response = requests.get(status_url, timeout=30)
+        response.raise_for_status()
+        job = response.json()
+        logging.info(f"Job {job['job_id']}: {job['status']} {job['progress']:.0%} {job['message']}")
+
+    if job["status"] == "failed":
+        raise RuntimeError(f"Job {job['job_id']} failed: {job['error']}")
+
+    return job
+
 def load_api_data(url, data_type):
     logging.info(f"LOAD {data_type}")
 
@@ -91,7 +132,7 @@ def load_api_data(url, data_type):
     for _ in range(max_retries):
 
         try:
-            response = requests.get(url)
+            response = requests.get(url, timeout=30)
             response.raise_for_status()
 
             logging.info(response.content)
@@ -108,6 +149,12 @@ def load_api_data(url, data_type):
 
     else:
         logging.error("Failure after {max_retries} retries")
+        return
+
+    # the load runs in the background, the endpoint returns its job
+    job = wait_for_job(url, response.json())
+    logging.info(f"{data_type}: {job['rows']} rows in {job['duration_s']} s")
+    return job
 
 def load_rte_data():
     rte_last_download_response = requests.get("https://renergies99lead-api-renergy-lead.hf.space/rte_last_download")
@@ -1,31 +1,37 @@
 import pandas as pd
 #from func_utils.utils import save_tocsv
 
-import plotly.express as px
-import seaborn as sns
-import matplotlib.pyplot as plt
 import json
 
-from sklearn.model_selection import train_test_split
-from sklearn.pipeline import Pipeline
-from sklearn.compose import ColumnTransformer
-from sklearn.preprocessing import FunctionTransformer
-from sklearn.preprocessing import StandardScaler
-from sklearn.linear_model import LinearRegression
+# sklearn, mlflow and pvlib are imported by the functions using them:
+# importing this module (and starting the API) does not load them
 from dotenv import load_dotenv
 import os
-import boto3
-import mlflow
+import freshness
 from datetime import timedelta, datetime
-import pvlib 
 
 #--------------COLLECT DATA FUNCTIONS---------------------------------------
 #---Prod
-def data_collection_prod(url='https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/prod/eCO2mix_RTE_Auvergne-Rhone-Alpes_cleaned.csv'):
+PROD_DATASET_URL = "s3://renergies99-lead-bucket/public/prod/eCO2mix_RTE_Auvergne-Rhone-Alpes"
 
-    # read csv
-    df_prod = pd.read_csv(url)
-    data_prod = df_prod.copy()
+def data_collection_prod(url='https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/prod/eCO2mix_RTE_Auvergne-Rhone-Alpes_cleaned.csv',
+                         columns=None, last_years=None):
+    """
+    Production data, from the cleaned csv or from the partitioned Parquet dataset (PROD_DATASET_URL).
+    With the dataset, only the columns (besides date and heures) and the last_years requested are read.
+    """
+    if url.endswith(".csv"):
+        # read csv
+        df_prod = pd.read_csv(url)
+        data_prod = df_prod.copy()
+    else:
+        import rte_dataset
+
+        if columns is not None:
+            columns = ["date", "heures"] + list(columns)
+        data_prod = rte_dataset.read_dataset(url, columns=columns, last_years=last_years)
+        # same names as the cleaned csv
+        data_prod.columns = [rte_dataset.normalize_column(c) for c in data_prod.columns]
 
     # formatting the date for future data merge operations
     data_prod['Time'] = pd.to_datetime(data_prod['date']+" "+data_prod['heures'])
@@ -77,6 +83,8 @@ def get_solarposition(time, latitude, longitude):
     Returns a dataframe with apparent_zenith, zenith, apparent_elevation, 
             elevation, azimuth, equation_of_time
     """
+    import pvlib
+
     return pvlib.solarposition.get_solarposition(time, latitude, longitude)
 
 def add_day_length_column(df, df_name):
@@ -174,6 +182,21 @@ def data_collection_weather(data_path):
     collected_data = merge_weather_dfs_by_city(dfs_by_city)
     return collected_data
 
+def prepare_weather_solar_data(weather_data, solar_df):
+    """
+    CPU part of the data preparation: solar position (pvlib) by city and merges.
+    Takes the raw weather data (see data_coll_weather) and the solar data (see data_coll_solar).
+    Module-level so that it can run in a process pool.
+    """
+    dfs_by_city = split_data_weather_by_city(weather_data)
+    weather_df = merge_weather_dfs_by_city(dfs_by_city)
+    data_df = merge_weather_solar_data(weather_df, solar_df)
+
+    cols = data_df.select_dtypes(include="int64").columns.to_list()
+    data_df[cols] = data_df[cols].astype(float)
+
+    return data_df
+
 #---------------MERGE COLLECTED DATA------------------------------
 def merge_weather_solar_data(weather_df, solar_df):
     """
@@ -272,7 +295,7 @@ def data_prep_for_ML(df, features):
 
     return prep_data
 
-def preprocessing_and_pipeline(X, estimator=LinearRegression()):
+def preprocessing_and_pipeline(X, estimator=None):
     """
     Prepare the preprocessing and model estimation pipeline. The pipeline will need to be fitted using .fit
     Returns {
@@ -284,6 +307,14 @@ def preprocessing_and_pipeline(X, estimator=LinearRegression()):
         "pipeline": pipeline
     }
     """
+    from sklearn.pipeline import Pipeline
+    from sklearn.compose import ColumnTransformer
+    from sklearn.preprocessing import FunctionTransformer, StandardScaler
+    from sklearn.linear_model import LinearRegression
+
+    if estimator is None:
+        estimator = LinearRegression()
+
     # ---- identify columns
     numeric_cols = X.select_dtypes(include='number').columns.tolist()
     object_cols = X.select_dtypes(exclude='number').columns.tolist()
@@ -350,6 +381,9 @@ def data_prep_and_split(merged_data):
     Up to date: Production data and Landsat (meta)data / standard scaler
     to be included: weather, solar / ohe, feature engineering
     """
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+
 
     y = merged_data['tch_solaire_(%)'].to_numpy() #target
     x = merged_data[['Land Cloud Cover','Sun Elevation L0RA']] #features
@@ -371,6 +405,8 @@ def model_training(model, x_train, x_test, y_train, y_test):
     Model training with experiment storage in mlflow server.
     Can be decomposed further by separating the mlflow section. 
     """
+    import mlflow
+    from sklearn.linear_model import LinearRegression
 
     # pour enregistrer dans MLFlow
     load_dotenv()
@@ -434,39 +470,19 @@ def log_json_artifact(data, filename):
     """
     with open(filename, "w") as f:
         json.dump(data, f)
+
+    import mlflow
     mlflow.log_artifact(filename)
 
 last_download_filename = "predi_last_download"
-API_KEY_S3 = os.environ["AWS_ACCESS_KEY_ID"]
-API_SECRET_KEY_S3 = os.environ["AWS_SECRET_ACCESS_KEY"]
 bucket = "renergies99-lead-bucket"
 
-def s3_cred():
-    load_dotenv()
-
-    return boto3.client(
-        "s3",
-        aws_access_key_id=API_KEY_S3,
-        aws_secret_access_key=API_SECRET_KEY_S3,
-        region_name="eu-west-3"
-    )
-
-s3 = s3_cred()
-
 def getNow():
     return datetime.now().strftime("%Y-%m-%d")
 
 def get_predi_last_download():
-    try:
-        key = f"public/prediction/{last_download_filename}"
-
-        obj = s3.get_object(Bucket=bucket, Key=key)
-        ligne = obj["Body"].read().decode("utf-8")
-
-    except:
-        return "Cannot get prediction last download data"
-    
-    return ligne
+    # served from the freshness manifest held in memory
+    return freshness.manifest.last_download("prediction") or "Cannot get prediction last download data"
 
 def is_predi_data_already_downloaded():
     return getNow() == get_predi_last_download()
@@ -1,18 +1,25 @@
-import mlflow 
-import uvicorn
 import pandas as pd 
 from pydantic import BaseModel
 from typing import Literal, List, Union
-from fastapi import FastAPI, File, UploadFile, Query
-import joblib
+from fastapi import FastAPI, File, UploadFile, Query, Request, HTTPException
+from fastapi.responses import StreamingResponse
 import app_func as af
 import Model_func as mf
-import boto3
 from dotenv import load_dotenv
+import logging
 import os
 import rte
+import db
 import openweathermap as owm
 import solar as sol
+import freshness
+from model_holder import production_model
+import model_cache
+import batch_io
+import executors
+import jobs
+from executors import run_io, run_cpu
+from contextlib import asynccontextmanager
 from datetime import date, timedelta, datetime
 from io import StringIO
 from enum import Enum
@@ -23,7 +30,24 @@ class RteType(str, Enum):
     national = "rte_national"
     regional = "rte_regional"
 
-bucket = af.session_boto()
+class RteFormat(str, Enum):
+    csv = "csv"
+    csv_gz = "csv.gz"
+    csv_zst = "csv.zst"
+    parquet = "parquet"
+    arrow = "arrow"
+
+class RteGranularity(str, Enum):
+    half_hour = "30min"
+    hour = "hour"
+    day = "day"
+    month = "month"
+
+class RteAggregation(str, Enum):
+    avg = "avg"
+    sum = "sum"
+    min = "min"
+    max = "max"
 
 MLFLOW_TRACKING_URI = "https://renergies99lead-mlflow.hf.space/"
 
@@ -59,6 +83,13 @@ Imagine this API deals with blog articles. With the following endpoints, you can
 * `/blog-articles/{blog_id}`: **GET** request that retrieve a blog article given a `blog_id` as `int`.
 * `/create-blog-article`: POST request that creates a new article
 
+## Data loading
+
+`/load_rte_data`, `/load_openweathermap_forecasts` and `/load_solar_data` run the load in the
+background: they answer **202** with the job (`job_id`, `status`, `status_url`, ...) instead of
+the message returned once the load was done. Follow it with `/jobs/{job_id}` until its `status`
+is `succeeded` or `failed`.
+
 ## Machine Learning
 
 This is a Machine Learning endpoint that predict salary given some years of experience. Here is the endpoint:
@@ -86,6 +117,16 @@ tags_metadata = [
     }
 ]
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Watch the @production alias in the background, the model itself is
+    # loaded on the first prediction
+    production_model.start()
+    yield
+    production_model.stop()
+    jobs.queue.shutdown()
+    executors.shutdown()
+
 app = FastAPI(
     title="🪐 Jedha Demo API",
     description=description,
@@ -94,7 +135,8 @@ app = FastAPI(
         "name": "Jedha",
         "url": "https://jedha.co",
     },
-    openapi_tags=tags_metadata
+    openapi_tags=tags_metadata,
+    lifespan=lifespan
 )
 
 class BlogArticles(BaseModel):
@@ -129,16 +171,12 @@ async def data_prep(urls: dict):
     In the list of urls, the first url must be the solar data, the second the weather data
     """
 
-    solar_df = mf.data_coll_solar(urls["urls"][0])
-    weather_df = mf.data_collection_weather(urls["urls"][1])
-    data_df = mf.merge_weather_solar_data(weather_df, solar_df)
-
-    cols = data_df.select_dtypes(include="int64").columns.to_list()
-    data_df[cols] = data_df[cols].astype(float)
+    # Downloads in the I/O pool, pvlib and merges in the process pool
+    solar_df = await run_io(mf.data_coll_solar, urls["urls"][0])
+    weather_data = await run_io(mf.data_coll_weather, urls["urls"][1])
+    data_df = await run_cpu(mf.prepare_weather_solar_data, weather_data, solar_df)
 
-    data_df
-
-    af.to_boto(bucket, data_df.to_csv(), "data_compile_predi.csv")
+    await run_io(af.to_boto, af.session_boto(), data_df.to_csv(), "data_compile_predi.csv")
 
     return data_df.to_json(orient="index")
 
@@ -148,59 +186,25 @@ async def predict():
     """
     Prediction of the Renewable Energies based on the input data 
     """
-    mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
-
-    # Set your variables for your environment
-    EXPERIMENT_NAME="REnergie-lead"
-    # Set experiment's info 
-    mlflow.set_experiment(EXPERIMENT_NAME)
-
     #print(type(predictionFeatures), predictionFeatures)
     # Read data 
-    data = pd.read_csv("https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/prediction/data_compile_predi.csv")
+    data = await run_io(pd.read_csv, "https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/prediction/data_compile_predi.csv")
     #data = pd.read_json(StringIO(predictionFeatures), orient='index', dtype=False)
 
     #data = pd.DataFrame([predictionFeatures])
     #data = pd.DataFrame.from_dict(predictionFeatures, orient="index")
 
-    # Log model from mlflow 
-    #run = 'ce62ebaafd8c46fdb939ef6e5b0bfc7e' #marvelous-squid-316
-    #logged_model = f'runs:/{run}/model'
-    #logged_model = "s3://renergies99-lead-mlflow/4/models/m-07069184939b483ab341754dbdb501be/artifacts"
-
-    # Log model from mlflow
-    # MLFLOW_TRACKING_URI = os.environ["MLFLOW_TRACKING_URI"]
-    # mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
-
-    logged_model = "models:/SolarProdModel@production"
-    # logged_model = 'runs:/9c9501dd806242abaf63d6daf0fd2ac0/pipeline_model'
-    #run = 'ce62ebaafd8c46fdb939ef6e5b0bfc7e' #marvelous-squid-316
-    #logged_model = f'runs:/{run}/model'
-    #logged_model = "s3://renergies99-lead-mlflow/4/models/m-07069184939b483ab341754dbdb501be/artifacts"
-    
-    
-    # # Load model as a PyFuncModel.
-    loaded_model = mlflow.pyfunc.load_model(logged_model)
-    print('loaded model')
-    prediction = loaded_model.predict(data)
-
-    """
-    artifact_uri = mlflow.get_run(run).info.artifact_uri
-    errors = mlflow.artifacts.load_dict(artifact_uri + "/error.json")
-    # errors = mlflow.artifacts.load_dict('s3://renergies99-lead-mlflow/5/9c9501dd806242abaf63d6daf0fd2ac0/artifacts/pipeline_model/error.json')
-    errors_df = pd.DataFrame(errors)
-    
-    for predi in prediction.tolist():
-        error_list.append(af.get_std(predi, errors_df))
-    """
-    print(prediction)
-
-    error_list = [0, 0, 0]
+    # The model version pointed by models:/SolarProdModel@production is kept in memory.
+    # Keep a reference for the whole request so that a swap does not affect it
+    loaded_model = await run_io(production_model.get)
+    logging.info(f"Predict with {loaded_model.name} version {loaded_model.version}")
+    # Error bars from the error table logged with the model, one lookup for all the predictions
+    prediction, error = loaded_model.predict_with_error(data)
 
     # Format response
     response = {"Date": data['Date'],
                 "TCH_solaire_pred": prediction.tolist(),
-                "Error": error_list}
+                "Error": error.tolist()}
     resp_df = pd.DataFrame(response, index=list(range(len(response["TCH_solaire_pred"]))))
 #    try:
 #        hist_df = pd.read_csv('https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/prediction/predi.csv')
@@ -210,24 +214,40 @@ async def predict():
 #        all_predi = pd.concat([resp_df, hist_df])
 
     resp_toboto = resp_df.to_csv()
-    af.to_boto(bucket, resp_toboto, "pred_tch_solaire_rhone_alpes.csv")
-
-    af.to_boto(bucket, getNow().encode("utf-8"), "predi_last_download")
+    await run_io(af.to_boto, af.session_boto(), resp_toboto, "pred_tch_solaire_rhone_alpes.csv")
+
+    # The last prediction date only changes once a day: the manifest copy in memory
+    # spares the S3 writes to the other requests
+    now = getNow()
+    if await run_io(freshness.manifest.last_download, "prediction") != now:
+        await run_io(af.to_boto, af.session_boto(), now.encode("utf-8"), "predi_last_download")
+        await run_io(freshness.manifest.record, "prediction", resp_df, now)
     return response
 
+@app.post("/reload_model", tags=["Machine Learning"])
+async def reload_model():
+    """
+    Check the @production alias now and swap in the new model version if it has moved
+    """
+    reloaded = await run_io(production_model.refresh)
+    loaded_model = await run_io(production_model.get)
+
+    return {"model": loaded_model.name, "version": loaded_model.version, "reloaded": reloaded}
+
 @app.post("/predict_live", tags=["Machine Learning"])
 async def predict(file: UploadFile= File(...)):
     """
     Prediction of solar panel output based on weather and solar data 
     """
     
-    data = pd.read_csv(file.file)
+    data = await run_io(pd.read_csv, file.file)
     time = data['time']
     data = data.drop('time', axis=1)
     print(data)
     # Read data 
     # data_employee = pd.DataFrame([prediction_data])
 
+    import mlflow
     mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
 
     # Log model from mlflow 
@@ -236,8 +256,8 @@ async def predict(file: UploadFile= File(...)):
     # # Load model as a PyFuncModel.
     # loaded_model = mlflow.pyfunc.load_model(logged_model)
 
-    # If you want to load model persisted locally
-    loaded_model = mlflow.pyfunc.load_model(logged_model)
+    # Artifacts are downloaded once per host then read from the local cache
+    loaded_model = await run_io(model_cache.load_model, logged_model)
 
     prediction = loaded_model.predict(data)
 
@@ -245,105 +265,235 @@ async def predict(file: UploadFile= File(...)):
     response = {"prediction": prediction.tolist()}
     return response
 
+@app.post("/predict_batch", tags=["Machine Learning"])
+async def predict_batch(
+    request: Request,
+    output: Literal["arrow", "parquet", None] = Query(None, description="Response format (arrow | parquet), same as the body by default")
+    ):
+    """
+    Batch prediction with the production model.
+    The body is an Arrow IPC stream or a Parquet file (Content-Type application/vnd.apache.arrow.stream
+    or application/vnd.apache.parquet) with a time column and the model features.
+    The response is streamed in the same format with the time column, the prediction and its error.
+    """
+    try:
+        fmt = batch_io.body_format(request.headers.get("content-type"))
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
+    body = await request.body()
+    loaded_model = await run_io(production_model.get)
+
+    try:
+        table = await run_io(batch_io.read_table, body, fmt)
+        timestamps, features = batch_io.split_features(table, batch_io.model_input_names(loaded_model.model))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    # One vectorized predict for the whole batch
+    prediction, error = await run_io(lambda: loaded_model.predict_with_error(features.to_pandas()))
+    result = batch_io.prediction_table(timestamps, prediction, error)
+
+    output = output or fmt
+    return StreamingResponse(
+        batch_io.stream_table(result, output),
+        media_type=batch_io.MEDIA_TYPES[output],
+        headers={"X-Model-Version": str(loaded_model.version)}
+    )
+
 @app.get("/predi_last_download", tags=["Machine Learning"])
 async def predi_last_download():
     """
     Get the date of the last downloaded version of Prediction
     """
-    return mf.get_predi_last_download()
+    return await run_io(mf.get_predi_last_download)
 
-@app.get("/load_rte_data", tags=["RTE"])
-async def load_rte_data():
+@app.get("/freshness", tags=["Data"])
+async def data_freshness():
     """
-    Load RTE data
+    Last download date, row count and content hash of every data source
     """
-    if not rte.is_rte_data_already_downloaded():
-        try:
-            previous_data = rte.get_previous_rte_data()
-            en_cours_data = rte.en_cours_rte_data()
+    return await run_io(freshness.manifest.get)
 
-            previous_data.append(en_cours_data)
+def rte_load(job=None):
+    """
+    Download the current year of RTE data and store it, with the definitive
+    years missing from the dataset. Returns the number of rows written
+    """
+    if job is not None:
+        job.step(0.1, "Reading the missing definitive years")
+    previous_data = rte.get_missing_previous_rte_data()
 
-            df = pd.concat(previous_data, ignore_index=True)
+    if job is not None:
+        job.step(0.4, "Downloading the current year")
+    en_cours_data = rte.en_cours_rte_data()
 
-            rte.rte_df_to_csv(df)
-            
-            return "RTE data successfully uploaded"
+    previous_data.append(en_cours_data)
 
-        except Exception as e:
-            return e
-    
-    return "RTE data is already downloaded today"
+    df = pd.concat(previous_data, ignore_index=True)
+
+    if job is not None:
+        job.step(0.7, "Writing the dataset")
+    rte.save_rte_data(df)
+
+    return len(df)
+
+def rte_job(job):
+    # the load may have just been done by another worker
+    freshness.manifest.invalidate()
+    if rte.is_rte_data_already_downloaded():
+        job.step(1.0, "RTE data is already downloaded today")
+        return 0
+    return rte_load(job)
+
+def openweathermap_job(job):
+    freshness.manifest.invalidate()
+    if owm.is_openweathermap_data_already_downloaded():
+        job.step(1.0, "Openweathermap data is already downloaded today")
+        return 0
+
+    job.step(0.1, "Geocoding the cities")
+    cities_coord = owm.get_city_data()
+
+    job.step(0.3, "Downloading the forecasts")
+    df = owm.load_openweathermap_data(cities_coord)
+    return 0 if df is None else len(df)
+
+def solar_job(job):
+    freshness.manifest.invalidate()
+    if sol.is_solar_data_already_downloaded():
+        job.step(1.0, "Solar data is already downloaded today")
+        return 0
+
+    job.step(0.1, "Downloading the NOAA forecast")
+    return len(sol.api_fetch_predi())
+
+jobs.queue.register("rte", rte_job)
+jobs.queue.register("openweathermap", openweathermap_job)
+jobs.queue.register("solar", solar_job)
+
+def job_accepted(job):
+    return {**job.to_dict(), "status_url": f"/jobs/{job.id}"}
+
+@app.get("/load_rte_data", tags=["RTE"], status_code=202)
+async def load_rte_data():
+    """
+    Load RTE data in the background, returns the job to follow with /jobs/{job_id}
+    """
+    return job_accepted(jobs.queue.submit("rte"))
 
 @app.get("/rte_last_download", tags=["RTE"])
 async def rte_last_download():
     """
     Get the date of the last downloaded version of RTE data
     """
-    return rte.get_rte_last_download()
+    return await run_io(rte.get_rte_last_download)
 
 @app.get("/rte_data", 
          tags=["RTE"],
          summary="RTE data for dashboard")
 async def rte_data(
+    request: Request,
     deb: int = Query(2012, description="First year"), 
     fin: int = Query(getCurrentYear(), description="Last year"), 
-    type: RteType = Query(RteType.national, description="type of data to search (rte_national | rte_regional)")
+    type: RteType = Query(RteType.national, description="type of data to search (rte_national | rte_regional)"),
+    format: RteFormat = Query(RteFormat.csv, description="csv | csv.gz | csv.zst | parquet | arrow (Arrow IPC stream). Parquet and Arrow have typed columns"),
+    columns: list[str] | None = Query(None, description="Columns to return besides Date and Heures (repeated or comma separated), all but the TCH / TCO rates by default. eCO2mix names are accepted (\"TCH Solaire (%)\")"),
+    granularity: RteGranularity = Query(RteGranularity.half_hour, description="30min (raw rows) | hour | day | month"),
+    agg: RteAggregation = Query(RteAggregation.avg, description="Aggregation of the rows of a period (avg | sum | min | max)")
     ):
     """
-    Get RTE data for dashboard
+    Get RTE data for dashboard.
+    The column selection and the resampling are done by the database.
+    Supports conditional requests (If-None-Match / If-Modified-Since), the data only
+    changes when /load_rte_data runs.
+    """
+    if columns:
+        columns = [col.strip() for value in columns for col in value.split(",") if col.strip()]
+
+    try:
+        return await run_io(rte.rte_data, deb, fin, type.value, format.value,
+                            columns=columns, granularity=granularity.value, agg=agg.value,
+                            if_none_match=request.headers.get("if-none-match"),
+                            if_modified_since=request.headers.get("if-modified-since"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/db_pool_stats", tags=["RTE"])
+async def db_pool_stats():
     """
-    return rte.rte_data(deb, fin, type.value)
+    Statistics of the database connection pool of this worker (checked out, overflow, wait time)
+    """
+    return db.pool_stats()
 
 @app.get("/rte_daily_data", 
          tags=["RTE"],
          summary="RTE get daily data")
 async def rte_daily_data(
-    date: str = Query(getNow(), description="Day to download in format DD/MM/YYYY")
+    date: str = Query(getNow(), description="Day to download in format DD/MM/YYYY"),
+    excel: bool = Query(rte.EXPORT_DAILY_EXCEL, description="Also store the raw day as .xlsx (slow)")
     ):
-    return rte.rte_daily_data(date)
+    return await run_io(rte.rte_daily_data, date, excel)
 
-@app.get("/load_openweathermap_forecasts", tags=["Openweathermap"])
-async def load_openweathermap_forecasts():
+@app.get("/rte_daily_backfill", 
+         tags=["RTE"],
+         summary="RTE get the daily data of a date range")
+async def rte_daily_backfill(
+    deb: str = Query(..., description="First day in format DD/MM/YYYY"),
+    fin: str | None = Query(None, description="Last day (included) in format DD/MM/YYYY, deb by default"),
+    excel: bool = Query(rte.EXPORT_DAILY_EXCEL, description="Also store the raw days as .xlsx (slow)"),
+    overwrite: bool = Query(False, description="Download again the days already stored")
+    ):
     """
-    Load Openweathermap data for forecasting
+    Download the daily curves of a date range concurrently, the days already
+    stored are skipped. Returns the rows stored per day, the skipped and the failed days.
     """
-    if not owm.is_openweathermap_data_already_downloaded():
-        try:
-            cities_coord = owm.get_city_data()
-            owm.load_openweathermap_data(cities_coord)
-            
-            return "Openweathermap data successfully uploaded"
+    try:
+        return await run_io(rte.rte_daily_backfill, deb, fin or deb, excel, overwrite)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        except Exception as e:
-            return e
-    
-    return "Openweathermap data is already downloaded today"
+@app.get("/load_openweathermap_forecasts", tags=["Openweathermap"], status_code=202)
+async def load_openweathermap_forecasts():
+    """
+    Load Openweathermap data for forecasting in the background, returns the job to follow with /jobs/{job_id}
+    """
+    return job_accepted(jobs.queue.submit("openweathermap"))
 
 @app.get("/openweathermap_last_download", tags=["Openweathermap"])
 async def openweathermap_last_download():
     """
     Get the date of the last downloaded version of Openweathermap data
     """
-    return owm.get_openweathermap_last_download()
+    return await run_io(owm.get_openweathermap_last_download)
 
-@app.get("/load_solar_data", tags=["Solar"])
+@app.get("/load_solar_data", tags=["Solar"], status_code=202)
 async def load_solar_data():
     """
-    Load Solar data
+    Load Solar data in the background, returns the job to follow with /jobs/{job_id}
     """
-    if not sol.is_solar_data_already_downloaded():
-        try:
-            sol.api_fetch_predi()
-            
-            return "Solar data successfully uploaded"
-
-        except Exception as e:
-            return e
+    return job_accepted(jobs.queue.submit("solar"))
 
 @app.get("/solar_last_download", tags=["Solar"])
 async def solar_last_download():
     """
     Get the date of the last downloaded version of Solar data
     """
-    return sol.get_solar_last_download()
+    return await run_io(sol.get_solar_last_download)
+
+@app.get("/jobs", tags=["Jobs"])
+async def list_jobs(source: str | None = Query(None, description="rte | openweathermap | solar, all by default")):
+    """
+    Ingestion jobs of this worker, most recent first
+    """
+    return [job.to_dict() for job in jobs.queue.list(source)]
+
+@app.get("/jobs/{job_id}", tags=["Jobs"])
+async def job_status(job_id: str):
+    """
+    Status, progress, duration and rows written of an ingestion job
+    """
+    job = jobs.queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job.to_dict()
@@ -1,40 +1,13 @@
-import mlflow 
-import uvicorn
 import pandas as pd 
-from pydantic import BaseModel
-from typing import Literal, List, Union
-from fastapi import FastAPI, File, UploadFile
-import joblib
-import boto3
-from dotenv import load_dotenv
-import os
+import json
+import numpy as np
+import clients
 
 def session_boto():
     """
-    create a boto session
+    S3 bucket of the project, shared by the process
     """
-    
-    load_dotenv()
-
-    API_KEY_S3 = os.environ["AWS_ACCESS_KEY_ID"]
-    API_SECRET_KEY_S3 = os.environ["AWS_SECRET_ACCESS_KEY"]
-
-    bucket_name = "renergies99-lead-bucket"
-    
-
-    # Liste des dossiers locaux à uploader
-    folders_to_upload = ["prod", "solar", "LandSat", "openweathermap"]
-
-    # Session Boto3
-    session = boto3.Session(
-        aws_access_key_id=API_KEY_S3,
-        aws_secret_access_key=API_SECRET_KEY_S3,
-        region_name="eu-west-3",
-    )
-
-    s3 = session.resource("s3")
-    bucket = s3.Bucket(bucket_name)
-    return bucket
+    return clients.s3_bucket()
 
 def to_boto(bucket, predi, key):
     s3_prefix = "public/prediction/" 
@@ -46,12 +19,26 @@ def to_boto(bucket, predi, key):
         # ACL = 'public-read-write'
     )
 
+# Artifact logged by the training run (see Model_func.log_error_table in 02_Modeles)
+ERROR_TABLE_ARTIFACT = "error_table.json"
+
+def read_error_table(path):
+   """
+   Read the error table artifact, returns the (edges, std) numpy arrays
+   """
+   with open(path, "r", encoding="utf-8") as f:
+      table = json.load(f)
+   return np.asarray(table["edges"], dtype=float), np.asarray(table["std"], dtype=float)
+
+def get_std_vector(predictions, edges, std):
+   """
+   Std of the error for a whole vector of predictions with a single lookup.
+   Bin i is ]edges[i], edges[i+1]], values outside the bins take the first / last std
+   """
+   index = np.searchsorted(edges[1:], np.asarray(predictions, dtype=float), side='left')
+   return std[np.clip(index, 0, len(std) - 1)]
+
 def get_std(x, table):
-   if x <= min(table['min']):
-      std = table['std'][0]
-   elif x > max(table['max']):
-      std = table['std'].iloc[-1]
-   else:
-      std = table[(x > table['min']) & (x <= table['max'])]['std'].values[0]
-   return std
+   edges = np.concatenate([[table['min'].min()], table['max'].to_numpy(dtype=float)])
+   return get_std_vector([x], edges, table['std'].to_numpy())[0]
 
@@ -0,0 +1,134 @@
+import io
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+PARQUET = "application/vnd.apache.parquet"
+
+CONTENT_TYPES = {
+    ARROW_STREAM: "arrow",
+    "application/vnd.apache.arrow.file": "arrow",
+    PARQUET: "parquet",
+    "application/x-parquet": "parquet",
+}
+
+MEDIA_TYPES = {
+    "arrow": ARROW_STREAM,
+    "parquet": PARQUET,
+}
+
+# Rows per record batch / row group in the streamed response
+BATCH_ROWS = 64 * 1024
+
+TIME_COLUMNS = ["time", "Date", "Time"]
+
+
+def body_format(content_type):
+    """
+    Return "arrow" or "parquet" from the Content-Type header of the request
+    """
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type not in CONTENT_TYPES:
+        raise ValueError(f"Unsupported content type '{content_type}', expected one of {sorted(CONTENT_TYPES)}")
+    return CONTENT_TYPES[media_type]
+
+
+def read_table(body, fmt):
+    """
+    Read an Arrow IPC (stream or file) or Parquet body into a pyarrow Table
+    """
+    if fmt == "parquet":
+        return pq.read_table(io.BytesIO(body))
+
+    try:
+        return pa.ipc.open_stream(body).read_all()
+    except pa.ArrowInvalid:
+        return pa.ipc.open_file(body).read_all()
+
+
+def model_input_names(model):
+    """
+    Input column names of the model signature, None if the model has no signature
+    """
+    try:
+        schema = model.metadata.get_input_schema()
+    except AttributeError:
+        return None
+    if schema is None or not schema.has_input_names():
+        return None
+    return schema.input_names()
+
+
+def split_features(table, input_names=None):
+    """
+    Validate the batch schema once and split it into (timestamps, features).
+
+    The time column (time, Date or Time) is mandatory. When the model has a
+    signature, every input column must be present and only those are kept.
+    """
+    time_column = next((c for c in TIME_COLUMNS if c in table.column_names), None)
+    if time_column is None:
+        raise ValueError(f"The batch must contain a time column, one of {TIME_COLUMNS}")
+
+    if input_names is None:
+        feature_names = [c for c in table.column_names if c != time_column]
+    else:
+        missing = [c for c in input_names if c not in table.column_names]
+        if missing:
+            raise ValueError(f"Missing model input columns: {missing}")
+        feature_names = list(input_names)
+
+    return table.select([time_column]), table.select(feature_names)
+
+
+def prediction_table(timestamps, prediction, error):
+    table = timestamps.append_column("prediction", pa.array(prediction, type=pa.float64()))
+    return table.append_column("error", pa.array(error, type=pa.float64()))
+
+
+class _Sink(io.RawIOBase):
+    """
+    Write-only file object collecting the bytes written since the last flush
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_batches(batches, schema, fmt):
+    """
+    Yield record batches encoded as Arrow IPC stream or Parquet, one chunk per batch / row group
+    """
+    sink = _Sink()
+
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+
+    for batch in batches:
+        writer.write_batch(batch)
+        yield sink.take()
+
+    writer.close()
+    yield sink.take()
+
+
+def stream_table(table, fmt, batch_rows=BATCH_ROWS):
+    """
+    Yield the table encoded as Arrow IPC stream or Parquet
+    """
+    return stream_batches(table.to_batches(max_chunksize=batch_rows), table.schema, fmt)
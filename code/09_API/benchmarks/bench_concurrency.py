@@ -0,0 +1,121 @@
+"""
+Latency of the light endpoints while a heavy endpoint is running.
+
+By default the app is served by uvicorn in a background thread, with the RTE
+load replaced by a blocking sleep, so no S3 / RTE access is needed:
+
+    python benchmarks/bench_concurrency.py
+    python benchmarks/bench_concurrency.py --inline   # blocking calls on the event loop (previous behaviour)
+
+Against a running API (the heavy endpoint really does its work):
+
+    python benchmarks/bench_concurrency.py --url http://localhost:7860
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+import httpx
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, q):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def measure_light(client, paths, nb_requests, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(path):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(path)
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one(paths[i % len(paths)]) for i in range(nb_requests)))
+    return latencies
+
+
+async def run(client, args):
+    results = {}
+
+    results["idle"] = await measure_light(client, args.light, args.requests, args.concurrency)
+
+    heavy = asyncio.create_task(client.get(args.heavy, timeout=None))
+    # let the heavy request reach the server before measuring
+    await asyncio.sleep(0.2)
+    results["during heavy"] = await measure_light(client, args.light, args.requests, args.concurrency)
+    await heavy
+
+    print(f"light endpoints: {', '.join(args.light)} - heavy endpoint: {args.heavy}")
+    print(f"{'':>14} {'n':>6} {'p50 (ms)':>10} {'p99 (ms)':>10} {'max (ms)':>10}")
+    for name, latencies in results.items():
+        print(f"{name:>14} {len(latencies):>6} {statistics.median(latencies):>10.1f} "
+              f"{percentile(latencies, 99):>10.1f} {max(latencies):>10.1f}")
+
+
+async def main_in_process(args):
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    os.environ.setdefault("DATABASE_URL", "postgresql://bench@localhost/bench")
+
+    import app as api
+
+    def heavy_load():
+        time.sleep(args.heavy_seconds)
+
+    async def inline(func, *a, **kw):
+        return func(*a, **kw)
+
+    with patch.object(api, "rte_load", heavy_load), \
+        patch("rte.is_rte_data_already_downloaded", return_value=False), \
+        patch("rte.get_rte_last_download", return_value="2026-01-01"), \
+        patch.object(api, "run_io", inline if args.inline else api.run_io):
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+
+        server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            await asyncio.sleep(0.05)
+
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+                await run(client, args)
+        finally:
+            server.should_exit = True
+            thread.join()
+
+
+async def main_remote(args):
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        await run(client, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="base url of a running API, local server with a simulated load if not set")
+    parser.add_argument("--heavy", default="/load_rte_data")
+    parser.add_argument("--light", nargs="+", default=["/", "/rte_last_download"])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--heavy-seconds", type=float, default=2.0, help="duration of the simulated load (local server only)")
+    parser.add_argument("--inline", action="store_true", help="call blocking code on the event loop (local server only)")
+    args = parser.parse_args()
+
+    asyncio.run(main_remote(args) if args.url else main_in_process(args))
@@ -0,0 +1,84 @@
+"""
+Cold import time of the API, with a per-package breakdown.
+
+Imports the module in fresh interpreters with -X importtime and reports the
+median total and the cumulative time of the slowest top-level packages:
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --module app --top 15 --runs 5 --json import_time.json
+
+The heavy libraries (mlflow, sklearn, pvlib, seaborn, matplotlib, boto3,
+sqlalchemy) must not show up: they are imported by the endpoints using them.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WATCHED = ["mlflow", "sklearn", "pvlib", "seaborn", "matplotlib", "plotly", "boto3", "botocore", "sqlalchemy"]
+
+
+def import_times(module):
+    """
+    {top-level package: cumulative import time in ms} of one cold import of module,
+    and the set of all the packages it loaded
+    """
+    env = dict(os.environ)
+    env.setdefault("AWS_ACCESS_KEY_ID", "x")
+    env.setdefault("AWS_SECRET_ACCESS_KEY", "x")
+    env.setdefault("DATABASE_URL", "postgresql://x")
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=API_DIR, env=env, capture_output=True, text=True, check=True
+    )
+
+    times = {}
+    loaded = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.rstrip()
+        loaded.add(name.strip().split(".")[0])
+        # only the packages imported directly by module (first nesting levels)
+        if len(name) - len(name.lstrip()) > 4:
+            continue
+        package = name.strip().split(".")[0]
+        times[package] = max(times.get(package, 0), int(cumulative) / 1000)
+
+    return times, loaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--json", default=None, help="Write the results to this file, to track them over time")
+    args = parser.parse_args()
+
+    runs, loaded = [], set()
+    for _ in range(args.runs):
+        times, packages = import_times(args.module)
+        runs.append(times)
+        loaded |= packages
+
+    packages = {package for run in runs for package in run}
+    median = {package: statistics.median(run.get(package, 0) for run in runs) for package in packages}
+    total = median.pop(args.module, 0)
+
+    print(f"import {args.module}: {total:.0f} ms (median of {args.runs} cold starts)")
+    for package, ms in sorted(median.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {package:<30} {ms:8.1f} ms")
+
+    heavy = [package for package in WATCHED if package in loaded]
+    print(f"heavy libraries imported at startup: {heavy or 'none'}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"module": args.module, "total_ms": total, "packages": median, "heavy": heavy}, f, indent=2)
@@ -0,0 +1,50 @@
+"""
+Full-history export of /rte_data: rows/s and peak RSS.
+
+Runs the CSV generator of /rte_data directly against DATABASE_URL:
+
+    python benchmarks/bench_rte_export.py --type rte_national --deb 2012
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--type", default="rte_national", choices=["rte_national", "rte_regional"])
+    parser.add_argument("--deb", type=int, default=2012)
+    parser.add_argument("--fin", type=int, default=datetime.now().year)
+    parser.add_argument("--chunk-rows", type=int, default=None)
+    args = parser.parse_args()
+
+    import rte
+
+    chunk_rows = args.chunk_rows or rte.CSV_CHUNK_ROWS
+    rss_before = peak_rss_mb()
+
+    started = time.perf_counter()
+    nb_rows = nb_bytes = nb_chunks = 0
+    for chunk in rte.rte_csv_chunks(args.deb, args.fin, args.type, chunk_rows=chunk_rows):
+        nb_chunks += 1
+        nb_rows += chunk.count("\n")
+        nb_bytes += len(chunk.encode("utf-8"))
+    elapsed = time.perf_counter() - started
+
+    nb_rows -= 1  # header
+    print(f"{args.type} {args.deb}-{args.fin}, chunks of {chunk_rows} rows")
+    print(f"rows      : {nb_rows}")
+    print(f"size      : {nb_bytes / 1024 ** 2:.1f} MB in {nb_chunks} chunks")
+    print(f"duration  : {elapsed:.2f} s")
+    print(f"rows/s    : {nb_rows / elapsed:,.0f}")
+    print(f"peak RSS  : {peak_rss_mb():.0f} MB (before export: {rss_before:.0f} MB)")
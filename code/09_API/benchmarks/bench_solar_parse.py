@@ -0,0 +1,146 @@
+"""
+NOAA daypre.txt parsing: solar.solar_predi_parse against the previous parser.
+
+Parses every file of the corpus (benchmarks/data/daypre) with both parsers,
+checks that they give the same frame and reports the time per file:
+
+    python benchmarks/bench_solar_parse.py
+    python benchmarks/bench_solar_parse.py --repeat 500
+
+--download adds the files of a date range from NOAA to the corpus:
+
+    python benchmarks/bench_solar_parse.py --download 2025-01-01 2025-01-31
+
+The synthetic-*daypre.txt files of the corpus were written by hand in the
+daypre.txt layout, NOAA could not be reached when it was built. Same frames
+on them does not prove that both parsers agree on the real files: without a
+downloaded file the timings are still reported, but the parity is not, and
+the exit status is 1.
+"""
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(API_DIR, "benchmarks", "data", "daypre")
+
+sys.path.insert(0, API_DIR)
+
+
+# ---- previous parser, kept as the reference ----
+
+def legacy_get_date(info):
+    day = info[2].split()
+    ind = [f'{day[x]}-{day[x+1]}-{day[x+2]}' for x in range(0,len(day), 3)]
+    ind = pd.to_datetime(ind)
+    return ind
+
+def legacy_get_data(info):
+
+    data = []
+    info_joined = ' '.join(info)
+    info_split = info_joined.splitlines()[2:]
+    for line in info_split:
+        if 'Solar' in info_joined:
+            data.append([float(x) for x in line.split()])
+        else:
+            data.append([float(x) for x in line.split()[1:]])
+        df_temp = pd.DataFrame(data)
+    return df_temp.mean().tolist()
+
+def legacy_solar_predi_parse(text):
+    col_name = {
+        'Geomagnetic_A_indices' : 'Ap',
+        'Pred_Mid_k' : 'K index Planetary',
+        '10cm_flux' : '10cm'
+    }
+    test_split = text.split('#')[6:]
+    for i in range(0, len(test_split), 2):
+        if len(test_split[i]) > 3:
+            info = test_split[i].split(':')
+            if i == 0:
+                ind = legacy_get_date(info)
+                print(ind)
+                data = legacy_get_data(info[4:])
+                df = pd.DataFrame(data, columns=[info[3]], index=ind)
+                df['date'] = ind
+                print(df)
+            else:
+                print(info)
+                if info[1] not in ['Polar_cap', 'Reg_Prob']:
+                    data = legacy_get_data(info)
+                    print(data)
+                    df[info[1]] = data
+
+    df = df.rename(columns=col_name)
+    return df
+
+
+def download(first, last):
+    import solar
+
+    base_url = 'https://www.ngdc.noaa.gov/stp/space-weather/swpc-products/daily_reports/daypre'
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    day = first
+    while day <= last:
+        text, _ = solar.req_solar(base_url, day, "predi")
+        if text:
+            with open(os.path.join(CORPUS_DIR, f"{day:%Y%m%d}daypre.txt"), "w") as f:
+                f.write(text)
+        day += timedelta(days=1)
+
+
+def time_per_file(parse, texts, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            parse(text)
+    return (time.perf_counter() - started) / (repeat * len(texts))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--download", nargs=2, metavar=("FIRST", "LAST"), default=None,
+                        help="Add the daypre.txt files of these days (YYYY-MM-DD) to the corpus")
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "x")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "x")
+    import solar
+
+    if args.download:
+        download(date.fromisoformat(args.download[0]), date.fromisoformat(args.download[1]))
+
+    texts = []
+    paths = sorted(glob.glob(os.path.join(CORPUS_DIR, "*daypre.txt")))
+    for path in paths:
+        with open(path) as f:
+            texts.append(f.read())
+    synthetic = sum(os.path.basename(path).startswith("synthetic-") for path in paths)
+
+    # the previous parser prints its intermediates
+    with contextlib.redirect_stdout(io.StringIO()):
+        for text in texts:
+            pd.testing.assert_frame_equal(legacy_solar_predi_parse(text), solar.solar_predi_parse(text), check_freq=False)
+        legacy = time_per_file(legacy_solar_predi_parse, texts, args.repeat)
+    current = time_per_file(solar.solar_predi_parse, texts, args.repeat)
+
+    real = len(texts) - synthetic
+    if real:
+        print(f"{len(texts)} files ({synthetic} synthetic, {real} from NOAA), same frames with both parsers")
+    else:
+        print(f"{len(texts)} synthetic files only: parity with the previous parser NOT established, "
+              f"add NOAA files with --download")
+    print(f"  previous parser  {legacy * 1000:8.3f} ms/file")
+    print(f"  single pass      {current * 1000:8.3f} ms/file  (x{legacy / current:.1f})")
+
+    if not real:
+        sys.exit(1)
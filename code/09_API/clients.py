@@ -0,0 +1,85 @@
+import os
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REGION = "eu-west-3"
+BUCKET = "renergies99-lead-bucket"
+
+# Connections kept open per host by the shared HTTP session
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _get(name, create):
+    client = _clients.get(name)
+    if client is not None:
+        return client
+
+    with _lock:
+        if name not in _clients:
+            _clients[name] = create()
+        return _clients[name]
+
+
+def _session():
+    # boto3 is only imported when a client is first needed
+    import boto3
+
+    return boto3.Session(
+        aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
+        aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"],
+        region_name=REGION,
+    )
+
+
+def s3_client():
+    """
+    S3 client shared by the process, created on first use
+    """
+    return _get("s3_client", lambda: _session().client("s3"))
+
+
+def s3_bucket(name=BUCKET):
+    """
+    S3 Bucket resource shared by the process, created on first use
+    """
+    return _get(("s3_bucket", name), lambda: _session().resource("s3").Bucket(name))
+
+
+def http_session(pool_size=HTTP_POOL_SIZE):
+    """
+    requests Session shared by the process: keep-alive connections reused by
+    all the threads calling the same hosts
+    """
+    def create():
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    return _get("http_session", create)
+
+
+def clear():
+    with _lock:
+        _clients.clear()
+
+
+def _after_fork_in_child():
+    global _lock
+    # boto3 clients and HTTP connections must not be shared with a forked worker
+    _lock = threading.Lock()
+    _clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Pool settings, to be sized with the statistics of /db_pool_stats
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+_engine = None
+_engine_pid = None
+_lock = threading.Lock()
+
+_wait_stats = {"connections": 0, "timeouts": 0, "total_wait": 0.0, "max_wait": 0.0}
+_stats_lock = threading.Lock()
+
+
+def _create_engine():
+    # sqlalchemy is imported with the first connection, not when the API starts
+    from sqlalchemy import create_engine
+
+    return create_engine(
+        os.environ["DATABASE_URL"],
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+def get_engine():
+    """
+    Return the engine of the process, created on first use.
+
+    A worker forked from a process that already had an engine gets its own:
+    the connections inherited from the parent are left to it (dispose(close=False)).
+    """
+    global _engine, _engine_pid
+
+    engine = _engine
+    if engine is not None and _engine_pid == os.getpid():
+        return engine
+
+    with _lock:
+        if _engine is not None and _engine_pid != os.getpid():
+            _engine.dispose(close=False)
+            _engine = None
+
+        if _engine is None:
+            _engine = _create_engine()
+            _engine_pid = os.getpid()
+
+        return _engine
+
+
+def _after_fork_in_child():
+    global _lock, _stats_lock
+    # the locks may have been held by another thread of the parent at fork time
+    _lock = threading.Lock()
+    _stats_lock = threading.Lock()
+    _wait_stats.update({"connections": 0, "timeouts": 0, "total_wait": 0.0, "max_wait": 0.0})
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+@contextmanager
+def connect():
+    """
+    engine.connect() recording the time spent waiting for a connection of the pool
+    """
+    from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+    engine = get_engine()
+
+    started = time.perf_counter()
+    try:
+        conn = engine.connect()
+    except PoolTimeoutError:
+        with _stats_lock:
+            _wait_stats["timeouts"] += 1
+        raise
+    wait = time.perf_counter() - started
+
+    with _stats_lock:
+        _wait_stats["connections"] += 1
+        _wait_stats["total_wait"] += wait
+        _wait_stats["max_wait"] = max(_wait_stats["max_wait"], wait)
+
+    with conn:
+        yield conn
+
+
+def pool_stats():
+    """
+    Statistics of the connection pool of the process
+    """
+    stats = {
+        "pid": os.getpid(),
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "connections": _wait_stats["connections"],
+        "timeouts": _wait_stats["timeouts"],
+        "avg_wait_ms": 1000 * _wait_stats["total_wait"] / max(_wait_stats["connections"], 1),
+        "max_wait_ms": 1000 * _wait_stats["max_wait"],
+    }
+
+    if _engine is not None and _engine_pid == os.getpid():
+        pool = _engine.pool
+        stats.update({
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+        })
+    else:
+        stats.update({"checked_out": 0, "checked_in": 0, "overflow": 0})
+
+    return stats
@@ -0,0 +1,56 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# Blocking I/O (S3, HTTP, database) runs in a bounded thread pool,
+# CPU-heavy preparation (pvlib, merges) in a process pool so that the
+# event loop keeps serving the light endpoints
+IO_WORKERS = int(os.getenv("API_IO_WORKERS", "16"))
+CPU_WORKERS = int(os.getenv("API_CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_io_pool = None
+_cpu_pool = None
+
+
+def io_pool():
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="api-io")
+    return _io_pool
+
+
+def cpu_pool():
+    global _cpu_pool
+    if _cpu_pool is None:
+        # spawn: forking a process that runs threads (event loop, I/O pool) is not safe
+        _cpu_pool = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _cpu_pool
+
+
+async def run_io(func, *args, **kwargs):
+    """
+    Run a blocking function in the I/O thread pool
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_pool(), functools.partial(func, *args, **kwargs))
+
+
+async def run_cpu(func, *args, **kwargs):
+    """
+    Run a CPU-bound function in the process pool.
+    The function and its arguments must be picklable (module-level function).
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_pool(), functools.partial(func, *args, **kwargs))
+
+
+def shutdown():
+    global _io_pool, _cpu_pool
+    if _io_pool is not None:
+        _io_pool.shutdown(wait=False, cancel_futures=True)
+        _io_pool = None
+    if _cpu_pool is not None:
+        _cpu_pool.shutdown(wait=False, cancel_futures=True)
+        _cpu_pool = None
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+from dotenv import load_dotenv
+
+import clients
+
+load_dotenv()
+
+bucket = clients.BUCKET
+
+MANIFEST_KEY = "public/freshness.json"
+
+# Seconds during which a worker serves its copy of the manifest without reading S3
+FRESHNESS_TTL = float(os.getenv("FRESHNESS_TTL", "60"))
+
+# Attempts of a manifest write when another worker updated it in between
+MANIFEST_WRITE_RETRIES = int(os.getenv("FRESHNESS_WRITE_RETRIES", "5"))
+
+# S3 error codes of a conditional write that lost the race
+CONFLICT_CODES = ("PreconditionFailed", "ConditionalRequestConflict", "412", "409")
+
+# Marker objects written before the manifest existed, read once to build it
+LEGACY_MARKERS = {
+    "rte": "public/prod/rte_last_download",
+    "openweathermap": "public/openweathermap/openweathermap_last_download",
+    "solar": "public/solar/solar_last_download",
+    "prediction": "public/prediction/predi_last_download",
+}
+
+
+def df_hash(df):
+    """
+    Content hash of a dataframe, computed column-wise without serializing it
+    """
+    hashes = pd.util.hash_pandas_object(df, index=False).values
+    return hashlib.sha256(hashes.tobytes()).hexdigest()
+
+
+class FreshnessManifest:
+    """
+    Last download date, row count and content hash of every data source,
+    stored in a single S3 object and kept in memory for ttl seconds.
+
+    A write updates the S3 object and the copy of the process at once; the
+    other workers see it when their copy expires. The object is written only if
+    it has not changed since it was read (If-Match on its ETag), otherwise it is
+    read again and the write retried, so concurrent records are all kept.
+    """
+
+    def __init__(self, key=MANIFEST_KEY, ttl=FRESHNESS_TTL, client=None):
+        self.key = key
+        self.ttl = ttl
+        self._client = client
+        self._manifest = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def client(self):
+        if self._client is None:
+            self._client = clients.s3_client()
+        return self._client
+
+    def _read_object(self, key):
+        obj = self.client().get_object(Bucket=bucket, Key=key)
+        return obj["Body"].read().decode("utf-8")
+
+    def _read_legacy_markers(self):
+        manifest = {}
+        for source, key in LEGACY_MARKERS.items():
+            try:
+                manifest[source] = {"last_download": self._read_object(key).strip()}
+            except Exception:
+                continue
+        return manifest
+
+    def _read_with_etag(self):
+        """
+        The manifest and the ETag of its object (None when it does not exist yet)
+        """
+        from botocore.exceptions import ClientError
+
+        try:
+            obj = self.client().get_object(Bucket=bucket, Key=self.key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+                raise
+            logging.info("No freshness manifest yet, built from the last download markers")
+            return self._read_legacy_markers(), None
+        return json.loads(obj["Body"].read().decode("utf-8")), obj.get("ETag")
+
+    def _read(self):
+        return self._read_with_etag()[0]
+
+    def _write(self, manifest, etag):
+        """
+        Write the manifest if its object still has etag, returns False if another write came first
+        """
+        from botocore.exceptions import ClientError
+
+        condition = {"IfMatch": etag} if etag is not None else {"IfNoneMatch": "*"}
+        try:
+            self.client().put_object(
+                Bucket=bucket,
+                Key=self.key,
+                Body=json.dumps(manifest, indent=2).encode("utf-8"),
+                ContentType="application/json",
+                **condition
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in CONFLICT_CODES:
+                raise
+            return False
+        return True
+
+    def get(self):
+        """
+        The manifest, read from S3 at most once per ttl seconds
+        """
+        manifest = self._manifest
+        if manifest is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return manifest
+
+        with self._lock:
+            if self._manifest is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return self._manifest
+            try:
+                self._manifest = self._read()
+            except Exception as e:
+                logging.error(f"Cannot read the freshness manifest: {e}")
+                if self._manifest is None:
+                    return {}
+            # on error the previous copy is served until the next ttl
+            self._loaded_at = time.monotonic()
+            return self._manifest
+
+    def last_download(self, source):
+        return self.get().get(source, {}).get("last_download")
+
+    def record(self, source, df=None, last_download=None):
+        """
+        Record a new download of source (with the rows and hash of df) and write the manifest
+        """
+        entry = {
+            "last_download": last_download or datetime.now().strftime("%Y-%m-%d"),
+            "updated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        if df is not None:
+            entry.update({"rows": len(df), "hash": df_hash(df)})
+
+        with self._lock:
+            for attempt in range(MANIFEST_WRITE_RETRIES):
+                manifest, etag = self._read_with_etag()
+                manifest[source] = entry
+                if self._write(manifest, etag):
+                    break
+                logging.warning(f"Freshness manifest changed during the record of {source}, retry")
+                time.sleep(0.1 * 2 ** attempt)
+            else:
+                raise RuntimeError(f"Cannot record {source} in the freshness manifest: "
+                                   f"{MANIFEST_WRITE_RETRIES} concurrent updates")
+
+            self._manifest = manifest
+            self._loaded_at = time.monotonic()
+
+        return entry
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+
+
+manifest = FreshnessManifest()
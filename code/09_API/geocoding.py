@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+import re
+import unicodedata
+from datetime import datetime, timedelta
+
+import clients
+import ratelimit
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+
+headers = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
+}
+
+GEOCODING_KEY = "public/openweathermap/cities.json"
+
+# Format of the cache: {"version": 2, "cities": {normalized name: entry}}.
+# Version 1 was the {nominatim name: {"lat", "lon"}} blob of get_city_data
+CACHE_VERSION = 2
+
+# Age after which an entry is looked up again, the old coordinates are kept if it fails
+GEOCODING_MAX_AGE_DAYS = int(os.getenv("GEOCODING_MAX_AGE_DAYS", "365"))
+
+# Nominatim usage policy: at most 1 request per second
+NOMINATIM_REQUESTS_PER_S = float(os.getenv("NOMINATIM_REQUESTS_PER_S", "1"))
+
+
+def normalize_city(name):
+    """
+    Cache key of a city: "Saint-Étienne " -> "saint etienne"
+    """
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return re.sub(r"[\s\-_']+", " ", name).strip().lower()
+
+
+def migrate(content):
+    """
+    Entries of a cache content, whatever its version
+    """
+    if content.get("version") == CACHE_VERSION:
+        return content["cities"]
+
+    # version 1: the coordinates are kept, dated from the migration
+    today = datetime.now().strftime("%Y-%m-%d")
+    return {
+        normalize_city(name): {"name": name, "lat": coords["lat"], "lon": coords["lon"], "updated_at": today}
+        for name, coords in content.items()
+    }
+
+
+def is_stale(entry, max_age_days=GEOCODING_MAX_AGE_DAYS):
+    updated_at = datetime.strptime(entry["updated_at"], "%Y-%m-%d")
+    return datetime.now() - updated_at > timedelta(days=max_age_days)
+
+
+def lookup(city, session=None, limiter=None, country="france"):
+    """
+    First Nominatim hit for city as a cache entry, None if not found
+    """
+    session = session or clients.http_session()
+    limiter = limiter or ratelimit.host_limiter(NOMINATIM_URL, NOMINATIM_REQUESTS_PER_S)
+
+    params = {"format": "json", "limit": 1, "q": f"{city},{country}"}
+    hits = ratelimit.get_with_retry(session, NOMINATIM_URL, limiter, params=params, headers=headers).json()
+    if not hits:
+        return None
+
+    return {"name": hits[0]["name"], "lat": hits[0]["lat"], "lon": hits[0]["lon"],
+            "updated_at": datetime.now().strftime("%Y-%m-%d")}
+
+
+def lookup_batch(cities):
+    """
+    Look up the cities in a single throttled pass, {normalized name: entry} of the ones found
+    """
+    found = {}
+    for city in cities:
+        try:
+            logging.info(f"get data for : {city}")
+            entry = lookup(city)
+        except Exception as e:
+            logging.error(f"Error fetching data for {city}: {e}")
+            continue
+        if entry is None:
+            logging.error(f"No coordinates found for {city}")
+            continue
+        found[normalize_city(city)] = entry
+    return found
+
+
+class GeocodingCache:
+    """
+    Coordinates of the cities stored in S3, one entry per normalized city name.
+
+    Only the unknown and the stale cities are looked up, then merged into the
+    content read again just before the write so that concurrent updates are kept.
+    """
+
+    def __init__(self, key=GEOCODING_KEY, client=None, max_age_days=GEOCODING_MAX_AGE_DAYS):
+        self.key = key
+        self.max_age_days = max_age_days
+        self._client = client
+
+    def client(self):
+        if self._client is None:
+            self._client = clients.s3_client()
+        return self._client
+
+    def _read(self):
+        from botocore.exceptions import ClientError
+
+        try:
+            obj = self.client().get_object(Bucket=clients.BUCKET, Key=self.key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+                raise
+            return {"version": CACHE_VERSION, "cities": {}}
+        return json.loads(obj["Body"].read())
+
+    def _write(self, entries):
+        content = {"version": CACHE_VERSION, "cities": dict(sorted(entries.items()))}
+        self.client().put_object(
+            Bucket=clients.BUCKET,
+            Key=self.key,
+            Body=json.dumps(content, ensure_ascii=False, indent=4).encode("utf-8"),
+            ContentType="application/json"
+        )
+
+    def coordinates(self, cities):
+        """
+        {nominatim name: {"lat", "lon"}} of the cities, in their order
+        """
+        content = self._read()
+        entries = migrate(content)
+        todo = [city for city in cities
+                if normalize_city(city) not in entries or is_stale(entries[normalize_city(city)], self.max_age_days)]
+
+        found = {}
+        if todo:
+            logging.info(f"Geocoding {len(todo)} of {len(cities)} cities")
+            found = lookup_batch(todo)
+
+        if found or content.get("version") != CACHE_VERSION:
+            entries = {**migrate(self._read()), **found}
+            self._write(entries)
+
+        res = {}
+        for city in cities:
+            entry = entries.get(normalize_city(city))
+            if entry is not None:
+                res[entry["name"]] = {"lat": entry["lat"], "lon": entry["lon"]}
+        return res
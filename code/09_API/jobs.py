@@ -0,0 +1,320 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# Jobs of a source run at the same time, JOBS_CONCURRENCY_<SOURCE> overrides it per source
+DEFAULT_CONCURRENCY = int(os.getenv("JOBS_CONCURRENCY", "1"))
+
+# Finished jobs kept in memory for /jobs/{id}
+JOBS_HISTORY = int(os.getenv("JOBS_HISTORY", "200"))
+
+# Locks and job states shared by the workers of the host
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(tempfile.gettempdir(), "renergies-jobs"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def _write_json(path, content):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(content, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class FileLock:
+    """
+    Exclusive lock on a file, shared by the processes of the host and released
+    by the system if its holder dies
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self, blocking=True):
+        import fcntl
+
+        f = open(self.path, "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        import fcntl
+
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+def source_concurrency(source):
+    return int(os.getenv(f"JOBS_CONCURRENCY_{source.upper()}", str(DEFAULT_CONCURRENCY)))
+
+
+class Job:
+    """
+    State of one ingestion run, updated by the worker thread running it
+    """
+
+    def __init__(self, source, key=None, state_path=None):
+        self.id = uuid.uuid4().hex
+        self.source = source
+        self.key = key
+        self.state_path = state_path
+        self.status = QUEUED
+        self.created_at = _now()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = 0.0
+        self.message = None
+        self.rows = None
+        self.error = None
+        self._start = None
+        self._duration = None
+        # held from the submission to the end of the job
+        self._running_lock = None
+
+    def save(self):
+        """
+        Write the state of the job for the other workers
+        """
+        if self.state_path is not None:
+            _write_json(self.state_path, self.to_dict())
+
+    def step(self, progress, message):
+        """
+        Report the progress (0 to 1) of the job and what it is doing
+        """
+        self.progress = progress
+        self.message = message
+        logging.info(f"Job {self.source} {self.id}: {message}")
+        self.save()
+
+    @property
+    def done(self):
+        return self.status in (SUCCEEDED, FAILED)
+
+    def duration(self):
+        if self._duration is not None:
+            return self._duration
+        if self._start is not None:
+            return time.perf_counter() - self._start
+        return None
+
+    def to_dict(self):
+        duration = self.duration()
+        return {
+            "job_id": self.id,
+            "source": self.source,
+            "status": self.status,
+            "progress": round(self.progress, 3),
+            "message": self.message,
+            "rows": self.rows,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration_s": None if duration is None else round(duration, 3),
+        }
+
+
+class StoredJob:
+    """
+    Job run by another worker, read from its state file
+    """
+
+    def __init__(self, state_path, state):
+        self.state_path = state_path
+        self.id = state["job_id"]
+        self.source = state["source"]
+        self._state = state
+
+    @property
+    def done(self):
+        return self._state["status"] in (SUCCEEDED, FAILED)
+
+    def to_dict(self):
+        if not self.done:
+            self._state = _read_json(self.state_path) or self._state
+        return dict(self._state)
+
+
+class JobQueue:
+    """
+    Run the ingestion jobs off the request path, in one bounded thread pool per source.
+
+    A job function receives the Job to report its progress and returns the number
+    of rows it wrote. Submitting a job identical to a queued or running one (same
+    source and arguments) returns that job instead of doing the same work twice,
+    also when it runs in another worker process: the in-flight job of every
+    (source, arguments) is recorded in state_dir under a file lock, and its holder
+    keeps a second lock until the job ends so that a dead worker is detected.
+    """
+
+    def __init__(self, history=JOBS_HISTORY, state_dir=JOBS_DIR):
+        self.history = history
+        self.state_dir = state_dir
+        self._functions = {}
+        self._pools = {}
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, source, func, concurrency=None):
+        self._functions[source] = (func, concurrency or source_concurrency(source))
+
+    def _pool(self, source):
+        if source not in self._pools:
+            _, concurrency = self._functions[source]
+            self._pools[source] = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"job-{source}")
+        return self._pools[source]
+
+    def _path(self, name):
+        return os.path.join(self.state_dir, name)
+
+    def _in_flight_elsewhere(self, key_id):
+        """
+        Job of another worker for the same key, still queued or running
+        """
+        job_id = _read_json(self._path(f"{key_id}.current"))
+        state = _read_json(self._path(f"{job_id}.json")) if job_id else None
+        if state is None or state["status"] in (SUCCEEDED, FAILED):
+            return None
+
+        running_lock = FileLock(self._path(f"{key_id}.running"))
+        if running_lock.acquire(blocking=False):
+            # nobody holds it any more: the worker died during the job
+            running_lock.release()
+            state.update(status=FAILED, error="Worker stopped during the job", finished_at=_now())
+            _write_json(self._path(f"{job_id}.json"), state)
+            return None
+
+        return StoredJob(self._path(f"{job_id}.json"), state)
+
+    def _run(self, job, func, args, kwargs):
+        job.status = RUNNING
+        job.started_at = _now()
+        job._start = time.perf_counter()
+        job.save()
+        try:
+            job.rows = func(job, *args, **kwargs)
+            job.progress = 1.0
+            job.status = SUCCEEDED
+        except Exception as e:
+            logging.exception(f"Job {job.source} {job.id} failed")
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = FAILED
+        finally:
+            job._duration = time.perf_counter() - job._start
+            job.finished_at = _now()
+            job.save()
+            job._running_lock.release()
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+            job = self._jobs.pop(job_id)
+            if job.state_path is not None and os.path.exists(job.state_path):
+                os.remove(job.state_path)
+
+    def submit(self, source, *args, **kwargs):
+        """
+        Enqueue a job of source and return it at once
+        """
+        if source not in self._functions:
+            raise KeyError(f"Unknown job source {source}")
+
+        key = (source, args, tuple(sorted(kwargs.items())))
+        key_id = f"{source}-{hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]}"
+        os.makedirs(self.state_dir, exist_ok=True)
+
+        with self._lock:
+            for job in self._jobs.values():
+                if job.key == key and not job.done:
+                    return job
+
+            with FileLock(self._path(f"{key_id}.lock")):
+                in_flight = self._in_flight_elsewhere(key_id)
+                if in_flight is not None:
+                    logging.info(f"Job {source} {in_flight.id} already in flight in another worker")
+                    return in_flight
+
+                job = Job(source, key)
+                job.state_path = self._path(f"{job.id}.json")
+                job._running_lock = FileLock(self._path(f"{key_id}.running"))
+                job._running_lock.acquire()
+                job.save()
+                _write_json(self._path(f"{key_id}.current"), job.id)
+
+            self._jobs[job.id] = job
+            self._forget_finished()
+
+            func, _ = self._functions[source]
+            self._pool(source).submit(self._run, job, func, args, kwargs)
+
+        return job
+
+    def get(self, job_id):
+        """
+        Job of this worker, or of another one from its state file
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+
+        path = self._path(f"{os.path.basename(job_id)}.json")
+        state = _read_json(path)
+        return None if state is None else StoredJob(path, state)
+
+    def list(self, source=None):
+        return [job for job in reversed(self._jobs.values()) if source is None or job.source == source]
+
+    def shutdown(self, wait=False):
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait, cancel_futures=True)
+        self._pools.clear()
+
+        with self._lock:
+            for job in self._jobs.values():
+                if job.status == QUEUED:
+                    job.status, job.error, job.finished_at = FAILED, "Cancelled at shutdown", _now()
+                    job.save()
+                    job._running_lock.release()
+
+
+queue = JobQueue()
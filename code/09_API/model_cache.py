@@ -0,0 +1,287 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+
+
+# Shared by every worker and every restart on the same host
+CACHE_DIR = os.getenv("MODEL_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "renergies", "models"))
+CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def tree_checksums(root):
+    """
+    Return {relative path: sha256} for every file under root
+    """
+    checksums = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            checksums[os.path.relpath(path, root)] = file_sha256(path)
+    return checksums
+
+
+def tree_stats(root):
+    """
+    Return {relative path: [size, mtime_ns]} for every file under root, without reading them
+    """
+    stats = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            stat = os.stat(path)
+            stats[os.path.relpath(path, root)] = [stat.st_size, stat.st_mtime_ns]
+    return stats
+
+
+def tree_digest(checksums):
+    h = hashlib.sha256()
+    for relpath in sorted(checksums):
+        h.update(f"{relpath}\0{checksums[relpath]}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+class ArtifactCache:
+    """
+    Content-addressed on-disk cache of model artifacts.
+
+    Layout under root:
+    - objects/<digest>/ : an artifact tree, named by the hash of its content
+    - refs/<key>.json   : key (model name + version or run id) -> digest, file checksums,
+                          sizes and modification times
+    - .lock             : inter-process lock held while the cache is modified
+
+    The modification time of a ref is its last access, used for the LRU eviction.
+    A hit is served without the lock: the files are hashed again only when their
+    size or modification time differ from the ref. A miss downloads and hashes
+    without the lock too, which is only taken to move the tree in place.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(root, "objects")
+        self.refs_dir = os.path.join(root, "refs")
+        self.tmp_dir = os.path.join(root, "tmp")
+
+        for folder in (self.objects_dir, self.refs_dir, self.tmp_dir):
+            os.makedirs(folder, exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        with open(os.path.join(self.root, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _ref_path(self, key):
+        safe_key = key.replace("/", "__").replace(":", "_")
+        return os.path.join(self.refs_dir, f"{safe_key}.json")
+
+    def _read_ref(self, key):
+        try:
+            with open(self._ref_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_ref(self, key, ref):
+        path = self._ref_path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(ref, f)
+        os.replace(tmp_path, path)
+
+    def _is_valid(self, ref):
+        object_path = os.path.join(self.objects_dir, ref["digest"])
+        if not os.path.isdir(object_path):
+            return False
+        stats = tree_stats(object_path)
+        if stats == ref.get("stats"):
+            return True
+        # files touched since the ref was written: compare their content
+        if tree_checksums(object_path) != ref["files"]:
+            return False
+        # a ref pointing to an evicted tree is detected by the next lookup
+        self._write_ref(ref["key"], dict(ref, stats=stats))
+        return True
+
+    def _hit(self, key):
+        """
+        Path of the valid cached tree of key, None on a miss
+        """
+        ref = self._read_ref(key)
+        if ref is None:
+            return None
+        try:
+            if not self._is_valid(ref):
+                return None
+            os.utime(self._ref_path(key))
+        except FileNotFoundError:
+            # evicted in between
+            return None
+        return os.path.join(self.objects_dir, ref["digest"])
+
+    def get(self, key, download):
+        """
+        Return the local path of the artifacts stored under key.
+
+        download(dst_dir) is only called on a miss (or a corrupted entry): it must
+        download the artifacts under dst_dir and return the path of the downloaded tree.
+        """
+        path = self._hit(key)
+        if path is not None:
+            return path
+
+        if self._read_ref(key) is not None:
+            logging.warning(f"Checksum mismatch for cached artifacts {key}, download them again")
+
+        work_dir = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        os.makedirs(work_dir)
+        try:
+            downloaded = download(work_dir)
+            checksums = tree_checksums(downloaded)
+            digest = tree_digest(checksums)
+            object_path = os.path.join(self.objects_dir, digest)
+
+            with self._locked():
+                # another worker may have stored it during the download
+                path = self._hit(key)
+                if path is not None:
+                    return path
+
+                if os.path.isdir(object_path) and tree_checksums(object_path) != checksums:
+                    shutil.rmtree(object_path)
+                if not os.path.isdir(object_path):
+                    os.replace(downloaded, object_path)
+
+                stats = tree_stats(object_path)
+                size = sum(size for size, _ in stats.values())
+                self._write_ref(key, {"key": key, "digest": digest, "files": checksums, "stats": stats, "size": size})
+                self._evict(keep=digest)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        return object_path
+
+    def _evict(self, keep):
+        """
+        Remove the least recently used objects until the cache fits in max_bytes
+        """
+        last_used = {}
+        sizes = {}
+        refs_by_digest = {}
+        for filename in os.listdir(self.refs_dir):
+            path = os.path.join(self.refs_dir, filename)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    ref = json.load(f)
+                mtime = os.path.getmtime(path)
+            except (OSError, ValueError):
+                continue
+            digest = ref["digest"]
+            last_used[digest] = max(last_used.get(digest, 0), mtime)
+            sizes[digest] = ref["size"]
+            refs_by_digest.setdefault(digest, []).append(path)
+
+        total = sum(sizes.values())
+        for digest in sorted(last_used, key=last_used.get):
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+
+            logging.info(f"Evict cached artifacts {digest}")
+            for path in refs_by_digest[digest]:
+                os.remove(path)
+            shutil.rmtree(os.path.join(self.objects_dir, digest), ignore_errors=True)
+            total -= sizes[digest]
+
+
+_cache = None
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = ArtifactCache()
+    return _cache
+
+
+def cache_key(model_uri):
+    """
+    Turn a models:/ or runs:/ uri into a cache key, resolving aliases to their version
+    """
+    if model_uri.startswith("models:/"):
+        name, _, version = model_uri[len("models:/"):].partition("/")
+        if "@" in name:
+            name, alias = name.split("@", 1)
+            from mlflow import MlflowClient
+            version = MlflowClient().get_model_version_by_alias(name, alias).version
+        return f"models/{name}/{version}", f"models:/{name}/{version}"
+
+    if model_uri.startswith("runs:/"):
+        return f"runs/{model_uri[len('runs:/'):].strip('/')}", model_uri
+
+    raise ValueError(f"Unsupported model uri: {model_uri}")
+
+
+def is_file_artifact(artifact_uri, cached_path):
+    """
+    True when the cached directory holds the single file pointed by artifact_uri
+    """
+    basename = os.path.basename(artifact_uri.rstrip("/"))
+    return os.listdir(cached_path) == [basename] and os.path.isfile(os.path.join(cached_path, basename))
+
+
+def download_artifacts(artifact_uri):
+    """
+    Return the local path of the artifacts at artifact_uri (directory or single file),
+    downloading them only once per host
+    """
+    key, resolved_uri = cache_key(artifact_uri)
+
+    def download(dst_dir):
+        import mlflow.artifacts
+
+        started = time.perf_counter()
+        path = mlflow.artifacts.download_artifacts(artifact_uri=resolved_uri, dst_path=dst_dir)
+        logging.info(f"Downloaded {resolved_uri} in {time.perf_counter() - started:.1f}s")
+
+        # a single file artifact is stored in its own directory
+        if os.path.isfile(path):
+            file_dir = os.path.join(dst_dir, uuid.uuid4().hex)
+            os.makedirs(file_dir)
+            os.replace(path, os.path.join(file_dir, os.path.basename(path)))
+            return file_dir
+        return path
+
+    path = get_cache().get(key, download)
+
+    if is_file_artifact(artifact_uri, path):
+        return os.path.join(path, os.path.basename(artifact_uri.rstrip("/")))
+    return path
+
+
+def load_model(model_uri):
+    """
+    Same as mlflow.pyfunc.load_model, loading the artifacts from the local cache
+    """
+    import mlflow.pyfunc
+
+    return mlflow.pyfunc.load_model(download_artifacts(model_uri))
@@ -0,0 +1,155 @@
+import logging
+import os
+import threading
+
+import numpy as np
+
+import model_cache
+import app_func as af
+
+MLFLOW_TRACKING_URI = os.getenv("MLFLOW_TRACKING_URI", "https://renergies99lead-mlflow.hf.space/")
+
+REGISTERED_MODEL_NAME = "SolarProdModel"
+MODEL_ALIAS = "production"
+
+# Interval (seconds) between two checks of the registry alias, 0 disables the poller
+REFRESH_INTERVAL = int(os.getenv("MODEL_REFRESH_INTERVAL", "300"))
+
+
+class LoadedModel:
+    """
+    Immutable snapshot of a registered model version loaded in memory
+    """
+
+    def __init__(self, name, version, model, error_table=None):
+        self.name = name
+        self.version = version
+        self.model = model
+        # (edges, std) arrays logged at training time, None if the run has no error table
+        self.error_table = error_table
+
+    def predict(self, data):
+        return self.model.predict(data)
+
+    def predict_with_error(self, data):
+        """
+        Returns the predictions and the std of their error
+        """
+        prediction = np.asarray(self.predict(data), dtype=float)
+
+        if self.error_table is None:
+            return prediction, np.zeros(len(prediction))
+
+        return prediction, af.get_std_vector(prediction, *self.error_table)
+
+
+class ModelHolder:
+    """
+    Keep the version of a registered model pointed by an alias resident in memory.
+
+    The first call to get() loads the model, then every request is served from
+    memory. refresh() resolves the alias again and swaps the snapshot only when
+    the version has changed. Requests that already hold the previous snapshot
+    keep using it until they are done.
+    """
+
+    def __init__(self, name=REGISTERED_MODEL_NAME, alias=MODEL_ALIAS, tracking_uri=MLFLOW_TRACKING_URI):
+        self.name = name
+        self.alias = alias
+        self.tracking_uri = tracking_uri
+
+        self._current = None
+        self._lock = threading.Lock()
+        # one refresh at a time: the poller and /reload_model do not load the same version twice
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _client(self):
+        # mlflow is imported on the first resolution, not when the API starts
+        import mlflow
+        from mlflow import MlflowClient
+
+        mlflow.set_tracking_uri(self.tracking_uri)
+        return MlflowClient()
+
+    def _resolve(self):
+        return self._client().get_model_version_by_alias(self.name, self.alias)
+
+    def _load_error_table(self, run_id):
+        try:
+            path = model_cache.download_artifacts(f"runs:/{run_id}/{af.ERROR_TABLE_ARTIFACT}")
+        except Exception as e:
+            logging.warning(f"No error table for run {run_id}: {e}")
+            return None
+        return af.read_error_table(path)
+
+    def _load(self, model_version):
+        version = model_version.version
+        logging.info(f"Load model {self.name} version {version}")
+        model = model_cache.load_model(f"models:/{self.name}/{version}")
+        error_table = self._load_error_table(model_version.run_id)
+        return LoadedModel(self.name, version, model, error_table)
+
+    def get(self):
+        """
+        Return the current snapshot, loading it on first use
+        """
+        current = self._current
+        if current is not None:
+            return current
+
+        with self._lock:
+            if self._current is None:
+                self._current = self._load(self._resolve())
+            return self._current
+
+    def refresh(self):
+        """
+        Check the alias and atomically swap in the new version if it has moved.
+        Returns True when a new version has been loaded.
+        """
+        with self._refresh_lock:
+            model_version = self._resolve()
+            version = model_version.version
+
+            current = self._current
+            if current is not None and current.version == version:
+                return False
+
+            # the download happens outside of self._lock: requests keep being
+            # served by the previous snapshot until the new one is ready
+            loaded = self._load(model_version)
+
+            with self._lock:
+                self._current = loaded
+
+        logging.info(f"Model {self.name}@{self.alias} now serving version {version}")
+        return True
+
+    def _poll(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Cannot refresh model {self.name}@{self.alias}: {e}")
+
+    def start(self, interval=REFRESH_INTERVAL):
+        """
+        Start the background thread checking the alias every `interval` seconds
+        """
+        if interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll, args=(interval,), daemon=True, name="model-holder")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+production_model = ModelHolder()
@@ -1,21 +1,20 @@
 from datetime import datetime
-import json
 import requests
 import os
 import logging
 from dotenv import load_dotenv
-import boto3
-from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+import clients
+import freshness
+import geocoding
+import ratelimit
+import numpy as np
 import pandas as pd
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-headers = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
-}
-
 cities = [
     'Moulins',
     'Aurillac',
@@ -30,72 +29,39 @@ API_KEY_S3 = os.environ["AWS_ACCESS_KEY_ID"]
 API_SECRET_KEY_S3 = os.environ["AWS_SECRET_ACCESS_KEY"]
 bucket = "renergies99-lead-bucket"
 
-class Owm:
-
-    def __init__(self, 
-                 dt,
-                 sunrise,
-                 sunset,
-                 temp,
-                 feels_like,
-                 pressure,
-                 humidity,
-                 dew_point,
-                 clouds,
-                 wind_speed,
-                 wind_deg,
-                 rain,
-                 snow,
-                 city,
-                 lat,
-                 lon,
-                 weather_main,
-                 weather_desc):
-        self.dt = dt
-        self.sunrise = sunrise
-        self.sunset = sunset
-        self.temp = temp
-        self.feels_like = feels_like
-        self.pressure = pressure
-        self.humidity = humidity
-        self.dew_point = dew_point
-        self.clouds = clouds
-        self.wind_speed = wind_speed
-        self.wind_deg = wind_deg
-        self.rain = rain
-        self.snow = snow
-        self.city = city
-        self.lat = lat
-        self.lon = lon
-        self.weather_main = weather_main
-        self.weather_desc = weather_desc
-
-def s3_cred():
-    load_dotenv()
-
-    return boto3.client(
-        "s3",
-        aws_access_key_id=API_KEY_S3,
-        aws_secret_access_key=API_SECRET_KEY_S3,
-        region_name="eu-west-3"
-    )
+OPENWEATHERMAP_URL = "https://api.openweathermap.org/data/3.0/onecall"
 
-s3 = s3_cred()
+def local_timezone():
+    """
+    IANA name of the time zone of the server (TZ, then /etc/localtime), UTC if unknown.
+    Unlike dateutil's tzlocal, a named zone is converted by pandas without a Python call per value.
+    """
+    name = os.getenv("TZ", "").lstrip(":")
+    if not name and os.path.islink("/etc/localtime"):
+        name = os.path.realpath("/etc/localtime").partition("zoneinfo/")[2]
+    return name or "UTC"
+
+# Time zone of the dt, sunrise and sunset columns
+OWM_TIMEZONE = os.getenv("OWM_TIMEZONE") or local_timezone()
+
+# Fields of a daily forecast used by openweather_data_json_to_dataframe (rain and snow are optional)
+REQUIRED_DAILY_KEYS = {"dt", "sunrise", "sunset", "temp", "feels_like", "pressure", "humidity",
+                       "dew_point", "clouds", "wind_speed", "wind_deg", "weather"}
+
+# Cities fetched at the same time, and the requests per minute allowed by the subscription
+OWM_WORKERS = int(os.getenv("OWM_WORKERS", "8"))
+OWM_REQUESTS_PER_MINUTE = float(os.getenv("OWM_REQUESTS_PER_MINUTE", "60"))
+# Seconds per request, and retries of the failed requests (1 s, 2 s, 4 s... apart)
+OWM_TIMEOUT = float(os.getenv("OWM_TIMEOUT", "10"))
+OWM_RETRIES = int(os.getenv("OWM_RETRIES", "3"))
+OWM_BACKOFF = float(os.getenv("OWM_BACKOFF", "1"))
 
 def getNow():
     return datetime.now().strftime("%Y-%m-%d")
 
 def get_openweathermap_last_download():
-    try:
-        key = f"public/openweathermap/{last_download_filename}"
-
-        obj = s3.get_object(Bucket=bucket, Key=key)
-        ligne = obj["Body"].read().decode("utf-8")
-
-    except:
-        return "Cannot get openweathermap last download data"
-    
-    return ligne
+    # served from the freshness manifest held in memory
+    return freshness.manifest.last_download("openweathermap") or "Cannot get openweathermap last download data"
 
 def is_openweathermap_data_already_downloaded():
     return getNow() == get_openweathermap_last_download()
@@ -112,64 +78,8 @@ def get_city_data(cities=cities, filename="cities.json"):
 
     logging.info("GET_CITY_DATA")
 
-    nominatim_base_url = "https://nominatim.openstreetmap.org/"
-    search_city_url2 = "search"
-
-    nominatim_cities_data = []
-    
-    key = f"public/openweathermap/{filename}"
-
-    try:
-        obj = s3.get_object(Bucket=bucket, Key=key)
-    except ClientError as e:
-        obj = None
-    
-    if obj:
-        logging.info(f"Use of {filename}")
-        
-        contenu = obj["Body"].read()
-        data = json.loads(contenu)
-
-        return data
-
-    for city in cities:
-        
-        params = {
-            "format": "json",
-            "limit": 1,
-            "q": f"{city},france"
-        }
-
-        try:
-            logging.info(f"get data for : {city}")
-            nominatim_cities_data.append(requests.get(f"{nominatim_base_url}{search_city_url2}", params=params, headers=headers).json())
-
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Error fetching data for {city}: {e}")
-        except ValueError:
-            logging.error(f"Error decoding JSON for {city}")
-
-    res = { city[0]["name"]: {"lat": city[0]["lat"], "lon": city[0]["lon"]} for city in nominatim_cities_data }
-
-    try:
-        if len(res) == 0:
-            logging.info(f"No data to write to : {filename}")
-            return {}
-
-        logging.info(f"write data to : {filename}")
-
-        json_bytes = json.dumps(res, ensure_ascii=False, indent=4).encode("utf-8")
-
-        s3.put_object(
-            Bucket=bucket,
-            Key=key,
-            Body=json_bytes
-        )
-
-    except IOError as e:
-        logging.error(f"Error writing to target file {filename}: {e}")
-
-    return res
+    # only the cities missing from the cache (or too old) are geocoded
+    return geocoding.GeocodingCache(f"public/openweathermap/{filename}").coordinates(cities)
 
 
 def load_openweathermap_data(cities_coord, file_basename="openweathermap_forecasts"):
@@ -197,35 +107,10 @@ def load_openweathermap_data(cities_coord, file_basename="openweathermap_forecas
         logging.error("Error: OPENWEATHERMAP_KEY not found in environment variables. Please set it in the .env file.")
         exit(1)  
 
-    openweathermap_base_url = "https://api.openweathermap.org/data/3.0/onecall"
-
-    for city_name, coords in cities_coord.items():
-        cities_coord[city_name]["daily"] = []
-
-        params = {
-            "lat": coords["lat"],
-            "lon": coords["lon"],
-            "units": "metric",
-            "exclude": "current,minutely,hourly,alerts",
-            "APPID": OPENWEATHERMAP_KEY
-        }
-
-        try:
-            logging.info(f"Process {city_name}")
-
-            response = requests.get(openweathermap_base_url, params=params)
-
-            # Raise an exception for bad status codes (4xx or 5xx)
-            response.raise_for_status()
-            weather_data = response.json()
-            
-            if weather_data.get("daily"):
-                cities_coord[city_name]["daily"].extend(weather_data["daily"])
+    forecasts = fetch_forecasts(cities_coord, OPENWEATHERMAP_KEY)
 
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Error fetching data for {city_name}: {e}")
-        except ValueError:
-            logging.error(f"Error decoding JSON for {city_name}")
+    for city_name in cities_coord:
+        cities_coord[city_name]["daily"] = forecasts.get(city_name, [])
 
     df = openweather_data_json_to_dataframe(cities_coord)
     
@@ -248,37 +133,103 @@ def load_openweathermap_data(cities_coord, file_basename="openweathermap_forecas
 
     key = f"public/openweathermap/{last_download_filename}"
 
-    s3.put_object(
+    clients.s3_client().put_object(
         Bucket=bucket,
         Key=key,
         Body=getNow().encode("utf-8")
     )
+    freshness.manifest.record("openweathermap", df, getNow())
 
-def openweather_data_json_to_dataframe(cities_coord):
-    print(type(cities_coord))
-
-    cities = []
-    DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+    return df
 
-    for city_name, city_val in cities_coord.items():
+def fetch_city_forecast(session, limiter, coords, api_key):
+    params = {
+        "lat": coords["lat"],
+        "lon": coords["lon"],
+        "units": "metric",
+        "exclude": "current,minutely,hourly,alerts",
+        "APPID": api_key
+    }
+    response = ratelimit.get_with_retry(session, OPENWEATHERMAP_URL, limiter, retries=OWM_RETRIES,
+                                        backoff=OWM_BACKOFF, timeout=OWM_TIMEOUT, params=params)
+    return response.json().get("daily") or []
+
+def fetch_forecasts(cities_coord, api_key, workers=OWM_WORKERS, requests_per_minute=OWM_REQUESTS_PER_MINUTE):
+    """
+    Daily forecasts of every city, fetched by a pool of threads sharing one
+    keep-alive session and the requests per minute budget.
+    Returns {city: daily forecasts}, the cities in error are logged and left out.
+    """
+    session = clients.http_session()
+    limiter = ratelimit.host_limiter(OPENWEATHERMAP_URL, requests_per_minute / 60)
 
+    def fetch(item):
+        city_name, coords = item
         try:
-            for daily in city_val["daily"]:
-                a_city_obj = Owm(datetime.fromtimestamp(daily["dt"]).strftime(DATE_FORMAT), 
-                                 datetime.fromtimestamp(daily["sunrise"]).strftime(DATE_FORMAT), 
-                                 datetime.fromtimestamp(daily["sunset"]).strftime(DATE_FORMAT), daily["temp"]["day"], 
-                                 daily["feels_like"]["day"], daily["pressure"], daily["humidity"], daily["dew_point"], 
-                                 daily["clouds"], daily["wind_speed"], daily["wind_deg"], daily.get("rain", 0), 
-                                 daily.get("snow", 0), city_name, city_val["lat"], city_val["lon"], 
-                                 daily["weather"][0]["main"], daily["weather"][0]["description"])
-                cities.append(vars(a_city_obj))
-                
-        except KeyError:
-            continue
+            logging.info(f"Process {city_name}")
+            return city_name, fetch_city_forecast(session, limiter, coords, api_key)
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Error fetching data for {city_name}: {e}")
+        except ValueError:
+            logging.error(f"Error decoding JSON for {city_name}")
+        return city_name, None
 
-    df = pd.DataFrame(cities)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(cities_coord))), thread_name_prefix="owm") as pool:
+        results = pool.map(fetch, list(cities_coord.items()))
+        return {city_name: daily for city_name, daily in results if daily is not None}
 
-    return df
+def openweather_data_json_to_dataframe(cities_coord):
+    """
+    One row per city and forecast day, built column by column.
+    dt, sunrise and sunset are datetime64 columns in OWM_TIMEZONE (the local time of the server).
+    """
+    days, city_names, lats, lons, counts = [], [], [], [], []
+
+    for city_name, city_val in cities_coord.items():
+        daily = city_val.get("daily") or []
+        if not all(REQUIRED_DAILY_KEYS <= day.keys() for day in daily):
+            logging.error(f"Incomplete forecast for {city_name}, city ignored")
+            continue
+        days.extend(daily)
+        city_names.append(city_name)
+        lats.append(city_val["lat"])
+        lons.append(city_val["lon"])
+        counts.append(len(daily))
+
+    n = len(days)
+
+    def ints(get):
+        return np.fromiter((get(day) for day in days), dtype=np.int64, count=n)
+
+    def floats(get):
+        return np.fromiter((get(day) for day in days), dtype=np.float64, count=n)
+
+    def local_times(key):
+        # a single conversion of the epoch seconds, as datetime.fromtimestamp did row by row
+        times = pd.to_datetime(ints(lambda day: day[key]), unit="s", utc=True)
+        return times.tz_convert(OWM_TIMEZONE).tz_localize(None)
+
+    return pd.DataFrame({
+        "dt": local_times("dt"),
+        "sunrise": local_times("sunrise"),
+        "sunset": local_times("sunset"),
+        "temp": floats(lambda day: day["temp"]["day"]),
+        "feels_like": floats(lambda day: day["feels_like"]["day"]),
+        "pressure": ints(lambda day: day["pressure"]),
+        "humidity": ints(lambda day: day["humidity"]),
+        "dew_point": floats(lambda day: day["dew_point"]),
+        "clouds": ints(lambda day: day["clouds"]),
+        "wind_speed": floats(lambda day: day["wind_speed"]),
+        "wind_deg": ints(lambda day: day["wind_deg"]),
+        # absent when there is no precipitation
+        "rain": floats(lambda day: day.get("rain", 0.0)),
+        "snow": floats(lambda day: day.get("snow", 0.0)),
+        "city": np.repeat(np.array(city_names, dtype=object), counts),
+        "lat": np.repeat(np.array(lats, dtype=object), counts),
+        "lon": np.repeat(np.array(lons, dtype=object), counts),
+        "weather_main": [day["weather"][0]["main"] for day in days],
+        "weather_desc": [day["weather"][0]["description"] for day in days],
+    })
 
 
 """
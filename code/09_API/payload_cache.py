@@ -0,0 +1,68 @@
+import os
+import threading
+from collections import OrderedDict
+
+MAX_ENTRIES = int(os.getenv("PAYLOAD_CACHE_MAX_ENTRIES", "32"))
+MAX_BYTES = int(os.getenv("PAYLOAD_CACHE_MAX_BYTES", str(256 * 1024 ** 2)))
+
+
+class PayloadCache:
+    """
+    Bounded in-process LRU cache of response payloads (bytes), limited
+    in number of entries and in total size
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+            return payload
+
+    def put(self, key, payload):
+        if len(payload) > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+
+            self._entries[key] = payload
+            self._size += len(payload)
+
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def cached_stream(self, key, chunks):
+        """
+        Yield the chunks and store their concatenation once the stream is complete.
+        Nothing is stored if the payload gets bigger than the cache.
+        """
+        parts = []
+        size = 0
+        for chunk in chunks:
+            if parts is not None:
+                parts.append(chunk)
+                size += len(chunk)
+                if size > self.max_bytes:
+                    parts = None
+            yield chunk
+
+        if parts is not None:
+            self.put(key, b"".join(parts))
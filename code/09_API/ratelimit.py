@@ -0,0 +1,115 @@
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+# HTTP statuses worth retrying: rate limited or temporary server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """
+    Token bucket shared by threads: at most rate calls per second on average,
+    with bursts of up to burst calls
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _wait_time(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def set_rate(self, rate, burst=None):
+        with self._lock:
+            self.rate = float(rate)
+            if burst is not None:
+                self.burst = burst
+                self._tokens = min(self._tokens, float(burst))
+
+    def acquire(self):
+        """
+        Block until a call is allowed
+        """
+        while True:
+            with self._lock:
+                wait = self._wait_time()
+            if wait == 0.0:
+                return
+            time.sleep(wait)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def host_limiter(url, rate, burst=1):
+    """
+    Limiter shared by every call to the host of url in the process.
+    A call with another rate (or burst) updates the limiter of the host:
+    the last configuration given applies to all its callers.
+    """
+    host = urlparse(url).netloc or url
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = _limiters[host] = RateLimiter(rate, burst)
+        elif limiter.rate != float(rate) or limiter.burst != burst:
+            logging.info(f"{host}: rate limit {limiter.rate:g}/s -> {float(rate):g}/s")
+            limiter.set_rate(rate, burst)
+        return limiter
+
+
+def _retry_after(response, default):
+    try:
+        return max(default, float(response.headers.get("Retry-After", default)))
+    except ValueError:
+        return default
+
+
+def get_with_retry(session, url, limiter=None, retries=3, backoff=1.0, timeout=10, **kwargs):
+    """
+    GET url with the session, waiting for the limiter before every attempt.
+    Connection errors, timeouts, 429 and 5xx responses are retried with an
+    exponential backoff (Retry-After is honoured), other errors are raised.
+    """
+    import requests
+
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+
+        # jitter: the threads retrying at once do not hit the host together
+        wait = backoff * 2 ** attempt * (1 + random.random() / 2)
+        try:
+            response = session.get(url, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt == retries:
+                raise
+            logging.warning(f"{urlparse(url).netloc}: {e}, retry in {wait:.1f} s")
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                response.raise_for_status()
+                return response
+            wait = _retry_after(response, wait)
+            logging.warning(f"{urlparse(url).netloc}: HTTP {response.status_code}, retry in {wait:.1f} s")
+
+        time.sleep(wait)
@@ -1,149 +1,142 @@
 import io
 import requests
+import tempfile
 import zipfile
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 import os
-import boto3
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
-from fastapi.responses import StreamingResponse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import clients
+import ratelimit
+import db
+import freshness
+import rte_db
+import rte_dataset
+import rte_history
+from fastapi.responses import StreamingResponse, Response
+from email.utils import format_datetime, parsedate_to_datetime
 import csv
-import io
-import requests
+import hashlib
+import zlib
+import pyarrow as pa
+import batch_io
+from payload_cache import PayloadCache
 
 
 load_dotenv()
 
-path = "unzip"
 last_download_filename = "rte_last_download"
 
 API_KEY_S3 = os.environ["AWS_ACCESS_KEY_ID"]
 API_SECRET_KEY_S3 = os.environ["AWS_SECRET_ACCESS_KEY"]
-DATABASE_URL = os.environ["DATABASE_URL"]
 
 bucket = "renergies99-lead-bucket"
 
-def s3_cred():
-    load_dotenv()
+# Rows fetched from the database and serialized at once by /rte_data
+CSV_CHUNK_ROWS = int(os.getenv("RTE_CSV_CHUNK_ROWS", "20000"))
 
-    return boto3.client(
-        "s3",
-        aws_access_key_id=API_KEY_S3,
-        aws_secret_access_key=API_SECRET_KEY_S3,
-        region_name="eu-west-3"
-    )
+# Also write the full eCO2mix_RTE_Auvergne-Rhone-Alpes.csv on a load (RTE_EXPORT_CSV=1), for the
+# readers of the former file: the 01_EDA notebooks read the Parquet dataset
+EXPORT_CSV = os.getenv("RTE_EXPORT_CSV", "0") == "1"
+
+# Chunks of the streamed zip downloads, and size above which an archive is spooled to disk
+ZIP_CHUNK_SIZE = 1024 * 1024
+ZIP_SPOOL_SIZE = int(os.getenv("RTE_ZIP_SPOOL_SIZE", str(16 * 1024 * 1024)))
+
+# Daily curves (/rte_daily_data and /rte_daily_backfill)
+DAILY_DOWNLOAD_URL = "https://eco2mix.rte-france.com/curves/eco2mixDl"
+DAILY_URL = os.getenv("RTE_DAILY_URL", f"s3://{bucket}/public/prod/daily")
+DAILY_RAW_URL = os.getenv("RTE_DAILY_RAW_URL", f"s3://{bucket}/public/raw/rte/daily")
+# Also write the raw day as .xlsx
+EXPORT_DAILY_EXCEL = os.getenv("RTE_DAILY_EXCEL", "0") == "1"
+# Threads downloading the days of a backfill, and requests per second to eco2mix
+DAILY_WORKERS = int(os.getenv("RTE_DAILY_WORKERS", "8"))
+DAILY_RATE_LIMIT = float(os.getenv("RTE_DAILY_RATE_LIMIT", "4"))
+DAILY_BACKFILL_MAX_DAYS = int(os.getenv("RTE_DAILY_BACKFILL_MAX_DAYS", "366"))
 
-s3 = s3_cred()
+# Recent /rte_data payloads, keyed by (rte_last_download, deb, fin, type, format, query options)
+rte_data_cache = PayloadCache()
 
 def getNow():
     return datetime.now().strftime("%Y-%m-%d")
 
 def get_rte_last_download():
-    try:
-        key = f"public/prod/{last_download_filename}"
-
-        obj = s3.get_object(Bucket=bucket, Key=key)
-        ligne = obj["Body"].read().decode("utf-8")
-
-    except:
-        return "Cannot get rte last download data"
-    
-    return ligne
+    # served from the freshness manifest held in memory
+    return freshness.manifest.last_download("rte") or "Cannot get rte last download data"
 
 def is_rte_data_already_downloaded():
     return getNow() == get_rte_last_download()
 
 
-def fill_2024_columns(df):
-    new_cols = [
-        "Flux physiques d'Auvergne-Rhône-Alpes vers Auvergne-Rhône-Alpes",
-        "Flux physiques de Bourgogne-Franche-Comté vers Auvergne-Rhône-Alpes",
-        "Flux physiques de Bretagne vers Auvergne-Rhône-Alpes",
-        "Flux physiques de Centre-Val de Loire vers Auvergne-Rhône-Alpes",
-        "Flux physiques de Grand-Est vers Auvergne-Rhône-Alpes",
-        "Flux physiques de Hauts-de-France vers Auvergne-Rhône-Alpes",
-        "Flux physiques d'Ile-de-France vers Auvergne-Rhône-Alpes",
-        "Flux physiques de Normandie vers Auvergne-Rhône-Alpes",
-        "Flux physiques de Nouvelle-Aquitaine vers Auvergne-Rhône-Alpes",
-        "Flux physiques d'Occitanie vers Auvergne-Rhône-Alpes",
-        "Flux physiques de Pays-de-la-Loire vers Auvergne-Rhône-Alpes",
-        "Flux physiques de PACA vers Auvergne-Rhône-Alpes",
-        "Flux physiques de Auvergne-Rhône-Alpes vers Auvergne-Rhône-Alpes",
-        "Flux physiques de Auvergne-Rhône-Alpes vers Bourgogne-Franche-Comté",
-        "Flux physiques de Auvergne-Rhône-Alpes vers Bretagne",
-        "Flux physiques de Auvergne-Rhône-Alpes vers Centre-Val de Loire",
-        "Flux physiques de Auvergne-Rhône-Alpes vers Grand-Est",
-        "Flux physiques de Auvergne-Rhône-Alpes vers Hauts-de-France",
-        "Flux physiques de Auvergne-Rhône-Alpes vers Ile-de-France",
-        "Flux physiques de Auvergne-Rhône-Alpes vers Normandie",
-        "Flux physiques de Auvergne-Rhône-Alpes vers Nouvelle-Aquitaine",
-        "Flux physiques de Auvergne-Rhône-Alpes vers Occitanie",
-        "Flux physiques de Auvergne-Rhône-Alpes vers Pays-de-la-Loire",
-        "Flux physiques de Auvergne-Rhône-Alpes vers PACA",
-        "Flux physiques Allemagne vers Auvergne-Rhône-Alpes",
-        "Flux physiques Belgique vers Auvergne-Rhône-Alpes",
-        "Flux physiques Espagne vers Auvergne-Rhône-Alpes",
-        "Flux physiques Italie vers Auvergne-Rhône-Alpes",
-        "Flux physiques Luxembourg vers Auvergne-Rhône-Alpes",
-        "Flux physiques Royaume-Uni vers Auvergne-Rhône-Alpes",
-        "Flux physiques Suisse vers Auvergne-Rhône-Alpes",
-        "Flux physiques de Auvergne-Rhône-Alpes vers Allemagne",
-        "Flux physiques de Auvergne-Rhône-Alpes vers Belgique",
-        "Flux physiques de Auvergne-Rhône-Alpes vers Espagne",
-        "Flux physiques de Auvergne-Rhône-Alpes vers Italie",
-        "Flux physiques de Auvergne-Rhône-Alpes vers Luxembourg",
-        "Flux physiques de Auvergne-Rhône-Alpes vers Royaume-Uni",
-        "Flux physiques de Auvergne-Rhône-Alpes vers Suisse"
-    ]
-    position = 16
-    for i, col in enumerate(new_cols, start=1):
-        df.insert(position+i, col, "-")
-
-
-def get_previous_rte_data():
-    xls_list = [
-        "https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/prod/unzipped/regional/eCO2mix_RTE_Auvergne-Rh%C3%B4ne-Alpes_Annuel-Definitif_2021.xls",
-        "https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/prod/unzipped/regional/eCO2mix_RTE_Auvergne-Rh%C3%B4ne-Alpes_Annuel-Definitif_2022.xls",
-        "https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/prod/unzipped/regional/eCO2mix_RTE_Auvergne-Rh%C3%B4ne-Alpes_Annuel-Definitif_2023.xls",
-        "https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/prod/unzipped/regional/eCO2mix_RTE_Auvergne-Rh%C3%B4ne-Alpes_Annuel-Definitif_2024.xls"
-    ]
-
-    df_array = []
-
-    for xls_url in xls_list:
-        df = pd.read_csv(f"{xls_url}", encoding="ISO-8859-1", sep="\t")
-
-        if "2024" in xls_url:
-            fill_2024_columns(df)
-
-        df = df.iloc[:-1, :-1] #remove last line and last column
-
-        df_array.append(df)
-
-    return df_array
+def get_previous_rte_data(years=rte_history.DEFINITIVE_YEARS):
+    # definitive years, parsed once and read from the Parquet cache
+    return rte_history.get_definitive_data(years)
 
 
-def en_cours_rte_data():
-    response = requests.get("https://eco2mix.rte-france.com/download/eco2mix/eCO2mix_RTE_Auvergne-Rhone-Alpes_En-cours-TR.zip")
-    response.raise_for_status()
+def get_missing_previous_rte_data():
+    # the definitive years never change: only read when missing from the dataset
+    stored = rte_dataset.stored_years()
+    missing = [year for year in rte_history.DEFINITIVE_YEARS if year not in stored]
+    return get_previous_rte_data(missing) if missing else []
 
-    with zipfile.ZipFile(io.BytesIO(response.content)) as zip_ref:
-        zip_ref.extractall(path)
 
-    # the file is upposed to be encoded in ISO-8859-1
-    df = pd.read_csv(f"{path}/eCO2mix_RTE_Auvergne-Rhone-Alpes_En-cours-TR.xls", encoding="ISO-8859-1", sep="\t")
+def download_zip(url, chunk_size=ZIP_CHUNK_SIZE, spool_size=ZIP_SPOOL_SIZE):
+    """
+    Download a zip archive in chunks into a temporary file, kept in memory up to
+    spool_size bytes and moved to disk beyond. The whole archive has to be stored
+    before it is read: its central directory is at the end of the file.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    try:
+        with requests.get(url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                buffer.write(chunk)
+    except Exception:
+        buffer.close()
+        raise
+
+    buffer.seek(0)
+    return buffer
+
+def read_zip_member(buffer, member, **read_csv_kwargs):
+    """
+    Parse a member of the downloaded zip archive, without extracting it.
+    If the member is not found, the only .xls file of the archive is used.
+    """
+    with zipfile.ZipFile(buffer) as zip_ref:
+        names = zip_ref.namelist()
+        if member not in names:
+            xls_names = [name for name in names if name.endswith(".xls")]
+            if len(xls_names) != 1:
+                raise ValueError(f"{member} not found in the archive: {names}")
+            member = xls_names[0]
+
+        with zip_ref.open(member) as f:
+            # the file is supposed to be encoded in ISO-8859-1
+            return pd.read_csv(f, encoding="ISO-8859-1", sep="\t", **read_csv_kwargs)
+
+def en_cours_rte_data():
+    with download_zip("https://eco2mix.rte-france.com/download/eco2mix/eCO2mix_RTE_Auvergne-Rhone-Alpes_En-cours-TR.zip") as buffer:
+        df = read_zip_member(buffer, "eCO2mix_RTE_Auvergne-Rhone-Alpes_En-cours-TR.xls")
     df = df.iloc[:-1, :-1] #remove last line and last column
     df = df[df["Date"] != getNow()]
     
-    return df
+    return rte_history.to_float_columns(df)
 
 
-def rte_df_to_csv(df):
+def save_rte_data(df):
+    """
+    Write the downloaded RTE rows to the year/month partitioned Parquet dataset:
+    only their partitions are compared, and rewritten when they changed.
+    The other partitions of the dataset are left as they are.
+    """
     final_csv_filename = "eCO2mix_RTE_Auvergne-Rhone-Alpes.csv"
     
-    df = df[~df["Heures"].str.contains(":15|:45")]
+    df = df[~df["Heures"].str.contains(":15|:45")].copy()
 
     # Sélection automatique des colonnes TCO... (%) ou TCH... (%) si besoin
     cols_pct = [c for c in df.columns if "TCO" in c or "TCH" in c]
@@ -153,115 +146,331 @@ def rte_df_to_csv(df):
         lambda col: pd.to_numeric(col, errors="coerce")
     )
 
-    df.to_csv(
-        f"s3://renergies99-lead-bucket/public/prod/{final_csv_filename}",
-        index=False,
-        storage_options={
-            "key": API_KEY_S3,
-            "secret": API_SECRET_KEY_S3,
-        },
-    )
+    written = rte_dataset.write_partitions(df)
+
+    if EXPORT_CSV:
+        # full CSV export of the previous versions, read back from the dataset
+        rte_dataset.read_dataset().to_csv(
+            f"s3://renergies99-lead-bucket/public/prod/{final_csv_filename}",
+            index=False,
+            storage_options={
+                "key": API_KEY_S3,
+                "secret": API_SECRET_KEY_S3,
+            },
+        )
 
     key = f"public/prod/{last_download_filename}"
 
-    s3.put_object(
+    clients.s3_client().put_object(
         Bucket=bucket,
         Key=key,
         Body=getNow().encode("utf-8")
     )
+    # rows and hash of the downloaded rows, not of the whole history
+    freshness.manifest.record("rte", df, getNow())
+
+    # the payloads of the previous download are obsolete
+    rte_data_cache.clear()
+
+    return written
+
+def rows_to_csv(rows):
+    """
+    Serialize a block of rows in one call, with csv quoting
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue()
+
+def rte_row_partitions(deb, fin, type, chunk_rows=CSV_CHUNK_ROWS, columns=None, granularity="30min", agg="avg"):
+    """
+    Yield the column names of the RTE data between the years deb and fin,
+    then blocks of chunk_rows rows.
+    Only the requested columns are read, aggregated per granularity by the database.
+    """
+    from sqlalchemy import text
+
+    # connection taken from the engine shared by the process
+    with db.connect() as conn:
+        table_columns = rte_db.table_columns(conn, type)
+        selected_columns = rte_db.select_columns(table_columns, columns)
+
+        sql = rte_db.build_rte_query(type, table_columns, selected_columns, granularity, agg)
+
+        # server-side cursor: only chunk_rows rows are held in memory at a time
+        result = conn.execution_options(stream_results=True, yield_per=chunk_rows).execute(
+            text(sql),
+            rte_db.query_params(deb, fin)
+        )
 
-def rte_data(deb, fin, type):
-    engine = create_engine(DATABASE_URL)
-
-    def generate_csv():
-        with engine.connect() as conn:
-            columns = conn.execute(
-                text("""
-                SELECT column_name
-                FROM information_schema.columns
-                WHERE table_schema = 'public'
-                  AND table_name = :table
-                """),
-                {"table": type}
-            ).fetchall()
-            columns = [col[0] for col in columns]
-
-            desired = ["Date", "Heures", "Nucleaire", "Gaz", "Charbon", "Fioul", 
-                   "Hydraulique", "Eolien", "Solaire", "Bioenergies", "Consommation", "Ech__physiques", "Taux_de_Co2"]
-            
-            selected_columns = [col for col in desired if col in columns]
-
-            sql = f"""
-                SELECT {', '.join('"' + c + '"' for c in selected_columns)}
-                FROM public.{type}
-                WHERE EXTRACT(YEAR FROM TO_DATE("Date", 'YYYY-MM-DD')) between :deb and :fin 
-                ORDER BY "Date", "Heures"
-            """
-
-
-
-            result = conn.execute(
-                text(sql),
-                    {"deb": deb, "fin": fin}
-                )
-            
-            writer = csv.writer(io.StringIO())
-            yield ",".join(result.keys()) + "\n"
-
-            for row in result:
-                yield ",".join(map(str, row)) + "\n"
+        yield list(result.keys())
+
+        for rows in result.partitions():
+            yield rows
+
+def rte_csv_chunks(deb, fin, type, chunk_rows=CSV_CHUNK_ROWS, **options):
+    """
+    Yield the RTE data between the years deb and fin as CSV, one block of chunk_rows rows at a time
+    """
+    partitions = rte_row_partitions(deb, fin, type, chunk_rows, **options)
+
+    yield rows_to_csv([next(partitions)])
+
+    for rows in partitions:
+        yield rows_to_csv(rows)
+
+def rte_arrow_schema(columns):
+    """
+    Typed schema of the columnar formats: a Datetime timestamp, the date, the hour and floats
+    """
+    fields = [pa.field(rte_db.DATETIME_COLUMN, pa.timestamp("s"))]
+    for col in columns:
+        if col == "Date":
+            fields.append(pa.field(col, pa.date32()))
+        elif col == "Heures":
+            fields.append(pa.field(col, pa.string()))
+        else:
+            fields.append(pa.field(col, pa.float64()))
+    return pa.schema(fields)
+
+def rows_to_batch(rows, columns, schema):
+    df = pd.DataFrame.from_records(rows, columns=columns)
+
+    date_time = pd.to_datetime(df["Date"].astype(str) + " " + df["Heures"].astype(str), format="ISO8601", errors="coerce")
+    df.insert(0, rte_db.DATETIME_COLUMN, date_time)
+    df["Date"] = date_time.dt.date
+    df["Heures"] = df["Heures"].astype(str)
+    for col in columns:
+        if col not in ("Date", "Heures"):
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(float)
+
+    return pa.RecordBatch.from_pandas(df, schema=schema, preserve_index=False)
+
+def rte_arrow_batches(deb, fin, type, chunk_rows=CSV_CHUNK_ROWS, **options):
+    """
+    Returns the typed schema and an iterator of record batches of the RTE data
+    """
+    partitions = rte_row_partitions(deb, fin, type, chunk_rows, **options)
+    columns = next(partitions)
+    schema = rte_arrow_schema(columns)
+
+    return schema, (rows_to_batch(rows, columns, schema) for rows in partitions)
+
+def compress_chunks(chunks, codec):
+    """
+    Compress a stream of bytes on the fly (gzip or zstd)
+    """
+    if codec == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    else:
+        import zstandard
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+# format -> (media type, file extension)
+RTE_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "csv.gz": ("application/gzip", "csv.gz"),
+    "csv.zst": ("application/zstd", "csv.zst"),
+    "parquet": (batch_io.PARQUET, "parquet"),
+    "arrow": (batch_io.ARROW_STREAM, "arrows"),
+}
+
+def check_format(fmt):
+    if fmt not in RTE_FORMATS:
+        raise ValueError(f"Unknown format {fmt}, expected one of {list(RTE_FORMATS)}")
+    if fmt == "csv.zst":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("csv.zst needs the zstandard package")
+
+def rte_payload_chunks(deb, fin, type, fmt="csv", **options):
+    """
+    Yield the RTE data encoded in the requested format, as bytes
+    """
+    if fmt in ("parquet", "arrow"):
+        schema, batches = rte_arrow_batches(deb, fin, type, **options)
+        yield from batch_io.stream_batches(batches, schema, fmt)
+        return
+
+    chunks = (chunk.encode("utf-8") for chunk in rte_csv_chunks(deb, fin, type, **options))
+
+    if fmt == "csv.gz":
+        chunks = compress_chunks(chunks, "gzip")
+    elif fmt == "csv.zst":
+        chunks = compress_chunks(chunks, "zstd")
+
+    yield from chunks
+
+def rte_data_etag(marker, deb, fin, type, fmt="csv", options=()):
+    key = f"{marker}|{deb}|{fin}|{type}|{fmt}|{options}"
+    return '"' + hashlib.sha1(key.encode("utf-8")).hexdigest() + '"'
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+def rte_data(deb, fin, type, fmt="csv", columns=None, granularity="30min", agg="avg",
+             if_none_match=None, if_modified_since=None):
+    """
+    Response with the RTE data, as CSV (plain, gzip or zstd), Parquet or Arrow IPC stream,
+    restricted to some columns and resampled per granularity if requested.
+    The data only changes when a new load is done (rte_last_download): the ETag and
+    Last-Modified headers derive from it, and recent payloads are kept in memory.
+    """
+    check_format(fmt)
+    rte_db.check_query_options(columns, granularity, agg)
+    options = {"columns": sorted(set(columns)) if columns else None, "granularity": granularity, "agg": agg}
+    options_key = (tuple(options["columns"] or ()), granularity, agg)
+    media_type, extension = RTE_FORMATS[fmt]
+    headers = {"Content-Disposition": f"attachment; filename={type}.{extension}"}
+
+    marker = get_rte_last_download()
+    try:
+        last_modified = datetime.strptime(marker, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    except ValueError:
+        # no download marker: nothing to validate against
+        return StreamingResponse(
+            rte_payload_chunks(deb, fin, type, fmt, **options),
+            media_type=media_type,
+            headers=headers
+        )
+
+    etag = rte_data_etag(marker, deb, fin, type, fmt, options_key)
+    headers.update({
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": "no-cache",
+    })
+
+    not_modified = etag_matches(if_none_match, etag)
+    if not if_none_match and if_modified_since:
+        try:
+            not_modified = parsedate_to_datetime(if_modified_since) >= last_modified
+        except (TypeError, ValueError):
+            pass
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+
+    key = (marker, deb, fin, type, fmt, options_key)
+    payload = rte_data_cache.get(key)
+    if payload is not None:
+        return Response(content=payload, media_type=media_type, headers=headers)
 
     return StreamingResponse(
-        generate_csv(),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={type}.csv"}
+        rte_data_cache.cached_stream(key, rte_payload_chunks(deb, fin, type, fmt, **options)),
+        media_type=media_type,
+        headers=headers
     )
 
-def rte_daily_data(date):
-    date_str = datetime.strptime(date, "%d/%m/%Y").strftime("%Y-%m-%d")
-    response = requests.get(f"https://eco2mix.rte-france.com/curves/eco2mixDl?date={date}")
-    response.raise_for_status()
+def daily_filename(date_str):
+    return f"eCO2mix_RTE_{date_str}"
 
-    with zipfile.ZipFile(io.BytesIO(response.content)) as zip_ref:
-        zip_ref.extractall(path)
+def stored_daily_dates(url=DAILY_URL):
+    """
+    Days (YYYY-MM-DD) whose curve is already stored, from a single listing of the directory
+    """
+    fs, root = rte_dataset.filesystem(url)
+    if not fs.exists(root):
+        return set()
+    prefix, suffix = daily_filename(""), ".csv"
+    names = (path.rsplit("/", 1)[-1] for path in fs.ls(root, detail=False))
+    return {name[len(prefix):-len(suffix)] for name in names if name.startswith(prefix) and name.endswith(suffix)}
+
+def rte_daily_data(date, excel=EXPORT_DAILY_EXCEL, url=DAILY_URL, raw_url=DAILY_RAW_URL):
+    """
+    Download the curves of one day (DD/MM/YYYY) and store them as CSV, and as
+    Excel in the raw directory if excel is set. Returns the number of rows stored.
+    """
+    date_str = datetime.strptime(date, "%d/%m/%Y").strftime("%Y-%m-%d")
+    download_url = f"{DAILY_DOWNLOAD_URL}?date={date}"
 
-    # the file is supposed to be encoded in ISO-8859-1
-    df = pd.read_csv(f"{path}/eCO2mix_RTE_{date_str}.xls", encoding="ISO-8859-1", sep="\t", index_col=False)
+    # shared by all the threads downloading from eco2mix
+    ratelimit.host_limiter(download_url, DAILY_RATE_LIMIT).acquire()
+    with download_zip(download_url) as buffer:
+        df = read_zip_member(buffer, f"{daily_filename(date_str)}.xls", index_col=False)
 
     df = df.iloc[:-1, :-1] #remove last line and last column
     df["Heures"] = df["Heures"] + ":00"
 
-    df.to_excel(f"s3://renergies99-lead-bucket/public/raw/rte/daily/eCO2mix_RTE_{date_str}.xlsx")
+    if excel:
+        # openpyxl encoding is by far the slowest step of the day
+        df.to_excel(f"{raw_url}/{daily_filename(date_str)}.xlsx")
 
     df = df[~df["Heures"].astype(str).str.endswith(("15:00", "45:00"))]
 
-    # Colonnes à convertir en float (exclusions)
-    cols_float = [
-        c for c in df.columns
-        if c not in ["Périmètre","Nature","Date", "Heures"]
-    ]
-
     # Conversion en float (les valeurs invalides deviennent NaN)
-    df[cols_float] = df[cols_float].apply(
-        lambda col: pd.to_numeric(col, errors="coerce")
-    )
+    df = rte_history.to_float_columns(df)
 
-    # Convertir le DataFrame en CSV et résidant en mémoire
-    # csv_buffer = io.StringIO()
-    df.to_csv(f"s3://renergies99-lead-bucket/public/prod/daily/eCO2mix_RTE_{date_str}.csv", index=False, encoding="utf-8")
+    df.to_csv(f"{url}/{daily_filename(date_str)}.csv", index=False, encoding="utf-8")
+
+    return len(df)
+
+def rte_daily_backfill(deb, fin, excel=EXPORT_DAILY_EXCEL, overwrite=False, workers=DAILY_WORKERS,
+                       url=DAILY_URL, raw_url=DAILY_RAW_URL):
+    """
+    Download the curves of every day from deb to fin (DD/MM/YYYY, included)
+    with a bounded pool of threads. The days already stored are skipped unless overwrite is set.
+    """
+    start = datetime.strptime(deb, "%d/%m/%Y")
+    end = datetime.strptime(fin, "%d/%m/%Y")
+    if end < start:
+        raise ValueError(f"{fin} is before {deb}")
+    if (end - start).days + 1 > DAILY_BACKFILL_MAX_DAYS:
+        raise ValueError(f"At most {DAILY_BACKFILL_MAX_DAYS} days per backfill")
+
+    days = [day.strftime("%Y-%m-%d") for day in pd.date_range(start, end, freq="D")]
+    stored = set() if overwrite else stored_daily_dates(url)
+    todo = [day for day in days if day not in stored]
+
+    fs, root = rte_dataset.filesystem(url)
+    fs.makedirs(root, exist_ok=True)
+
+    result = {"downloaded": {}, "skipped": [day for day in days if day in stored], "failed": {}}
+    begin = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(todo) or 1)), thread_name_prefix="rte-daily") as pool:
+        futures = {
+            pool.submit(rte_daily_data, datetime.strptime(day, "%Y-%m-%d").strftime("%d/%m/%Y"), excel, url, raw_url): day
+            for day in todo
+        }
+        for future in as_completed(futures):
+            day = futures[future]
+            try:
+                result["downloaded"][day] = future.result()
+            except Exception as e:
+                logging.error(f"RTE daily data of {day}: {e}")
+                result["failed"][day] = str(e)
+
+    result["downloaded"] = dict(sorted(result["downloaded"].items()))
+    result["failed"] = dict(sorted(result["failed"].items()))
+    result["duration_s"] = round(time.perf_counter() - begin, 3)
+    logging.info(f"RTE daily backfill {deb} - {fin}: {len(result['downloaded'])} downloaded, "
+                 f"{len(result['skipped'])} skipped, {len(result['failed'])} failed")
+
+    return result
 
     
 if __name__ == "__main__":
     """
     if not is_rte_data_already_downloaded():
-        previous_data = get_previous_rte_data()
+        previous_data = get_missing_previous_rte_data()
         en_cours_data = en_cours_rte_data()
 
         previous_data.append(en_cours_data)
 
         df = pd.concat(previous_data, ignore_index=True)
 
-        rte_df_to_csv(df)
+        save_rte_data(df)
 
         rte_daily_data("08/01/2025")
     """
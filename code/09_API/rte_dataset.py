@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+
+import pandas as pd
+
+import freshness
+
+# Consolidated regional RTE data, Parquet partitioned by year and month.
+# Local directory or any fsspec url (s3:// uses the AWS_* credentials of the environment)
+DATASET_URL = os.getenv("RTE_DATASET_URL", "s3://renergies99-lead-bucket/public/prod/eCO2mix_RTE_Auvergne-Rhone-Alpes")
+
+MANIFEST_FILENAME = "_manifest.json"
+PART_FILENAME = "part-0.parquet"
+
+
+def filesystem(url):
+    import fsspec
+
+    return fsspec.core.url_to_fs(url)
+
+
+def normalize_column(name):
+    """
+    Column name of the cleaned data used for training: "TCH Solaire (%)" -> "tch_solaire_(%)"
+    """
+    return name.strip().lower().replace(" ", "_")
+
+
+def partition_key(year, month):
+    return f"year={year}/month={month:02d}"
+
+
+def _read_manifest(fs, root):
+    path = f"{root}/{MANIFEST_FILENAME}"
+    if not fs.exists(path):
+        return {}
+    with fs.open(path, "rb") as f:
+        return json.load(f)
+
+
+def _write_file(fs, path, write):
+    # hidden name: never read as a part of the dataset
+    directory, filename = path.rsplit("/", 1)
+    tmp_path = f"{directory}/.{filename}.{uuid.uuid4().hex}.tmp"
+    with fs.open(tmp_path, "wb") as f:
+        write(f)
+    fs.mv(tmp_path, path)
+
+
+def write_partitions(df, url=DATASET_URL):
+    """
+    Write the rows (with "Date" and "Heures" columns) in their year/month partitions.
+    Only the partitions whose content changed are rewritten, the content hash of
+    every partition is kept in the manifest of the dataset.
+    Returns the keys of the rewritten partitions.
+    """
+    fs, root = filesystem(url)
+    fs.makedirs(root, exist_ok=True)
+    manifest = _read_manifest(fs, root)
+
+    dates = pd.to_datetime(df["Date"], errors="coerce")
+    df = df[dates.notna()]
+    dates = dates[dates.notna()]
+
+    written = []
+    for (year, month), part in df.groupby([dates.dt.year, dates.dt.month], sort=True):
+        key = partition_key(year, month)
+        part = part.sort_values(["Date", "Heures"]).reset_index(drop=True)
+
+        part_hash = freshness.df_hash(part)
+        if manifest.get(key) == part_hash:
+            continue
+
+        fs.makedirs(f"{root}/{key}", exist_ok=True)
+        _write_file(fs, f"{root}/{key}/{PART_FILENAME}", lambda f: part.to_parquet(f, index=False))
+        manifest[key] = part_hash
+        written.append(key)
+
+    if written:
+        _write_file(fs, f"{root}/{MANIFEST_FILENAME}", lambda f: f.write(json.dumps(manifest, indent=2).encode("utf-8")))
+    logging.info(f"RTE dataset: {len(written)} partitions rewritten out of {len(manifest)}")
+
+    return written
+
+
+def dataset_exists(url=DATASET_URL):
+    """
+    True once write_partitions has written the dataset (its manifest exists)
+    """
+    fs, root = filesystem(url)
+    return fs.exists(f"{root}/{MANIFEST_FILENAME}")
+
+
+def stored_years(url=DATASET_URL):
+    """
+    Years having at least one partition in the dataset
+    """
+    fs, root = filesystem(url)
+    return sorted({int(key.split("/")[0].split("=")[1]) for key in _read_manifest(fs, root)})
+
+
+def read_dataset(url=DATASET_URL, columns=None, years=None, last_years=None):
+    """
+    Read the dataset, only opening the partitions of the requested years and
+    the requested columns (all by default, names as stored or normalized).
+    years is a (first, last) tuple, last_years the number of years up to the current one.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    fs, root = filesystem(url)
+    partitioning = ds.partitioning(pa.schema([("year", pa.int16()), ("month", pa.int8())]), flavor="hive")
+    dataset = ds.dataset(root, filesystem=fs, format="parquet", partitioning=partitioning,
+                         ignore_prefixes=["_", "."])
+
+    if last_years is not None:
+        years = (datetime.now().year - last_years + 1, datetime.now().year)
+
+    condition = None
+    if years is not None:
+        condition = (ds.field("year") >= years[0]) & (ds.field("year") <= years[1])
+
+    if columns is not None:
+        columns = [name for name in dataset.schema.names
+                   if name in columns or normalize_column(name) in columns]
+
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
@@ -0,0 +1,221 @@
+import re
+import sys
+import threading
+import unicodedata
+from datetime import datetime
+
+import db
+
+RTE_TABLES = ["rte_national", "rte_regional"]
+
+# Typed timestamp built from the "Date" and "Heures" text columns
+DATETIME_COLUMN = "Datetime"
+
+DESIRED_COLUMNS = ["Date", "Heures", "Nucleaire", "Gaz", "Charbon", "Fioul",
+                   "Hydraulique", "Eolien", "Solaire", "Bioenergies", "Consommation", "Ech__physiques", "Taux_de_Co2"]
+
+# Load factor (TCH) and coverage (TCO) rate columns of the regional table, returned on request only
+RATE_PREFIXES = ("TCH_", "TCO_")
+
+# /rte_data resampling: granularity -> date_trunc field (None: raw half-hour rows)
+GRANULARITIES = {"30min": None, "hour": "hour", "day": "day", "month": "month"}
+
+AGGREGATIONS = {"avg": "AVG", "sum": "SUM", "min": "MIN", "max": "MAX"}
+
+_columns_cache = {}
+_columns_lock = threading.Lock()
+
+
+def check_table(table):
+    if table not in RTE_TABLES:
+        raise ValueError(f"Unknown RTE table {table}")
+
+
+def table_columns(conn, table):
+    """
+    Columns of the table, read from information_schema once per process
+    """
+    columns = _columns_cache.get(table)
+    if columns is not None:
+        return columns
+
+    from sqlalchemy import text
+
+    rows = conn.execute(
+        text("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema = 'public'
+          AND table_name = :table
+        """),
+        {"table": table}
+    ).fetchall()
+
+    with _columns_lock:
+        _columns_cache[table] = [row[0] for row in rows]
+    return _columns_cache[table]
+
+
+def clear_columns_cache(table=None):
+    with _columns_lock:
+        if table is None:
+            _columns_cache.clear()
+        else:
+            _columns_cache.pop(table, None)
+
+
+def year_range(deb, fin):
+    """
+    [start, end[ bounds covering the years deb to fin
+    """
+    return datetime(deb, 1, 1), datetime(fin + 1, 1, 1)
+
+
+def column_name(name):
+    """
+    Name of an eCO2mix column in the RTE tables: accents removed, other
+    characters replaced by "_" ("Ech. physiques" -> "Ech__physiques",
+    "TCH Solaire (%)" -> "TCH_Solaire____")
+    """
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return re.sub(r"\W", "_", name)
+
+
+def is_known_column(name):
+    name = column_name(name)
+    return name in DESIRED_COLUMNS[2:] or name.startswith(RATE_PREFIXES)
+
+
+def check_query_options(columns=None, granularity="30min", agg="avg"):
+    """
+    Validate the /rte_data options before the query is run
+    """
+    unknown = [col for col in columns or [] if not is_known_column(col)]
+    if unknown:
+        raise ValueError(f"Unknown columns {unknown}, expected some of {DESIRED_COLUMNS[2:]} "
+                         f"or a rate column ({', '.join(p.rstrip('_') for p in RATE_PREFIXES)} ...)")
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity {granularity}, expected one of {list(GRANULARITIES)}")
+    if agg not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation {agg}, expected one of {list(AGGREGATIONS)}")
+
+
+def select_columns(columns, requested=None):
+    """
+    Columns returned by /rte_data: "Date", "Heures" and the requested measures
+    (all but the rate columns by default) that exist in the table.
+    Requested names may be given as in the eCO2mix files ("TCH Solaire (%)").
+    """
+    if not requested:
+        return [col for col in DESIRED_COLUMNS if col in columns]
+
+    requested = {column_name(col) for col in requested}
+    selected = [col for col in DESIRED_COLUMNS if col in columns and (col in ("Date", "Heures") or col in requested)]
+    return selected + [col for col in columns if col.startswith(RATE_PREFIXES) and col in requested]
+
+
+def build_rte_query(table, columns, selected_columns, granularity="30min", agg="avg"):
+    """
+    SQL of /rte_data with a sargable filter on the period.
+
+    With the typed "Datetime" column the filter is a range served by its index,
+    otherwise (table not migrated yet) a range on the ISO "Date" text.
+    With a granularity other than 30min, the rows are aggregated per period in
+    the database; "Date" and "Heures" are then the start of the period.
+    """
+    check_table(table)
+    check_query_options(granularity=granularity, agg=agg)
+
+    if DATETIME_COLUMN in columns:
+        where = f'"{DATETIME_COLUMN}" >= :start AND "{DATETIME_COLUMN}" < :end'
+        timestamp = f'"{DATETIME_COLUMN}"'
+        order = f'"{DATETIME_COLUMN}"'
+    else:
+        where = '"Date" >= :start_date AND "Date" < :end_date'
+        timestamp = '("Date" || \' \' || "Heures")::timestamp'
+        order = '"Date", "Heures"'
+
+    field = GRANULARITIES[granularity]
+    if field is None:
+        select = ', '.join('"' + c + '"' for c in selected_columns)
+        return f"""
+            SELECT {select}
+            FROM public.{table}
+            WHERE {where}
+            ORDER BY {order}
+        """
+
+    period = f"date_trunc('{field}', {timestamp})"
+    measures = [c for c in selected_columns if c not in ("Date", "Heures")]
+    select = ", ".join(
+        [f"to_char({period}, 'YYYY-MM-DD') AS \"Date\"", f"to_char({period}, 'HH24:MI') AS \"Heures\""]
+        + [f'{AGGREGATIONS[agg]}("{c}") AS "{c}"' for c in measures]
+    )
+    return f"""
+        SELECT {select}
+        FROM public.{table}
+        WHERE {where}
+        GROUP BY {period}
+        ORDER BY {period}
+    """
+
+
+def query_params(deb, fin):
+    start, end = year_range(deb, fin)
+    return {
+        "start": start,
+        "end": end,
+        "start_date": start.strftime("%Y-%m-%d"),
+        "end_date": end.strftime("%Y-%m-%d"),
+    }
+
+
+def migrate(conn, table):
+    """
+    Add the typed "Datetime" column to an RTE table, fill it and index it.
+    A trigger fills it for the rows written afterwards, since the tables are
+    loaded from outside this repository.
+    Can be run several times.
+
+    The columns of a table are cached once per process (table_columns): the
+    workers already running keep filtering on "Date" until they restart.
+    """
+    from sqlalchemy import text
+
+    check_table(table)
+
+    conn.execute(text(f'ALTER TABLE public.{table} ADD COLUMN IF NOT EXISTS "{DATETIME_COLUMN}" timestamp'))
+    conn.execute(text(f"""
+        CREATE OR REPLACE FUNCTION public.{table}_set_datetime() RETURNS trigger AS $$
+        BEGIN
+            NEW."{DATETIME_COLUMN}" := (NEW."Date" || ' ' || NEW."Heures")::timestamp;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """))
+    conn.execute(text(f"DROP TRIGGER IF EXISTS {table}_set_datetime ON public.{table}"))
+    conn.execute(text(f"""
+        CREATE TRIGGER {table}_set_datetime
+        BEFORE INSERT OR UPDATE OF "Date", "Heures" ON public.{table}
+        FOR EACH ROW EXECUTE FUNCTION public.{table}_set_datetime()
+    """))
+    conn.execute(text(f"""
+        UPDATE public.{table}
+        SET "{DATETIME_COLUMN}" = ("Date" || ' ' || "Heures")::timestamp
+        WHERE "{DATETIME_COLUMN}" IS NULL
+    """))
+    conn.execute(text(f'CREATE INDEX IF NOT EXISTS {table}_datetime_idx ON public.{table} ("{DATETIME_COLUMN}")'))
+    conn.execute(text(f"ANALYZE public.{table}"))
+
+    clear_columns_cache(table)
+
+
+if __name__ == "__main__":
+    # python rte_db.py migrate [table ...]
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        tables = sys.argv[2:] or RTE_TABLES
+        with db.get_engine().begin() as conn:
+            for table in tables:
+                print(f"migrate {table}")
+                migrate(conn, table)
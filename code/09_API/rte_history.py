@@ -0,0 +1,173 @@
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+
+# Definitive annual files: they never change once published
+DEFINITIVE_YEARS = [2021, 2022, 2023, 2024]
+
+DEFINITIVE_URL = ("https://renergies99-lead-bucket.s3.eu-west-3.amazonaws.com/public/prod/unzipped/regional/"
+                  "eCO2mix_RTE_Auvergne-Rh%C3%B4ne-Alpes_Annuel-Definitif_{year}.xls")
+
+# Parsed files, local directory or any fsspec url (s3://...)
+RTE_CACHE_URL = os.getenv("RTE_CACHE_URL", os.path.join(os.path.expanduser("~"), ".cache", "renergies", "rte"))
+
+# Years downloaded at the same time when missing from the cache
+FETCH_WORKERS = int(os.getenv("RTE_FETCH_WORKERS", "4"))
+
+TEXT_COLUMNS = ["Périmètre", "Nature", "Date", "Heures"]
+
+
+def fill_2024_columns(df):
+    new_cols = [
+        "Flux physiques d'Auvergne-Rhône-Alpes vers Auvergne-Rhône-Alpes",
+        "Flux physiques de Bourgogne-Franche-Comté vers Auvergne-Rhône-Alpes",
+        "Flux physiques de Bretagne vers Auvergne-Rhône-Alpes",
+        "Flux physiques de Centre-Val de Loire vers Auvergne-Rhône-Alpes",
+        "Flux physiques de Grand-Est vers Auvergne-Rhône-Alpes",
+        "Flux physiques de Hauts-de-France vers Auvergne-Rhône-Alpes",
+        "Flux physiques d'Ile-de-France vers Auvergne-Rhône-Alpes",
+        "Flux physiques de Normandie vers Auvergne-Rhône-Alpes",
+        "Flux physiques de Nouvelle-Aquitaine vers Auvergne-Rhône-Alpes",
+        "Flux physiques d'Occitanie vers Auvergne-Rhône-Alpes",
+        "Flux physiques de Pays-de-la-Loire vers Auvergne-Rhône-Alpes",
+        "Flux physiques de PACA vers Auvergne-Rhône-Alpes",
+        "Flux physiques de Auvergne-Rhône-Alpes vers Auvergne-Rhône-Alpes",
+        "Flux physiques de Auvergne-Rhône-Alpes vers Bourgogne-Franche-Comté",
+        "Flux physiques de Auvergne-Rhône-Alpes vers Bretagne",
+        "Flux physiques de Auvergne-Rhône-Alpes vers Centre-Val de Loire",
+        "Flux physiques de Auvergne-Rhône-Alpes vers Grand-Est",
+        "Flux physiques de Auvergne-Rhône-Alpes vers Hauts-de-France",
+        "Flux physiques de Auvergne-Rhône-Alpes vers Ile-de-France",
+        "Flux physiques de Auvergne-Rhône-Alpes vers Normandie",
+        "Flux physiques de Auvergne-Rhône-Alpes vers Nouvelle-Aquitaine",
+        "Flux physiques de Auvergne-Rhône-Alpes vers Occitanie",
+        "Flux physiques de Auvergne-Rhône-Alpes vers Pays-de-la-Loire",
+        "Flux physiques de Auvergne-Rhône-Alpes vers PACA",
+        "Flux physiques Allemagne vers Auvergne-Rhône-Alpes",
+        "Flux physiques Belgique vers Auvergne-Rhône-Alpes",
+        "Flux physiques Espagne vers Auvergne-Rhône-Alpes",
+        "Flux physiques Italie vers Auvergne-Rhône-Alpes",
+        "Flux physiques Luxembourg vers Auvergne-Rhône-Alpes",
+        "Flux physiques Royaume-Uni vers Auvergne-Rhône-Alpes",
+        "Flux physiques Suisse vers Auvergne-Rhône-Alpes",
+        "Flux physiques de Auvergne-Rhône-Alpes vers Allemagne",
+        "Flux physiques de Auvergne-Rhône-Alpes vers Belgique",
+        "Flux physiques de Auvergne-Rhône-Alpes vers Espagne",
+        "Flux physiques de Auvergne-Rhône-Alpes vers Italie",
+        "Flux physiques de Auvergne-Rhône-Alpes vers Luxembourg",
+        "Flux physiques de Auvergne-Rhône-Alpes vers Royaume-Uni",
+        "Flux physiques de Auvergne-Rhône-Alpes vers Suisse"
+    ]
+    position = 16
+    for i, col in enumerate(new_cols, start=1):
+        df.insert(position+i, col, "-")
+
+
+def to_float_columns(df):
+    """
+    Convert every column but the text ones to float, the invalid values ("ND", "-") becoming NaN
+    """
+    df = df.copy()
+    cols_float = [c for c in df.columns if c not in TEXT_COLUMNS]
+    df[cols_float] = df[cols_float].apply(
+        lambda col: pd.to_numeric(col, errors="coerce")
+    )
+    return df
+
+
+def source_etag(url):
+    response = requests.head(url, timeout=30)
+    response.raise_for_status()
+    return response.headers["ETag"].strip('"').replace("/", "_")
+
+
+def parse_definitive(url, year):
+    df = pd.read_csv(url, encoding="ISO-8859-1", sep="\t")
+
+    if year == 2024:
+        fill_2024_columns(df)
+
+    df = df.iloc[:-1, :-1] #remove last line and last column
+    return to_float_columns(df)
+
+
+class DefinitiveCache:
+    """
+    Typed Parquet copies of the definitive annual files, named by the ETag of the source file:
+    a year is downloaded and parsed again only when its source changes.
+    """
+
+    def __init__(self, url=RTE_CACHE_URL, workers=FETCH_WORKERS):
+        import fsspec
+
+        self.fs, self.root = fsspec.core.url_to_fs(url)
+        self.workers = workers
+        self.fs.makedirs(self.root, exist_ok=True)
+
+    def _path(self, year, etag):
+        return f"{self.root}/annuel_definitif_{year}_{etag}.parquet"
+
+    def _cached_paths(self, year):
+        return self.fs.glob(f"{self.root}/annuel_definitif_{year}_*.parquet")
+
+    def _read(self, path):
+        with self.fs.open(path, "rb") as f:
+            return pd.read_parquet(f)
+
+    def _write(self, df, path):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with self.fs.open(tmp_path, "wb") as f:
+            df.to_parquet(f, index=False)
+        self.fs.mv(tmp_path, path)
+
+    def get_year(self, year):
+        url = DEFINITIVE_URL.format(year=year)
+
+        try:
+            etag = source_etag(url)
+        except requests.exceptions.RequestException as e:
+            # source unreachable: a previous copy is still valid for a definitive year
+            cached = self._cached_paths(year)
+            if not cached:
+                raise
+            logging.warning(f"Cannot check {url} ({e}), use of the cached copy")
+            return self._read(cached[0])
+
+        path = self._path(year, etag)
+        if self.fs.exists(path):
+            return self._read(path)
+
+        logging.info(f"Download and parse the definitive file of {year}")
+        df = parse_definitive(url, year)
+        self._write(df, path)
+
+        for old_path in self._cached_paths(year):
+            if old_path.rstrip("/") != path.rstrip("/"):
+                self.fs.rm(old_path)
+
+        return df
+
+    def get(self, years=DEFINITIVE_YEARS):
+        """
+        Dataframes of the years, in order. The years missing from the cache are fetched concurrently.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(self.get_year, years))
+
+
+_cache = None
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = DefinitiveCache()
+    return _cache
+
+
+def get_definitive_data(years=DEFINITIVE_YEARS):
+    return get_cache().get(years)
@@ -1,9 +1,12 @@
 ### Importation of the libraries
+import logging
 import requests
+import numpy as np
 import pandas as pd
 from datetime import date, timedelta, datetime
 # from utils import mean, daterange
-import boto3
+import clients
+import freshness
 import os
 from dotenv import load_dotenv
 
@@ -39,7 +42,7 @@ def req_solar(base_url, date, objective='predi'):
     file= f'{date.year}'+f'{date.month:02}'+f'{date.day:02}'+objective_dic[objective]
     url = f"{base_url}/{date.year}/{f'{date.month:02}'}/{file}"
     daily = {"date" : date}
-    print(url)
+    logging.info(url)
     response = requests.get(url)
     if response.status_code == 200:
         return response.text, daily
@@ -50,31 +53,10 @@ def req_solar(base_url, date, objective='predi'):
 
 #--- saving to s3
 def session_boto():
-    # """
-    # create a boto session
-    # """
-    
-    load_dotenv()
-
-    API_KEY_S3 = os.environ["AWS_ACCESS_KEY_ID"]
-    API_SECRET_KEY_S3 = os.environ["AWS_SECRET_ACCESS_KEY"]
-
-    bucket_name = "renergies99-lead-bucket"
-    
-
-    # Liste des dossiers locaux à uploader
-    folders_to_upload = ["prod", "solar", "LandSat", "openweathermap"]
-
-    # Session Boto3
-    session = boto3.Session(
-        aws_access_key_id=API_KEY_S3,
-        aws_secret_access_key=API_SECRET_KEY_S3,
-        region_name="eu-west-3",
-    )
-
-    s3 = session.resource("s3")
-    bucket = s3.Bucket(bucket_name)
-    return bucket
+    """
+    S3 bucket of the project, shared by the process
+    """
+    return clients.s3_bucket()
 
 def to_boto(bucket, folder, key, file):
     nope = {'predi' : "predi_data.csv",
@@ -87,56 +69,70 @@ def to_boto(bucket, folder, key, file):
 
 #----Extractiont Prediction data------
 
-def get_date(info):
-    day = info[2].split()
-    ind = [f'{day[x]}-{day[x+1]}-{day[x+2]}' for x in range(0,len(day), 3)]
-    ind = pd.to_datetime(ind)
-    return ind
-
-def get_data(info):
+# Sections of daypre.txt left out of the predictions
+SKIPPED_SECTIONS = {"Product", "Issued", "Polar_cap", "Reg_Prob"}
 
-    data = []
-    info_joined = ' '.join(info)
-    info_split = info_joined.splitlines()[2:]
-    for line in info_split:
-        if 'Solar' in info_joined:
-            data.append([float(x) for x in line.split()])
-        else:
-            data.append([float(x) for x in line.split()[1:]])
-        df_temp = pd.DataFrame(data)
-    return df_temp.mean().tolist()
+# Section kept from a single row instead of the mean of its rows
+SECTION_ROW = {"Geomagnetic_A_indices": "A_Planetary"}
 
+PREDI_COLUMNS = {
+    'Geomagnetic_A_indices' : 'Ap',
+    'Pred_Mid_k' : 'K index Planetary',
+    '10cm_flux' : '10cm'
+}
 
 def solar_predi_parse(text):
-    col_name = {
-        'Geomagnetic_A_indices' : 'Ap',
-        'Pred_Mid_k' : 'K index Planetary',
-        '10cm_flux' : '10cm'
-    }
-    # col = []
-    test_split = text.split('#')[6:]
-    for i in range(0, len(test_split), 2):
-        if len(test_split[i]) > 3:
-            info = test_split[i].split(':')
-            if i == 0:
-                ind = get_date(info)
-                print(ind)
-                # col.append(info[3])
-                data = get_data(info[4:])
-                df = pd.DataFrame(data, columns=[info[3]], index=ind)
-                df['date'] = ind
-                print(df)
-                # df.index.set_names()
-            else:
-                print(info)
-                if info[1] not in ['Polar_cap', 'Reg_Prob']:
-                    
-                    data = get_data(info)
-                    print(data)
-                    df[info[1]] = data
-
-    df = df.rename(columns=col_name)
-    return df
+    """
+    Parse a daypre.txt text in a single pass: one row per predicted day
+    with the mean of the rows of every section
+    """
+    if not text:
+        raise ValueError("Empty daypre.txt text")
+
+    dates = None
+    names, starts, tokens = [], [], []
+    name = None
+    n_rows = 0
+
+    for line in text.splitlines():
+        if line.startswith("#") or not line.strip():
+            continue
+
+        if line.startswith(":"):
+            _, name, rest = line.split(":", 2)
+            if name == "Prediction_dates":
+                day = rest.split()
+                dates = pd.to_datetime([" ".join(day[x:x + 3]) for x in range(0, len(day), 3)], format="%Y %b %d")
+                name = None
+            elif name in SKIPPED_SECTIONS:
+                name = None
+            continue
+
+        if name is None or dates is None:
+            continue
+        values = line.split()
+        if name in SECTION_ROW and values[0] != SECTION_ROW[name]:
+            continue
+        if not names or names[-1] != name:
+            names.append(name)
+            starts.append(n_rows)
+
+        # the values of the days are the last columns, after the row label
+        tokens.extend(values[-len(dates):])
+        n_rows += 1
+
+    if dates is None or not names:
+        raise ValueError("No prediction found in the daypre.txt text")
+
+    # '?' (missing values) become NaN and are left out of the means
+    values = pd.to_numeric(pd.Series(tokens, dtype=object), errors="coerce").to_numpy(dtype=float).reshape(n_rows, len(dates))
+    known = ~np.isnan(values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.add.reduceat(np.where(known, values, 0.0), starts, axis=0) / np.add.reduceat(known, starts, axis=0)
+
+    df = pd.DataFrame(means.T, columns=names, index=dates)
+    df.insert(1, "date", dates)
+    return df.rename(columns=PREDI_COLUMNS)
 
 def fetch_predi(base_url, day, objective):
     data, _ = req_solar(base_url, day, objective)
@@ -145,6 +141,7 @@ def fetch_predi(base_url, day, objective):
     to_boto(bucket, "public/solar/", "predi_data.csv", df.to_csv())
 
     to_boto(bucket, "public/solar/", last_download_filename, getNow().encode("utf-8"))
+    freshness.manifest.record("solar", df, getNow())
 
     return df
 
@@ -153,32 +150,12 @@ def api_fetch_predi():
                        (datetime.today().date()-timedelta(days=1)), 
                        "predi")
 
-def s3_cred():
-    load_dotenv()
-
-    return boto3.client(
-        "s3",
-        aws_access_key_id=API_KEY_S3,
-        aws_secret_access_key=API_SECRET_KEY_S3,
-        region_name="eu-west-3"
-    )
-
-s3 = s3_cred()
-
 def getNow():
     return datetime.now().strftime("%Y-%m-%d")
 
 def get_solar_last_download():
-    try:
-        key = f"public/solar/{last_download_filename}"
-
-        obj = s3.get_object(Bucket=bucket_name, Key=key)
-        ligne = obj["Body"].read().decode("utf-8")
-
-    except:
-        return "Cannot get rte last download data"
-    
-    return ligne
+    # served from the freshness manifest held in memory
+    return freshness.manifest.last_download("solar") or "Cannot get rte last download data"
 
 
 def is_solar_data_already_downloaded():
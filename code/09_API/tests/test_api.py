@@ -1,9 +1,12 @@
 from app import app
+from model_holder import ModelHolder, LoadedModel, production_model
+import app_func as af
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
 
 from fastapi.responses import StreamingResponse
 import io
+import threading
 
 import pytest
 import pandas as pd
@@ -46,9 +49,15 @@ def test_predict():
     csv_data = read_csv_file('tests/data/data_compile_predi.csv')
     sample_df = pd.read_csv(io.StringIO(csv_data))
     
+    production_model._current = None
+
     with patch('pandas.read_csv') as mock_read_csv, \
-        patch('mlflow.pyfunc.load_model') as mock_load_model, \
+        patch('model_cache.load_model') as mock_load_model, \
+        patch.object(production_model, '_resolve', return_value=MagicMock(version="1", run_id="r1")), \
+        patch.object(production_model, '_load_error_table', return_value=None), \
         patch('app_func.to_boto') as mock_to_boto, \
+        patch('freshness.manifest.record') as mock_record, \
+        patch('freshness.manifest.last_download', return_value="2026-01-07") as mock_last_download, \
         patch('app.getNow') as mock_get_now :
         
         # Configure the data
@@ -91,4 +100,255 @@ def test_predict():
         mock_load_model.assert_called_once()
         mock_model.predict.assert_called_once()
         assert mock_to_boto.call_count == 2
+        assert mock_record.call_args.args[0] == "prediction"
         mock_get_now.assert_called_once()
+
+        # same day: only the predictions are written
+        mock_last_download.return_value = "2026-01-08"
+        response = client.post("/predict")
+        assert response.status_code == 200
+        assert mock_to_boto.call_count == 3
+        assert mock_record.call_count == 1
+
+
+def test_model_holder_swap():
+    holder = ModelHolder()
+
+    with patch('model_cache.load_model') as mock_load_model, \
+        patch.object(holder, '_load_error_table', return_value=None), \
+        patch.object(holder, '_resolve') as mock_resolve:
+
+        mock_load_model.side_effect = lambda uri: MagicMock(name=uri)
+        mock_resolve.return_value = MagicMock(version="1", run_id="r1")
+
+        first = holder.get()
+        assert first.version == "1"
+
+        # Model is resident: no reload while the alias does not move
+        assert holder.get() is first
+        assert holder.refresh() is False
+        mock_load_model.assert_called_once_with("models:/SolarProdModel/1")
+
+        # Alias moved: the new version is swapped in, the old snapshot is untouched
+        mock_resolve.return_value = MagicMock(version="2", run_id="r2")
+        assert holder.refresh() is True
+
+        second = holder.get()
+        assert second.version == "2"
+        assert first.version == "1"
+        mock_load_model.assert_called_with("models:/SolarProdModel/2")
+
+def test_model_holder_concurrent_refresh():
+    holder = ModelHolder()
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_load(uri):
+        started.set()
+        release.wait(5)
+        return MagicMock(name=uri)
+
+    with patch('model_cache.load_model', side_effect=slow_load) as mock_load_model, \
+        patch.object(holder, '_load_error_table', return_value=None), \
+        patch.object(holder, '_resolve', return_value=MagicMock(version="3", run_id="r3")):
+
+        # the poller is loading version 3 when /reload_model asks for a refresh
+        results = []
+        poller = threading.Thread(target=lambda: results.append(holder.refresh()))
+        poller.start()
+        started.wait(5)
+        reload = threading.Thread(target=lambda: results.append(holder.refresh()))
+        reload.start()
+        release.set()
+        poller.join(5)
+        reload.join(5)
+
+        assert sorted(results) == [False, True]
+        mock_load_model.assert_called_once_with("models:/SolarProdModel/3")
+
+def test_predict_batch():
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.table({
+        "time": pd.to_datetime(["2026-01-08", "2026-01-09", "2026-01-10"]),
+        "Moulins_temp": [1.0, 2.0, 3.0],
+        "Moulins_clouds": [10.0, 20.0, 30.0],
+    })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    mock_model = MagicMock()
+    mock_model.metadata.get_input_schema.return_value = None
+    mock_model.predict.side_effect = lambda df: df["Moulins_temp"].to_numpy() * 10
+
+    with patch.object(production_model, 'get', return_value=LoadedModel("SolarProdModel", "3", mock_model)):
+        response = client.post("/predict_batch?output=parquet",
+                               content=sink.getvalue().to_pybytes(),
+                               headers={"Content-Type": "application/vnd.apache.arrow.stream"})
+
+        assert response.status_code == 200
+        assert response.headers["X-Model-Version"] == "3"
+        mock_model.predict.assert_called_once()
+
+        result = pq.read_table(io.BytesIO(response.content)).to_pandas()
+        assert result.columns.tolist() == ["time", "prediction", "error"]
+        assert result["prediction"].tolist() == [10.0, 20.0, 30.0]
+        assert result["error"].tolist() == [0.0, 0.0, 0.0]
+        assert result["time"].dt.strftime("%Y-%m-%d").tolist() == ["2026-01-08", "2026-01-09", "2026-01-10"]
+
+        # no time column
+        buffer = io.BytesIO()
+        pq.write_table(table.drop(["time"]), buffer)
+        response = client.post("/predict_batch", content=buffer.getvalue(),
+                               headers={"Content-Type": "application/vnd.apache.parquet"})
+        assert response.status_code == 422
+
+        response = client.post("/predict_batch", content=b"a,b", headers={"Content-Type": "text/csv"})
+        assert response.status_code == 415
+
+
+def test_get_std_vector():
+    table = pd.DataFrame({
+        "min": [0.0, 10.0, 25.0],
+        "max": [10.0, 25.0, 60.0],
+        "std": [1.0, 2.0, 3.0],
+    })
+    edges = np.array([0.0, 10.0, 25.0, 60.0])
+    std = table["std"].to_numpy()
+
+    predictions = np.array([-5.0, 0.0, 5.0, 10.0, 10.5, 25.0, 59.0, 60.0, 100.0])
+    expected = [1.0, 1.0, 1.0, 1.0, 2.0, 2.0, 3.0, 3.0, 3.0]
+
+    assert af.get_std_vector(predictions, edges, std).tolist() == expected
+    assert [af.get_std(x, table) for x in predictions] == expected
+
+    loaded_model = LoadedModel("SolarProdModel", "1", MagicMock(), error_table=(edges, std))
+    loaded_model.model.predict.return_value = np.array([5.0, 30.0])
+    prediction, error = loaded_model.predict_with_error(pd.DataFrame())
+    assert error.tolist() == [1.0, 3.0]
+
+def test_rte_data_conditional_get_and_cache():
+    import rte
+    rte.rte_data_cache.clear()
+
+    with patch('rte.get_rte_last_download', return_value="2026-01-08") as mock_marker, \
+        patch('rte.rte_csv_chunks', return_value=iter(["Date,Heures\n", "2026-01-07,00:00\n"])) as mock_chunks:
+
+        endpoint = "/rte_data?deb=2026&fin=2026&type=rte_regional"
+        response = client.get(endpoint)
+        assert response.status_code == 200
+        assert response.text == "Date,Heures\n2026-01-07,00:00\n"
+        etag = response.headers["ETag"]
+        assert response.headers["Last-Modified"] == "Thu, 08 Jan 2026 00:00:00 GMT"
+
+        # client already has this version
+        response = client.get(endpoint, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        response = client.get(endpoint, headers={"If-Modified-Since": "Thu, 08 Jan 2026 00:00:00 GMT"})
+        assert response.status_code == 304
+
+        # served from the in-process cache
+        response = client.get(endpoint)
+        assert response.text == "Date,Heures\n2026-01-07,00:00\n"
+        assert mock_chunks.call_count == 1
+
+        # other parameters, other ETag
+        mock_chunks.return_value = iter(["Date,Heures\n"])
+        response = client.get("/rte_data?deb=2025&fin=2026&type=rte_regional", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+        # a new download invalidates ETag and cache
+        mock_marker.return_value = "2026-01-09"
+        mock_chunks.return_value = iter(["Date,Heures\n", "2026-01-08,00:00\n"])
+        response = client.get(endpoint, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.text == "Date,Heures\n2026-01-08,00:00\n"
+        assert mock_chunks.call_count == 3
+
+def test_rte_data_formats():
+    import gzip
+    import pyarrow as pa
+    import batch_io
+    import rte
+    rte.rte_data_cache.clear()
+
+    def partitions(*args, **kwargs):
+        yield ["Date", "Heures", "Nucleaire"]
+        yield [("2026-01-07", "00:00", "41000"), ("2026-01-07", "00:30", None)]
+
+    with patch('rte.get_rte_last_download', return_value="2026-01-08"), \
+        patch('rte.rte_row_partitions', side_effect=partitions):
+
+        response = client.get("/rte_data?deb=2026&fin=2026&format=parquet")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == batch_io.PARQUET
+        assert "rte_national.parquet" in response.headers["content-disposition"]
+        df = pd.read_parquet(io.BytesIO(response.content))
+        assert df.columns.tolist() == ["Datetime", "Date", "Heures", "Nucleaire"]
+        assert df["Datetime"].tolist() == [pd.Timestamp("2026-01-07 00:00"), pd.Timestamp("2026-01-07 00:30")]
+        assert df["Nucleaire"].dtype == float and df["Nucleaire"].isna().tolist() == [False, True]
+
+        response = client.get("/rte_data?deb=2026&fin=2026&format=arrow")
+        table = pa.ipc.open_stream(response.content).read_all()
+        assert table.schema.field("Datetime").type == pa.timestamp("s")
+
+        response = client.get("/rte_data?deb=2026&fin=2026&format=csv.gz")
+        assert response.headers["content-type"] == "application/gzip"
+        assert gzip.decompress(response.content).decode() == "Date,Heures,Nucleaire\n2026-01-07,00:00,41000\n2026-01-07,00:30,\n"
+
+        response = client.get("/rte_data?deb=2026&fin=2026&format=xml")
+        assert response.status_code == 422
+
+def test_rte_data_projection_and_resampling():
+    import rte
+    rte.rte_data_cache.clear()
+
+    with patch('rte.get_rte_last_download', return_value="2026-01-08"), \
+        patch('rte.rte_csv_chunks', return_value=iter(["Date,Heures,Gaz\n"])) as mock_chunks:
+
+        response = client.get("/rte_data?deb=2026&fin=2026&columns=Gaz,Solaire&granularity=day&agg=max")
+        assert response.status_code == 200
+        mock_chunks.assert_called_once_with(2026, 2026, "rte_national", columns=["Gaz", "Solaire"], granularity="day", agg="max")
+
+        response = client.get("/rte_data?deb=2026&fin=2026&columns=Password")
+        assert response.status_code == 400
+
+def test_app_import_does_not_load_heavy_libraries():
+    import subprocess
+    import sys
+
+    heavy = ["mlflow", "sklearn", "pvlib", "seaborn", "matplotlib", "boto3", "sqlalchemy"]
+    code = f"import sys, app; print([m for m in {heavy} if m in sys.modules])"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_load_endpoints_return_a_job():
+    import threading
+    import time
+    import jobs
+
+    release = threading.Event()
+
+    def load(job):
+        release.wait(5)
+        return 10
+
+    with patch.dict(jobs.queue._functions, {"solar": (load, 1)}):
+        response = client.get("/load_solar_data")
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] in ("queued", "running")
+        assert job["status_url"] == f"/jobs/{job['job_id']}"
+
+        release.set()
+        deadline = time.monotonic() + 5
+        while client.get(job["status_url"]).json()["status"] != "succeeded" and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        state = client.get(job["status_url"]).json()
+        assert state["rows"] == 10
+        assert client.get("/jobs/unknown").status_code == 404
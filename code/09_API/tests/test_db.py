@@ -0,0 +1,27 @@
+import os
+from unittest.mock import patch
+
+from sqlalchemy import text
+
+import db
+
+
+def test_engine_is_shared_and_recreated_after_fork(tmp_path):
+    with patch.dict(os.environ, {"DATABASE_URL": f"sqlite:///{tmp_path}/test.db"}), \
+        patch.object(db, "_engine", None):
+
+        engine = db.get_engine()
+        assert db.get_engine() is engine
+
+        with db.connect() as conn:
+            assert conn.execute(text("select 1")).scalar() == 1
+
+            stats = db.pool_stats()
+            assert stats["checked_out"] == 1
+            assert stats["connections"] >= 1
+
+        assert db.pool_stats()["checked_out"] == 0
+
+        # simulate a worker forked after the engine was created
+        with patch.object(db, "_engine_pid", -1):
+            assert db.get_engine() is not engine
@@ -0,0 +1,89 @@
+import hashlib
+import io
+import json
+from unittest.mock import MagicMock
+
+import pandas as pd
+from botocore.exceptions import ClientError
+
+from freshness import FreshnessManifest, df_hash
+
+
+def etag(body):
+    return '"' + hashlib.md5(body).hexdigest() + '"'
+
+
+def fake_s3(objects):
+    """Helper returning a mocked S3 client backed by a dict, with conditional writes"""
+    def get_object(Bucket, Key):
+        if Key not in objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": io.BytesIO(objects[Key]), "ETag": etag(objects[Key])}
+
+    def put_object(Bucket, Key, Body, IfMatch=None, IfNoneMatch=None, **kwargs):
+        current = objects.get(Key)
+        if (IfMatch is not None and (current is None or etag(current) != IfMatch)) or \
+                (IfNoneMatch == "*" and current is not None):
+            raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "PutObject")
+        objects[Key] = Body
+
+    client = MagicMock()
+    client.get_object.side_effect = get_object
+    client.put_object.side_effect = put_object
+    return client
+
+
+def test_manifest_is_cached_and_built_from_markers():
+    objects = {"public/prod/rte_last_download": b"2026-01-08"}
+    client = fake_s3(objects)
+    manifest = FreshnessManifest(ttl=60, client=client)
+
+    assert manifest.last_download("rte") == "2026-01-08"
+    assert manifest.last_download("solar") is None
+    calls = client.get_object.call_count
+
+    # served from memory until the ttl expires
+    for _ in range(100):
+        manifest.last_download("rte")
+    assert client.get_object.call_count == calls
+
+
+def test_record_writes_manifest():
+    objects = {"public/prod/rte_last_download": b"2026-01-08"}
+    client = fake_s3(objects)
+    manifest = FreshnessManifest(ttl=60, client=client)
+    df = pd.DataFrame({"a": [1, 2, 3]})
+
+    entry = manifest.record("solar", df, "2026-01-09")
+
+    assert entry["rows"] == 3 and entry["hash"] == df_hash(df)
+    stored = json.loads(objects["public/freshness.json"])
+    assert stored["solar"]["last_download"] == "2026-01-09"
+    assert stored["rte"]["last_download"] == "2026-01-08"
+
+    # the writing worker sees the new entry at once, another one after its ttl
+    assert manifest.last_download("solar") == "2026-01-09"
+    assert FreshnessManifest(ttl=60, client=client).last_download("solar") == "2026-01-09"
+
+
+def test_concurrent_records_are_kept():
+    objects = {}
+    client = fake_s3(objects)
+    manifest = FreshnessManifest(ttl=60, client=client)
+    other = FreshnessManifest(ttl=60, client=client)
+
+    # another worker records rte between the read and the write of this one
+    put_object = client.put_object.side_effect
+
+    def put_after_other(*args, **kwargs):
+        client.put_object.side_effect = put_object
+        other.record("rte", last_download="2026-01-08")
+        return put_object(*args, **kwargs)
+
+    client.put_object.side_effect = put_after_other
+    manifest.record("solar", last_download="2026-01-09")
+
+    stored = json.loads(objects["public/freshness.json"])
+    assert stored["rte"]["last_download"] == "2026-01-08"
+    assert stored["solar"]["last_download"] == "2026-01-09"
+    assert client.put_object.call_count == 3
@@ -0,0 +1,78 @@
+import io
+import json
+from unittest.mock import patch
+
+import geocoding
+
+
+class FakeS3:
+    def __init__(self, content=None):
+        self.body = None if content is None else json.dumps(content).encode("utf-8")
+        self.puts = 0
+
+    def get_object(self, Bucket, Key):
+        from botocore.exceptions import ClientError
+
+        if self.body is None:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": io.BytesIO(self.body)}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.body = Body
+        self.puts += 1
+
+    def content(self):
+        return json.loads(self.body)
+
+
+def fake_lookup(city, **kwargs):
+    return {"name": city.replace("Saint-Etienne", "Saint-Étienne"), "lat": "1.0", "lon": "2.0", "updated_at": "2026-01-01"}
+
+
+def test_normalize_city():
+    assert geocoding.normalize_city(" Saint-Étienne") == geocoding.normalize_city("saint etienne") == "saint etienne"
+
+
+def test_old_format_migrated_without_lookup():
+    s3 = FakeS3({"Saint-Étienne": {"lat": "45.43", "lon": "4.38"}, "Annecy": {"lat": "45.89", "lon": "6.12"}})
+
+    with patch.object(geocoding, "lookup") as lookup:
+        coords = geocoding.GeocodingCache(client=s3).coordinates(["Annecy", "Saint-Etienne"])
+
+    lookup.assert_not_called()
+    assert coords == {"Annecy": {"lat": "45.89", "lon": "6.12"}, "Saint-Étienne": {"lat": "45.43", "lon": "4.38"}}
+    assert s3.content()["version"] == geocoding.CACHE_VERSION
+    assert sorted(s3.content()["cities"]) == ["annecy", "saint etienne"]
+
+
+def test_only_new_and_stale_cities_are_looked_up():
+    s3 = FakeS3({"version": 2, "cities": {
+        "annecy": {"name": "Annecy", "lat": "45.89", "lon": "6.12", "updated_at": "2000-01-01"},
+        "moulins": {"name": "Moulins", "lat": "46.56", "lon": "3.33", "updated_at": "2099-01-01"},
+    }})
+
+    with patch.object(geocoding, "lookup", side_effect=fake_lookup) as lookup:
+        coords = geocoding.GeocodingCache(client=s3).coordinates(["Moulins", "Annecy", "Nyons"])
+
+    assert sorted(call.args[0] for call in lookup.call_args_list) == ["Annecy", "Nyons"]
+    assert coords["Moulins"] == {"lat": "46.56", "lon": "3.33"}
+    assert coords["Nyons"] == {"lat": "1.0", "lon": "2.0"}
+    assert s3.puts == 1
+
+    # everything cached now: no lookup and no write
+    with patch.object(geocoding, "lookup") as lookup:
+        geocoding.GeocodingCache(client=s3).coordinates(["Moulins", "Nyons"])
+    lookup.assert_not_called()
+    assert s3.puts == 1
+
+
+def test_failed_refresh_keeps_the_stale_entry():
+    s3 = FakeS3({"version": 2, "cities": {
+        "annecy": {"name": "Annecy", "lat": "45.89", "lon": "6.12", "updated_at": "2000-01-01"},
+    }})
+
+    with patch.object(geocoding, "lookup", side_effect=ConnectionError("down")):
+        coords = geocoding.GeocodingCache(client=s3).coordinates(["Annecy"])
+
+    assert coords == {"Annecy": {"lat": "45.89", "lon": "6.12"}}
+    assert s3.puts == 0
@@ -0,0 +1,51 @@
+import ast
+import logging
+import os
+import time
+from unittest.mock import patch
+
+import requests
+from fastapi.testclient import TestClient
+
+import jobs
+from app import app
+
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Clients of the /load_* endpoints, each with its own copy of wait_for_job
+CLIENTS = ["04_Dashboarding/app.py", "10_Airflow/dags/update_data.py"]
+
+
+def function_source(path, name):
+    with open(os.path.join(CODE_DIR, path), encoding="utf-8") as f:
+        source = f.read()
+    node = next(node for node in ast.parse(source).body if isinstance(node, ast.FunctionDef) and node.name == name)
+    return ast.get_source_segment(source, node)
+
+
+def test_wait_for_job_copies_are_identical():
+    sources = [function_source(path, "wait_for_job") for path in CLIENTS]
+    assert sources[0] == sources[1]
+
+
+def test_wait_for_job_follows_a_load(tmp_path):
+    namespace = {"requests": requests, "time": time, "logging": logging}
+    exec(function_source(CLIENTS[0], "wait_for_job"), namespace)
+    wait_for_job = namespace["wait_for_job"]
+
+    def load(job):
+        job.step(0.5, "half way")
+        return 42
+
+    queue = jobs.JobQueue(state_dir=str(tmp_path))
+    queue.register("rte", load)
+    client = TestClient(app)
+    url = "http://testserver/load_rte_data"
+
+    # the clients poll with requests, answered by the app
+    with patch("jobs.queue", queue), patch("requests.get", side_effect=lambda url, **kwargs: client.get(url)):
+        response = requests.get(url, timeout=30)
+        assert response.status_code == 202
+        job = wait_for_job(url, response.json(), timeout=10, interval=0.01)
+
+    assert job["status"] == "succeeded" and job["rows"] == 42
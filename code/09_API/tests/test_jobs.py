@@ -0,0 +1,130 @@
+import threading
+import time
+
+import jobs
+
+
+def wait_done(job, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not job.done and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+def test_job_reports_progress_rows_and_duration(tmp_path):
+    queue = jobs.JobQueue(state_dir=str(tmp_path))
+    release = threading.Event()
+
+    def load(job):
+        job.step(0.5, "halfway")
+        release.wait(5)
+        return 42
+
+    queue.register("rte", load)
+    job = queue.submit("rte")
+
+    # an identical job is not started twice
+    assert queue.submit("rte") is job
+    deadline = time.monotonic() + 5
+    while job.message != "halfway" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.to_dict()["status"] == jobs.RUNNING
+    assert job.to_dict()["progress"] == 0.5
+
+    release.set()
+    state = wait_done(job).to_dict()
+    assert state["status"] == jobs.SUCCEEDED
+    assert state["rows"] == 42
+    assert state["progress"] == 1.0
+    assert state["duration_s"] >= 0
+    assert queue.get(job.id) is job
+
+    # finished: a new submit starts a new job
+    assert queue.submit("rte") is not job
+    queue.shutdown(wait=True)
+
+
+def test_job_failure_and_concurrency_limit(tmp_path):
+    queue = jobs.JobQueue(state_dir=str(tmp_path))
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def load(job, day):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        if day == 3:
+            raise ValueError("no data")
+        return day
+
+    queue.register("solar", load, concurrency=2)
+    submitted = [queue.submit("solar", day) for day in range(6)]
+    for job in submitted:
+        wait_done(job)
+
+    assert peak[0] == 2
+    assert [job.status for job in submitted].count(jobs.FAILED) == 1
+    assert submitted[3].error == "ValueError: no data"
+    assert [job.rows for job in queue.list("solar")] == [5, 4, None, 2, 1, 0]
+    queue.shutdown(wait=True)
+
+
+def test_single_flight_across_workers(tmp_path):
+    # two queues on the same directory stand for two worker processes
+    first, second = jobs.JobQueue(state_dir=str(tmp_path)), jobs.JobQueue(state_dir=str(tmp_path))
+    release = threading.Event()
+    calls = []
+
+    def load(job):
+        calls.append(job.id)
+        job.step(0.5, "downloading")
+        release.wait(5)
+        return 7
+
+    first.register("rte", load)
+    second.register("rte", load)
+
+    job = first.submit("rte")
+    attached = second.submit("rte")
+
+    # the second worker follows the job of the first one
+    assert isinstance(attached, jobs.StoredJob)
+    assert attached.id == job.id
+    assert second.get(job.id).to_dict()["source"] == "rte"
+
+    release.set()
+    wait_done(job)
+    state = second.get(job.id).to_dict()
+    assert state["status"] == jobs.SUCCEEDED
+    assert state["rows"] == 7
+    assert calls == [job.id]
+
+    # once done, a new trigger starts a new load
+    again = second.submit("rte")
+    assert isinstance(again, jobs.Job) and again.id != job.id
+    wait_done(again)
+    first.shutdown(wait=True)
+    second.shutdown(wait=True)
+
+
+def test_job_of_a_dead_worker_is_replaced(tmp_path):
+    queue = jobs.JobQueue(state_dir=str(tmp_path))
+    queue.register("solar", lambda job: 3)
+
+    # state left by a worker killed during the job: its lock is gone with it
+    key = ("solar", (), ())
+    key_id = f"solar-{jobs.hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]}"
+    dead = jobs.Job("solar", key, str(tmp_path / "dead.json"))
+    dead.id = "dead"
+    dead.status = jobs.RUNNING
+    dead.save()
+    jobs._write_json(str(tmp_path / f"{key_id}.current"), "dead")
+
+    job = queue.submit("solar")
+    assert job.id != "dead"
+    assert wait_done(job).rows == 3
+    assert queue.get("dead").to_dict()["status"] == jobs.FAILED
+    queue.shutdown(wait=True)
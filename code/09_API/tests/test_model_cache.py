@@ -0,0 +1,124 @@
+import fcntl
+import os
+
+import model_cache
+from model_cache import ArtifactCache
+
+
+def fake_download(content, calls):
+    """Helper returning a download function writing a small model tree"""
+    def download(dst_dir):
+        calls.append(dst_dir)
+        model_dir = os.path.join(dst_dir, "model")
+        os.makedirs(model_dir)
+        with open(os.path.join(model_dir, "MLmodel"), "w") as f:
+            f.write("flavors: {}\n")
+        with open(os.path.join(model_dir, "model.pkl"), "wb") as f:
+            f.write(content)
+        return model_dir
+    return download
+
+
+def test_cache_hit_does_not_download(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_bytes=10_000)
+    calls = []
+
+    path = cache.get("models/SolarProdModel/1", fake_download(b"v1", calls))
+    # a new instance (other worker, restart) reuses the same files
+    same_path = ArtifactCache(str(tmp_path)).get("models/SolarProdModel/1", fake_download(b"v1", calls))
+
+    assert path == same_path
+    assert len(calls) == 1
+    with open(os.path.join(path, "model.pkl"), "rb") as f:
+        assert f.read() == b"v1"
+
+
+def test_cache_hit_does_not_hash_unchanged_files(tmp_path, monkeypatch):
+    cache = ArtifactCache(str(tmp_path), max_bytes=10_000)
+    calls = []
+    path = cache.get("models/SolarProdModel/1", fake_download(b"v1", calls))
+
+    def no_hash(root):
+        raise AssertionError("unchanged files must not be hashed")
+    monkeypatch.setattr(model_cache, "tree_checksums", no_hash)
+
+    assert cache.get("models/SolarProdModel/1", fake_download(b"v1", calls)) == path
+    assert len(calls) == 1
+
+
+def test_cache_download_does_not_hold_the_lock(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_bytes=10_000)
+    download = fake_download(b"v1", [])
+
+    def download_checking_lock(dst_dir):
+        # another worker can still take the lock while this one downloads
+        with open(os.path.join(cache.root, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return download(dst_dir)
+
+    path = cache.get("models/SolarProdModel/1", download_checking_lock)
+    assert os.path.isfile(os.path.join(path, "model.pkl"))
+
+
+def test_cache_is_content_addressed(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_bytes=10_000)
+    calls = []
+
+    path_v1 = cache.get("models/SolarProdModel/1", fake_download(b"same", calls))
+    path_run = cache.get("runs/abc/pipeline_model", fake_download(b"same", calls))
+
+    assert path_v1 == path_run
+    assert len(os.listdir(cache.objects_dir)) == 1
+
+
+def test_cache_redownloads_corrupted_entry(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_bytes=10_000)
+    calls = []
+
+    path = cache.get("models/SolarProdModel/1", fake_download(b"v1", calls))
+    with open(os.path.join(path, "model.pkl"), "wb") as f:
+        f.write(b"corrupted")
+
+    path = cache.get("models/SolarProdModel/1", fake_download(b"v1", calls))
+
+    assert len(calls) == 2
+    with open(os.path.join(path, "model.pkl"), "rb") as f:
+        assert f.read() == b"v1"
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    # each entry is ~ 1 kB, only two fit in the cache
+    cache = ArtifactCache(str(tmp_path), max_bytes=2_500)
+    calls = []
+
+    cache.get("models/SolarProdModel/1", fake_download(b"1" * 1000, calls))
+    cache.get("models/SolarProdModel/2", fake_download(b"2" * 1000, calls))
+    os.utime(cache._ref_path("models/SolarProdModel/1"), (0, 0))
+    os.utime(cache._ref_path("models/SolarProdModel/2"), (10, 10))
+
+    cache.get("models/SolarProdModel/3", fake_download(b"3" * 1000, calls))
+
+    assert cache._read_ref("models/SolarProdModel/1") is None
+    assert cache._read_ref("models/SolarProdModel/2") is not None
+    assert cache._read_ref("models/SolarProdModel/3") is not None
+    assert len(os.listdir(cache.objects_dir)) == 2
+
+
+def test_download_single_file_artifact(tmp_path):
+    import model_cache
+    from unittest.mock import patch
+
+    def fake_mlflow_download(artifact_uri, dst_path):
+        path = os.path.join(dst_path, "error_table.json")
+        with open(path, "w") as f:
+            f.write('{"edges": [0, 1], "std": [0.5]}')
+        return path
+
+    with patch.object(model_cache, "_cache", ArtifactCache(str(tmp_path))), \
+        patch("mlflow.artifacts.download_artifacts", side_effect=fake_mlflow_download) as mock_download:
+
+        path = model_cache.download_artifacts("runs:/r1/error_table.json")
+        assert os.path.basename(path) == "error_table.json"
+        assert model_cache.download_artifacts("runs:/r1/error_table.json") == path
+        mock_download.assert_called_once()
@@ -0,0 +1,116 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+import requests
+
+import openweathermap as owm
+import ratelimit
+
+
+def response(status, payload=None, headers=None):
+    resp = MagicMock(status_code=status, headers=headers or {})
+    resp.json.return_value = payload
+    if status >= 400:
+        resp.raise_for_status.side_effect = requests.exceptions.HTTPError(f"HTTP {status}")
+    return resp
+
+
+class FakeSession:
+    """
+    Answers per latitude: a list of responses (or exceptions) returned in turn
+    """
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get(self, url, timeout=None, params=None):
+        assert timeout == owm.OWM_TIMEOUT
+        with self.lock:
+            self.calls.append(params["lat"])
+            answer = self.answers[params["lat"]].pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def test_get_with_retry_backs_off_on_429_and_errors():
+    session = FakeSession({1: [
+        response(429, headers={"Retry-After": "0"}),
+        requests.exceptions.ConnectionError("reset"),
+        response(200, {"daily": []}),
+    ]})
+
+    with patch("time.sleep") as sleep:
+        resp = ratelimit.get_with_retry(session, "https://example.org", retries=3, backoff=0.5,
+                                        timeout=owm.OWM_TIMEOUT, params={"lat": 1})
+
+    assert resp.status_code == 200
+    assert len(session.calls) == 3
+    # exponential: 0.5 s then 1 s, plus up to 50 % of jitter
+    first, second = [call.args[0] for call in sleep.call_args_list]
+    assert 0.5 <= first <= 0.75
+    assert 1 <= second <= 1.5
+
+
+def test_fetch_forecasts_concurrently():
+    cities_coord = {f"city{i}": {"lat": i, "lon": 0} for i in range(20)}
+    answers = {i: [response(200, {"daily": [{"dt": i}]})] for i in range(20)}
+    answers[3] = [response(503), response(200, {"daily": [{"dt": 3}]})]
+    answers[7] = [response(401)]
+
+    session = FakeSession(answers)
+    # the 1000/s limiter of the test is not left in the process
+    with patch("clients.http_session", return_value=session), \
+            patch.object(owm, "OWM_BACKOFF", 0), \
+            patch.dict(ratelimit._limiters, clear=True):
+        forecasts = owm.fetch_forecasts(cities_coord, "key", workers=4, requests_per_minute=60000)
+
+    # the city in error is left out, the 503 is retried
+    assert sorted(forecasts) == sorted(city for city in cities_coord if city != "city7")
+    assert forecasts["city3"] == [{"dt": 3}]
+    assert session.calls.count(3) == 2
+    assert len(session.calls) == 21
+
+
+def daily_forecast(dt, **extra):
+    return {"dt": dt, "sunrise": dt - 20000, "sunset": dt + 20000, "temp": {"day": 12.5}, "feels_like": {"day": 11.0},
+            "pressure": 1013, "humidity": 80, "dew_point": 7.2, "clouds": 40, "wind_speed": 3.1, "wind_deg": 250,
+            "weather": [{"main": "Rain", "description": "light rain"}], **extra}
+
+
+def test_json_to_dataframe_columns():
+    from datetime import datetime
+
+    cities_coord = {
+        "Annecy": {"lat": "45.89", "lon": "6.12", "daily": [daily_forecast(1767261600, rain=1.5), daily_forecast(1767348000)]},
+        "Nyons": {"lat": "44.36", "lon": "5.14", "daily": [daily_forecast(1767261600, snow=0.3)]},
+        "Moulins": {"lat": "46.56", "lon": "3.33", "daily": [{"dt": 1767261600}]},
+        # no forecast for these ones
+        "Aurillac": {"lat": "44.93", "lon": "2.44"},
+        "Saint-Étienne": {"lat": "45.43", "lon": "4.39", "daily": None},
+    }
+
+    df = owm.openweather_data_json_to_dataframe(cities_coord)
+
+    assert df.columns.tolist() == ["dt", "sunrise", "sunset", "temp", "feels_like", "pressure", "humidity", "dew_point",
+                                   "clouds", "wind_speed", "wind_deg", "rain", "snow", "city", "lat", "lon",
+                                   "weather_main", "weather_desc"]
+    # the incomplete city is left out
+    assert df["city"].tolist() == ["Annecy", "Annecy", "Nyons"]
+    assert df["lat"].tolist() == ["45.89", "45.89", "44.36"]
+    assert df["rain"].tolist() == [1.5, 0.0, 0.0]
+    assert df["snow"].tolist() == [0.0, 0.0, 0.3]
+    assert str(df["dt"].dtype) == "datetime64[ns]"
+    assert df["pressure"].dtype == "int64"
+    # same local times as datetime.fromtimestamp
+    assert df["sunrise"].tolist() == [datetime.fromtimestamp(dt - 20000) for dt in (1767261600, 1767348000, 1767261600)]
+    assert df.to_csv(index=False).splitlines()[1].startswith(
+        f"{datetime.fromtimestamp(1767261600):%Y-%m-%d %H:%M:%S},")
+
+
+def test_json_to_dataframe_empty():
+    df = owm.openweather_data_json_to_dataframe({})
+    assert len(df) == 0
+    assert "dt" in df.columns
@@ -0,0 +1,37 @@
+import threading
+import time
+from unittest.mock import patch
+
+import ratelimit
+
+
+def test_rate_limiter_spaces_calls_across_threads():
+    limiter = ratelimit.RateLimiter(rate=50, burst=1)
+    calls = []
+
+    def call():
+        for _ in range(5):
+            limiter.acquire()
+            calls.append(time.monotonic())
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 20 calls at 50/s, the first one without waiting
+    assert len(calls) == 20
+    assert time.monotonic() - start >= 19 / 50 * 0.9
+
+
+def test_host_limiter_shared_per_host():
+    with patch.dict(ratelimit._limiters, clear=True):
+        first = ratelimit.host_limiter("https://example.org/a?x=1", rate=2)
+        assert ratelimit.host_limiter("https://example.org/b", rate=2) is first
+        assert ratelimit.host_limiter("https://example.com/a", rate=2) is not first
+
+        # another rate is not ignored: it applies to the shared limiter
+        assert ratelimit.host_limiter("https://example.org/b", rate=10) is first
+        assert first.rate == 10
@@ -0,0 +1,144 @@
+import csv
+import io
+
+import rte
+
+
+def test_rows_to_csv_quotes_values():
+    rows = [
+        ("2025-11-01", "00:00", 1.5, None),
+        ("2025-11-01", "00:30", "a,b", 'say "hi"'),
+    ]
+
+    block = rte.rows_to_csv(rows)
+
+    assert block.count("\n") == 2
+    assert list(csv.reader(io.StringIO(block))) == [
+        ["2025-11-01", "00:00", "1.5", ""],
+        ["2025-11-01", "00:30", "a,b", 'say "hi"'],
+    ]
+
+
+def test_en_cours_read_from_memory(tmp_path, monkeypatch):
+    import zipfile
+    from unittest.mock import patch, MagicMock
+
+    content = "Périmètre\tNature\tDate\tHeures\tConsommation\t\n" \
+              "ARA\tTR\t2020-01-01\t00:00\t7000\t\n" \
+              "RTE ne pourra être tenu responsable\n"
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_ref:
+        zip_ref.writestr("eCO2mix_RTE_Auvergne-Rhone-Alpes_En-cours-TR.xls", content.encode("ISO-8859-1"))
+    data = archive.getvalue()
+
+    response = MagicMock()
+    response.__enter__.return_value = response
+    response.iter_content.side_effect = lambda chunk_size: (data[i:i + chunk_size] for i in range(0, len(data), chunk_size))
+
+    monkeypatch.chdir(tmp_path)
+    with patch("requests.get", return_value=response):
+        df = rte.en_cours_rte_data()
+
+    assert df.columns.tolist() == ["Périmètre", "Nature", "Date", "Heures", "Consommation"]
+    assert df["Consommation"].tolist() == [7000.0]
+    # nothing extracted on disk
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_download_zip_spools_to_disk():
+    from unittest.mock import patch, MagicMock
+
+    data = bytes(range(256)) * 64
+    response = MagicMock()
+    response.__enter__.return_value = response
+    response.iter_content.side_effect = lambda chunk_size: (data[i:i + chunk_size] for i in range(0, len(data), chunk_size))
+
+    with patch("requests.get", return_value=response):
+        with rte.download_zip("https://example.org/a.zip", chunk_size=1024, spool_size=4096) as buffer:
+            # beyond spool_size the archive is in a file on disk, not in memory
+            assert buffer._rolled
+            assert buffer.read() == data
+
+
+def daily_archive(date_str):
+    import zipfile
+
+    content = "Périmètre\tNature\tDate\tHeures\tConsommation\t\n" \
+              f"France\tTR\t{date_str}\t00:00\t50000\t\n" \
+              f"France\tTR\t{date_str}\t00:15\t50100\t\n" \
+              f"France\tTR\t{date_str}\t00:30\t50200\t\n" \
+              "RTE ne pourra être tenu responsable\n"
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_ref:
+        zip_ref.writestr(f"eCO2mix_RTE_{date_str}.xls", content.encode("ISO-8859-1"))
+    archive.seek(0)
+    return archive
+
+
+def test_rte_daily_backfill_skips_stored_days(tmp_path):
+    from datetime import datetime
+    from unittest.mock import patch
+
+    url = str(tmp_path / "daily")
+    (tmp_path / "daily").mkdir()
+    (tmp_path / "daily" / "eCO2mix_RTE_2025-03-02.csv").write_text("stored")
+
+    def download(download_url):
+        day = datetime.strptime(download_url.split("date=")[1], "%d/%m/%Y")
+        if day.day == 4:
+            raise ConnectionError("eco2mix unavailable")
+        return daily_archive(day.strftime("%Y-%m-%d"))
+
+    with patch.object(rte, "download_zip", side_effect=download) as download_zip:
+        result = rte.rte_daily_backfill("01/03/2025", "04/03/2025", excel=False, workers=3,
+                                        url=url, raw_url=str(tmp_path / "raw"))
+
+    assert download_zip.call_count == 3
+    assert result["downloaded"] == {"2025-03-01": 2, "2025-03-03": 2}
+    assert result["skipped"] == ["2025-03-02"]
+    assert list(result["failed"]) == ["2025-03-04"]
+    # stored day untouched, no Excel written
+    assert (tmp_path / "daily" / "eCO2mix_RTE_2025-03-02.csv").read_text() == "stored"
+    assert not (tmp_path / "raw").exists()
+    assert rte.stored_daily_dates(url) == {"2025-03-01", "2025-03-02", "2025-03-03"}
+
+
+def test_rte_daily_backfill_rejects_reversed_range():
+    import pytest
+
+    with pytest.raises(ValueError):
+        rte.rte_daily_backfill("05/03/2025", "01/03/2025")
+
+
+def test_daily_load_only_handles_the_new_rows():
+    from unittest.mock import patch, MagicMock
+    import pandas as pd
+
+    new_rows = pd.DataFrame({"Date": ["2025-11-01"] * 3, "Heures": ["00:00", "00:15", "00:30"],
+                             "TCH Solaire (%)": ["1", "ND", "2"]})
+
+    with patch("rte_dataset.stored_years", return_value=[2021, 2022, 2023, 2024]), \
+         patch("rte_history.get_definitive_data") as mock_definitive, \
+         patch("rte_dataset.write_partitions", return_value=["year=2025/month=11"]) as mock_write, \
+         patch("clients.s3_client", return_value=MagicMock()), \
+         patch("freshness.manifest.record") as mock_record, \
+         patch.object(rte, "EXPORT_CSV", False):
+        # the definitive years are already in the dataset
+        assert rte.get_missing_previous_rte_data() == []
+        mock_definitive.assert_not_called()
+
+        assert rte.save_rte_data(new_rows) == ["year=2025/month=11"]
+
+    written = mock_write.call_args.args[0]
+    assert written["Heures"].tolist() == ["00:00", "00:30"]
+    assert written["TCH Solaire (%)"].tolist() == [1.0, 2.0]
+    assert mock_record.call_args.args[1] is written
+
+
+def test_missing_definitive_years_are_read():
+    from unittest.mock import patch
+
+    with patch("rte_dataset.stored_years", return_value=[2023, 2024]), \
+         patch("rte_history.get_definitive_data", return_value=["2021", "2022"]) as mock_definitive:
+        assert rte.get_missing_previous_rte_data() == ["2021", "2022"]
+    mock_definitive.assert_called_once_with([2021, 2022])
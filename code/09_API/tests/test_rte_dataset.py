@@ -0,0 +1,57 @@
+import os
+
+import pandas as pd
+
+import rte_dataset
+
+
+def rte_rows(start, end, value=1.0):
+    dates = pd.date_range(start, end, freq="30min")
+    return pd.DataFrame({
+        "Date": dates.strftime("%Y-%m-%d"),
+        "Heures": dates.strftime("%H:%M"),
+        "Consommation": value,
+        "TCH Solaire (%)": 10.0,
+    })
+
+
+def test_only_changed_partitions_are_rewritten(tmp_path):
+    url = str(tmp_path / "rte")
+    df = rte_rows("2023-11-01", "2024-02-29 23:30")
+    assert not rte_dataset.dataset_exists(url)
+
+    written = rte_dataset.write_partitions(df, url)
+    assert written == ["year=2023/month=11", "year=2023/month=12", "year=2024/month=01", "year=2024/month=02"]
+
+    assert rte_dataset.dataset_exists(url)
+
+    # same data: nothing to write
+    assert rte_dataset.write_partitions(df, url) == []
+
+    # one new day at the end only touches its month
+    df = pd.concat([df, rte_rows("2024-03-01", "2024-03-01 23:30")], ignore_index=True)
+    assert rte_dataset.write_partitions(df, url) == ["year=2024/month=03"]
+
+    # a corrected value rewrites only its partition
+    df.loc[0, "Consommation"] = 2.0
+    assert rte_dataset.write_partitions(df, url) == ["year=2023/month=11"]
+    assert not [f for f in os.listdir(tmp_path / "rte" / "year=2023" / "month=11") if f != "part-0.parquet"]
+
+
+def test_read_prunes_partitions_and_columns(tmp_path):
+    url = str(tmp_path / "rte")
+    rte_dataset.write_partitions(rte_rows("2022-12-31", "2024-01-01 23:30"), url)
+
+    df = rte_dataset.read_dataset(url, columns=["Date", "Heures", "tch_solaire_(%)"], years=(2023, 2023))
+
+    assert df.columns.tolist() == ["Date", "Heures", "TCH Solaire (%)"]
+    assert len(df) == 365 * 48
+    assert df["Date"].min() == "2023-01-01" and df["Date"].max() == "2023-12-31"
+
+
+def test_stored_years(tmp_path):
+    url = str(tmp_path / "rte")
+    assert rte_dataset.stored_years(url) == []
+
+    rte_dataset.write_partitions(rte_rows("2022-12-31", "2024-01-01 23:30"), url)
+    assert rte_dataset.stored_years(url) == [2022, 2023, 2024]
@@ -0,0 +1,132 @@
+import os
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+
+import db
+import rte
+import rte_db
+
+# Query-plan checks need a PostgreSQL database, e.g.
+# TEST_DATABASE_URL=postgresql://postgres@localhost/test python -m pytest tests/test_rte_db.py
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+requires_postgres = pytest.mark.skipif(TEST_DATABASE_URL is None, reason="TEST_DATABASE_URL not set")
+
+
+def test_query_filter_is_sargable():
+    columns = ["Date", "Heures", "Nucleaire", "Datetime"]
+    sql = rte_db.build_rte_query("rte_national", columns, ["Date", "Heures", "Nucleaire"])
+
+    assert '"Datetime" >= :start AND "Datetime" < :end' in sql
+    assert "EXTRACT" not in sql and "TO_DATE" not in sql
+
+    # table not migrated yet: range on the ISO date text
+    sql = rte_db.build_rte_query("rte_national", columns[:3], ["Date", "Heures", "Nucleaire"])
+    assert '"Date" >= :start_date AND "Date" < :end_date' in sql
+
+    params = rte_db.query_params(2020, 2021)
+    assert (params["start_date"], params["end_date"]) == ("2020-01-01", "2022-01-01")
+
+    with pytest.raises(ValueError):
+        rte_db.build_rte_query("users; --", columns, ["Date"])
+
+
+@pytest.fixture
+def pg_engine():
+    engine = create_engine(TEST_DATABASE_URL)
+
+    dates = pd.date_range("2015-01-01", "2025-12-31 23:30", freq="30min")
+    df = pd.DataFrame({
+        "Date": dates.strftime("%Y-%m-%d"),
+        "Heures": dates.strftime("%H:%M"),
+        "Nucleaire": range(len(dates)),
+    })
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS public.rte_national"))
+        df.to_sql("rte_national", conn, schema="public", index=False, chunksize=20_000)
+        rte_db.migrate(conn, "rte_national")
+
+    rte_db.clear_columns_cache()
+    yield engine
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS public.rte_national"))
+    rte_db.clear_columns_cache()
+    engine.dispose()
+
+
+@requires_postgres
+def test_year_filter_uses_index(pg_engine):
+    with pg_engine.connect() as conn:
+        columns = rte_db.table_columns(conn, "rte_national")
+        assert "Datetime" in columns
+
+        sql = rte_db.build_rte_query("rte_national", columns, ["Date", "Heures", "Nucleaire"])
+        plan = conn.execute(text("EXPLAIN " + sql), rte_db.query_params(2024, 2024)).fetchall()
+        plan = "\n".join(row[0] for row in plan)
+
+        assert "rte_national_datetime_idx" in plan, plan
+        assert "Seq Scan" not in plan, plan
+
+
+@requires_postgres
+def test_rte_csv_chunks_reads_one_year(pg_engine):
+    with patch.object(db, "get_engine", return_value=pg_engine):
+        csv_data = "".join(rte.rte_csv_chunks(2024, 2024, "rte_national", chunk_rows=5_000))
+
+    df = pd.read_csv(pd.io.common.StringIO(csv_data))
+    assert df.columns.tolist() == ["Date", "Heures", "Nucleaire"]
+    assert len(df) == 366 * 48
+    assert df["Date"].iloc[0] == "2024-01-01" and df["Date"].iloc[-1] == "2024-12-31"
+
+
+def test_resampled_query():
+    columns = ["Date", "Heures", "Nucleaire", "Gaz", "Datetime"]
+    assert rte_db.select_columns(columns, ["Gaz"]) == ["Date", "Heures", "Gaz"]
+    assert rte_db.select_columns(columns) == ["Date", "Heures", "Nucleaire", "Gaz"]
+
+    sql = rte_db.build_rte_query("rte_national", columns, ["Date", "Heures", "Gaz"], "day", "sum")
+    assert 'SUM("Gaz") AS "Gaz"' in sql
+    assert "GROUP BY date_trunc('day', \"Datetime\")" in sql
+    assert '"Datetime" >= :start AND "Datetime" < :end' in sql
+
+    # rate columns of the regional table, asked with their eCO2mix name
+    columns = ["Date", "Heures", "Solaire", "TCO_Solaire____", "TCH_Solaire____", "Datetime"]
+    assert rte_db.select_columns(columns) == ["Date", "Heures", "Solaire"]
+    assert rte_db.select_columns(columns, ["TCH Solaire (%)", "Solaire"]) == ["Date", "Heures", "Solaire", "TCH_Solaire____"]
+    rte_db.check_query_options(["TCH Solaire (%)", "Nucléaire"], "hour")
+
+    for options in ({"columns": ["Date; --"]}, {"granularity": "week"}, {"agg": "median"}):
+        with pytest.raises(ValueError):
+            rte_db.check_query_options(**options)
+
+
+@requires_postgres
+def test_rte_csv_chunks_daily_sum(pg_engine):
+    with patch.object(db, "get_engine", return_value=pg_engine):
+        csv_data = "".join(rte.rte_csv_chunks(2024, 2024, "rte_national", columns=["Nucleaire"],
+                                              granularity="day", agg="sum"))
+
+    df = pd.read_csv(pd.io.common.StringIO(csv_data))
+    assert len(df) == 366
+    first = len(pd.date_range("2015-01-01", "2023-12-31 23:30", freq="30min"))
+    assert df.iloc[0].tolist() == ["2024-01-01", "00:00", sum(range(first, first + 48))]
+
+
+@requires_postgres
+def test_rows_inserted_after_migration_are_read(pg_engine):
+    new_rows = pd.DataFrame({"Date": ["2026-01-01", "2026-01-01"], "Heures": ["00:00", "00:30"], "Nucleaire": [1, 2]})
+    with pg_engine.begin() as conn:
+        # migrating again keeps a single trigger
+        rte_db.migrate(conn, "rte_national")
+    with pg_engine.begin() as conn:
+        new_rows.to_sql("rte_national", conn, schema="public", index=False, if_exists="append")
+
+    with patch.object(db, "get_engine", return_value=pg_engine):
+        csv_data = "".join(rte.rte_csv_chunks(2026, 2026, "rte_national"))
+
+    df = pd.read_csv(pd.io.common.StringIO(csv_data))
+    assert df.values.tolist() == [["2026-01-01", "00:00", 1], ["2026-01-01", "00:30", 2]]
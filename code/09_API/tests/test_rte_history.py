@@ -0,0 +1,67 @@
+import os
+from unittest.mock import patch, MagicMock
+
+import pandas as pd
+
+import rte_history
+from rte_history import DefinitiveCache
+
+
+def fake_head(etags):
+    """Helper returning a requests.head replacement answering the ETag of each year"""
+    def head(url, timeout=None):
+        year = int(url.rsplit("_", 1)[1].split(".")[0])
+        response = MagicMock()
+        response.headers = {"ETag": f'"{etags[year]}"'}
+        return response
+    return head
+
+
+def fake_parse(url, year):
+    return pd.DataFrame({"Date": [f"{year}-01-01"], "Heures": ["00:00"], "Consommation": [float(year)]})
+
+
+def test_definitive_years_are_parsed_once(tmp_path):
+    etags = {2021: "a1", 2022: "b1"}
+    cache = DefinitiveCache(str(tmp_path), workers=2)
+
+    with patch("requests.head", side_effect=fake_head(etags)), \
+        patch.object(rte_history, "parse_definitive", side_effect=fake_parse) as mock_parse:
+
+        dfs = cache.get([2021, 2022])
+        assert [df["Consommation"].iloc[0] for df in dfs] == [2021.0, 2022.0]
+        assert mock_parse.call_count == 2
+
+        # other worker or next day: read from the Parquet cache
+        dfs = DefinitiveCache(str(tmp_path)).get([2021, 2022])
+        assert [df["Date"].iloc[0] for df in dfs] == ["2021-01-01", "2022-01-01"]
+        assert mock_parse.call_count == 2
+
+        # a republished file is parsed again and replaces the old copy
+        etags[2022] = "b2"
+        cache.get([2021, 2022])
+        assert mock_parse.call_count == 3
+        assert sorted(os.listdir(tmp_path)) == ["annuel_definitif_2021_a1.parquet", "annuel_definitif_2022_b2.parquet"]
+
+
+def test_cached_copy_used_when_source_unreachable(tmp_path):
+    cache = DefinitiveCache(str(tmp_path))
+
+    with patch("requests.head", side_effect=fake_head({2023: "c1"})), \
+        patch.object(rte_history, "parse_definitive", side_effect=fake_parse):
+        cache.get([2023])
+
+    import requests
+    with patch("requests.head", side_effect=requests.exceptions.ConnectionError), \
+        patch.object(rte_history, "parse_definitive") as mock_parse:
+        df, = cache.get([2023])
+
+    assert df["Consommation"].iloc[0] == 2023.0
+    mock_parse.assert_not_called()
+
+
+def test_to_float_columns():
+    df = pd.DataFrame({"Date": ["2024-01-01"], "Heures": ["00:00"], "Solaire": ["12"], "Flux": ["-"]})
+    df = rte_history.to_float_columns(df)
+    assert df["Solaire"].iloc[0] == 12.0 and pd.isna(df["Flux"].iloc[0])
+    assert df["Date"].iloc[0] == "2024-01-01"
@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+
+import solar
+
+# Synthetic file: written by hand in the daypre.txt layout, not downloaded from NOAA
+# (bench_solar_parse.py --download adds real files to the corpus)
+DAYPRE = "benchmarks/data/daypre/synthetic-20251101daypre.txt"
+
+
+def test_solar_predi_parse():
+    with open(DAYPRE) as f:
+        df = solar.solar_predi_parse(f.read())
+
+    assert df.columns.tolist() == ["Ap", "date", "K index Planetary", "Prob_Mid", "Prob_High", "10cm", "Whole_Disk_Flare_Prob"]
+    assert df.index.tolist() == list(pd.to_datetime(["2025-11-02", "2025-11-03", "2025-11-04"]))
+    assert (df.dtypes.drop("date") == "float64").all()
+    # Ap: A_Planetary row only, the other sections: mean of their rows
+    assert df["Ap"].tolist() == [19.0, 25.0, 26.0]
+    assert df["10cm"].tolist() == [187.0, 166.0, 138.0]
+    assert df["Whole_Disk_Flare_Prob"].iloc[0] == 16.0
+
+
+def test_solar_predi_parse_missing_values():
+    text = ":Prediction_dates:  2025 Nov 02  2025 Nov 03  2025 Nov 04\n" \
+           ":Pred_Mid_k:\n" \
+           "0000-0300   2   ?   4\n" \
+           "0300-0600   4   3   ?\n"
+
+    df = solar.solar_predi_parse(text)
+
+    assert df["K index Planetary"].tolist() == [3.0, 3.0, 4.0]
+    with pytest.raises(ValueError):
+        solar.solar_predi_parse("")
@@ -78,6 +78,30 @@ echo "--> SETUP COMPLETE"
 touch /tmp/airflow_ready
 """
 
+# Same helper in 04_Dashboarding/app.py: both are deployed on their own, the copies are kept
+# identical on purpose (checked by 09_API/tests/test_job_clients.py)
+def wait_for_job(url, job, timeout=1800, interval=5):
+    """
+    Poll the status of a job returned by a /load_* endpoint until it is done
+    """
+    status_url = requests.compat.urljoin(url, job["status_url"])
+    deadline = time.monotonic() + timeout
+
+    while job["status"] not in ("succeeded", "failed"):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Job {job['job_id']} not done after {timeout} seconds")
+        time.sleep(interval)
+
+        response = requests.get(status_url, timeout=30)
+        response.raise_for_status()
+        job = response.json()
+        logging.info(f"Job {job['job_id']}: {job['status']} {job['progress']:.0%} {job['message']}")
+
+    if job["status"] == "failed":
+        raise RuntimeError(f"Job {job['job_id']} failed: {job['error']}")
+
+    return job
+
 def load_api_data(url, data_type):
     logging.info(f"LOAD {data_type}")
 
@@ -87,7 +111,7 @@ def load_api_data(url, data_type):
     for _ in range(max_retries):
 
         try:
-            response = requests.get(url)
+            response = requests.get(url, timeout=30)
             response.raise_for_status()
 
             logging.info(response.content)
@@ -104,6 +128,12 @@ def load_api_data(url, data_type):
 
     else:
         logging.error("Failure after {max_retries} retries")
+        return
+
+    # the load runs in the background, the endpoint returns its job
+    job = wait_for_job(url, response.json())
+    logging.info(f"{data_type}: {job['rows']} rows in {job['duration_s']} s")
+    return job
 
 DAG_ID = 'Prediction_data_update'
 default_args = {